@@ -76,6 +76,10 @@ class GeneSearchForm(forms.Form):
 
     file_field = forms.FileField(required=False)
 
+    export_format = forms.ChoiceField(
+        required=False, label='Download as',
+        choices=[('', 'Table on this page'), ('csv', 'CSV'), ('tsv', 'TSV')])
+
 class BlastForm(forms.Form):
 
     # sequence_query = forms.CharField(widget=forms.Textarea, required=False, help_text='Sequence in FASTA format.')
@@ -0,0 +1,294 @@
+"""
+Index of the genome annotation GFF, for region overlap queries.
+
+The sorted GFF is parsed once (by the build_annotation_index command)
+into flat numpy arrays: feature starts and ends sorted by start within
+each chromosome, the GFF source and method as small integer codes, and
+the feature attributes as one byte array with offsets. The arrays are
+saved as .npy files in a directory next to the GFF.
+
+Web processes memory-map the saved arrays rather than reading them
+into Python objects, so the operating system keeps a single copy of
+the index for all processes, and only rows that overlap a query are
+turned into Python strings. The index is reloaded if it is rebuilt,
+e.g. for a new WormBase version. If the index has not been built,
+regions are looked up with tabix instead, one subprocess per region.
+
+Features are returned with the GFF columns shown on the BLAST page:
+source, method, start, end, and features.
+"""
+
+import gzip
+import json
+import os
+import shutil
+from subprocess import Popen, PIPE
+import threading
+
+import numpy as np
+from django.conf import settings
+
+GFF_FILENAME = 'c_elegans.PRJNA13758.WS260.annotations.sorted.gff2.gz'
+
+# Saved as <name>.npy in the index directory. Positions fit in 32 bits,
+# since no C. elegans chromosome is longer than about 21 Mb
+_ARRAYS = ('starts', 'ends', 'max_ends', 'sources', 'methods',
+           'attribute_offsets', 'attributes')
+
+# Saved last, so its presence and mtime mark a complete index
+_META_FILENAME = 'meta.json'
+
+_index = None
+_index_mtime = None
+_index_lock = threading.Lock()
+
+
+def get_gff_path():
+    return os.path.join(settings.TABIX_DB_DIR, GFF_FILENAME)
+
+
+def get_index_path():
+    return get_gff_path() + '.index'
+
+
+class AnnotationIndex(object):
+    """
+    Features of a GFF file, indexed by chromosome and position.
+
+    Positions are 1-based and inclusive, as in GFF and tabix regions.
+    """
+
+    def __init__(self, arrays, chromosomes, sources, methods, source=''):
+        # The features of chromosome name are rows lo to hi - 1 of the
+        # arrays, where chromosomes[name] = (lo, hi). Within that range,
+        # rows are sorted by start, and max_ends[i] = max(ends[lo:i + 1])
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+
+        self.chromosomes = chromosomes
+
+        # Values of the source and method codes
+        self.source_names = sources
+        self.method_names = methods
+
+        self.source = source
+
+    @classmethod
+    def from_gff(cls, path):
+        """Build an index from a GFF file, gzipped if it ends in .gz."""
+        features = {}
+        source_codes = {}
+        method_codes = {}
+
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as f:
+            for line in f:
+                if not line.strip() or line.startswith('#'):
+                    continue
+
+                columns = line.rstrip('\n').split('\t')
+                if len(columns) < 9:
+                    continue
+
+                features.setdefault(columns[0], []).append((
+                    int(columns[3]), int(columns[4]),
+                    source_codes.setdefault(columns[1], len(source_codes)),
+                    method_codes.setdefault(columns[2], len(method_codes)),
+                    columns[8]))
+
+        if max(len(source_codes), len(method_codes)) > 2 ** 16:
+            raise ValueError('Too many distinct GFF sources or methods')
+
+        chromosomes = {}
+        parts = {name: [] for name in _ARRAYS}
+        num_features = 0
+        num_bytes = 0
+
+        for name in sorted(features):
+            # Stable, so features at the same start keep the file order
+            chromosome_features = sorted(features.pop(name),
+                                         key=lambda x: x[0])
+            num = len(chromosome_features)
+            chromosomes[name] = (num_features, num_features + num)
+            num_features += num
+
+            starts, ends, sources, methods, attributes = zip(
+                *chromosome_features)
+            ends = np.array(ends, dtype=np.int32)
+
+            parts['starts'].append(np.array(starts, dtype=np.int32))
+            parts['ends'].append(ends)
+            parts['max_ends'].append(np.maximum.accumulate(ends))
+            parts['sources'].append(np.array(sources, dtype=np.uint16))
+            parts['methods'].append(np.array(methods, dtype=np.uint16))
+
+            lengths = np.array([len(x) for x in attributes], dtype=np.int64)
+            parts['attribute_offsets'].append(num_bytes + np.cumsum(lengths))
+            parts['attributes'].append(
+                np.frombuffer(''.join(attributes), dtype=np.uint8))
+            num_bytes += int(lengths.sum())
+
+        parts['attribute_offsets'].insert(0, np.zeros(1, dtype=np.int64))
+
+        arrays = {}
+        for name, dtype in zip(_ARRAYS, (np.int32, np.int32, np.int32,
+                                         np.uint16, np.uint16, np.int64,
+                                         np.uint8)):
+            arrays[name] = (np.concatenate(parts[name]) if parts[name]
+                            else np.zeros(0, dtype=dtype))
+
+        return cls(arrays, chromosomes,
+                   sorted(source_codes, key=source_codes.get),
+                   sorted(method_codes, key=method_codes.get),
+                   source=path)
+
+    @classmethod
+    def load(cls, path):
+        """Load the index saved in directory path, memory-mapped."""
+        with open(os.path.join(path, _META_FILENAME)) as f:
+            meta = json.load(f)
+
+        arrays = {name: np.load(os.path.join(path, name + '.npy'),
+                                mmap_mode='r')
+                  for name in _ARRAYS}
+
+        return cls(arrays,
+                   {str(name): tuple(bounds)
+                    for name, bounds in meta['chromosomes'].iteritems()},
+                   [str(x) for x in meta['sources']],
+                   [str(x) for x in meta['methods']],
+                   source=meta['source'])
+
+    def save(self, path):
+        """
+        Save the index to directory path, replacing any existing index.
+
+        Processes that have the old index loaded keep using it until
+        they notice the new one.
+        """
+        temporary = path + '.tmp'
+        _remove(temporary)
+        os.makedirs(temporary)
+
+        for name in _ARRAYS:
+            np.save(os.path.join(temporary, name + '.npy'),
+                    getattr(self, name))
+
+        with open(os.path.join(temporary, _META_FILENAME), 'w') as f:
+            json.dump({'chromosomes': self.chromosomes,
+                       'sources': self.source_names,
+                       'methods': self.method_names,
+                       'source': self.source}, f)
+
+        old = path + '.old'
+        _remove(old)
+        if os.path.lexists(path):
+            os.rename(path, old)
+        os.rename(temporary, path)
+        _remove(old)
+
+    def get_num_features(self):
+        return len(self.starts)
+
+    def get_overlapping(self, chromosome, start, end):
+        """Get the rows of features overlapping chromosome:start-end."""
+        if chromosome not in self.chromosomes:
+            return []
+
+        lo, hi = self.chromosomes[chromosome]
+
+        # Features before first all end before start; features from
+        # last on all start after end
+        first = lo + np.searchsorted(self.max_ends[lo:hi], start,
+                                     side='left')
+        last = lo + np.searchsorted(self.starts[lo:hi], end, side='right')
+
+        if first >= last:
+            return []
+
+        matches = np.nonzero(self.ends[first:last] >= start)[0] + first
+        return [self._get_row(i) for i in matches]
+
+    def get_overlapping_batch(self, regions):
+        """
+        Get the overlapping features for each of regions.
+
+        regions is an iterable of (chromosome, start, end). Returns a
+        list with the rows for each region, in order.
+        """
+        return [self.get_overlapping(*region) for region in regions]
+
+    def _get_row(self, i):
+        attributes = self.attributes[self.attribute_offsets[i]:
+                                     self.attribute_offsets[i + 1]]
+        return (self.source_names[self.sources[i]],
+                self.method_names[self.methods[i]],
+                str(self.starts[i]), str(self.ends[i]),
+                attributes.tostring())
+
+
+def get_index():
+    """
+    Get the annotation index, loading it if needed.
+
+    The index is shared by the whole process, and reloaded if the index
+    has been rebuilt. Returns None if the index has not been built.
+    """
+    global _index, _index_mtime
+
+    path = get_index_path()
+
+    try:
+        mtime = os.path.getmtime(os.path.join(path, _META_FILENAME))
+    except OSError:
+        return None
+
+    with _index_lock:
+        if _index is None or _index_mtime != mtime:
+            _index = AnnotationIndex.load(path)
+            _index_mtime = mtime
+
+        return _index
+
+
+def get_overlapping_batch(regions):
+    """
+    Get the GFF features overlapping each of regions.
+
+    Uses the annotation index if it has been built, and tabix on the
+    GFF otherwise. See AnnotationIndex.get_overlapping_batch.
+    """
+    index = get_index()
+
+    if index is None:
+        return [get_overlapping_with_tabix(*region) for region in regions]
+
+    return index.get_overlapping_batch(regions)
+
+
+def get_overlapping_with_tabix(chromosome, start, end):
+    """Like AnnotationIndex.get_overlapping, but with a tabix process."""
+    region = '{}:{}-{}'.format(chromosome, start, end)
+
+    tabix_out, tabix_err = Popen(
+        [settings.TABIX, get_gff_path(), region],
+        stdout=PIPE,
+        stderr=PIPE
+    ).communicate()
+
+    rows = []
+
+    for line in tabix_out.rstrip().split('\n'):
+        if line:
+            columns = line.split('\t')
+            rows.append((columns[1], columns[2], columns[3], columns[4],
+                         columns[8]))
+
+    return rows
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
@@ -0,0 +1,203 @@
+"""
+Functions to run BLAST searches in the background.
+
+Each search is a BlastJob with its own work directory. Jobs are run by a
+pool of worker threads in the web process, at most BLAST_MAX_JOBS at a
+time. Within a job, a multi-sequence FASTA is split into up to
+BLAST_CHUNKS_PER_JOB chunks, which are searched by simultaneous BLAST
+processes. Jobs are lost if the web process restarts; BlastJob marks
+them failed once they are older than BLAST_JOB_MAX_SECONDS.
+
+BLAST searches the WS260 version of the C. elegans genome, and hits are
+annotated with the features they overlap in the WS260 GFF annotation,
+using the annotation index (or tabix, if the index has not been built).
+"""
+
+import hashlib
+from multiprocessing.pool import ThreadPool
+import json
+import os
+import shutil
+from subprocess import Popen, PIPE
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from clones.helpers.annotations import get_overlapping_batch
+from clones.models import BlastJob
+
+BLAST_DB = 'c_elegans.PRJNA13758.WS260.genomic.fa'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def submit_blast_job(query, user=None):
+    """
+    Submit a BLAST search of FASTA text query.
+
+    If an identical query has already been searched, or is being
+    searched, that job is returned instead of starting a new one.
+    """
+    query_hash = hashlib.sha1(query).hexdigest()
+
+    cached = BlastJob.get_cached(query_hash)
+    if cached:
+        return cached
+
+    job = BlastJob.objects.create(user=user, query_hash=query_hash)
+
+    work_dir = job.get_work_dir()
+    os.makedirs(work_dir)
+    with open(os.path.join(work_dir, 'query.fa'), 'w') as f:
+        f.write(query)
+
+    _get_pool().apply_async(_run_in_worker, (job.pk,))
+
+    return job
+
+
+def _get_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(settings.BLAST_MAX_JOBS)
+
+    return _pool
+
+
+def _run_in_worker(job_id):
+    try:
+        run_blast_job(job_id)
+    finally:
+        # Worker threads each get their own connection
+        connection.close()
+
+
+def run_blast_job(job_id):
+    """
+    Run a queued BlastJob, recording its results or error.
+
+    The job's work directory is removed when done.
+    """
+    job = BlastJob.objects.get(pk=job_id)
+    work_dir = job.get_work_dir()
+
+    # E.g. marked failed for having waited too long
+    if job.status != BlastJob.QUEUED:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return
+
+    job.status = BlastJob.RUNNING
+    job.save()
+
+    try:
+        hits = run_blast(work_dir)
+        job.results = json.dumps(annotate_hits(hits))
+        job.status = BlastJob.DONE
+    except Exception as e:
+        job.error = str(e)
+        job.status = BlastJob.FAILED
+
+    job.finished = timezone.now()
+    job.save()
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_blast(work_dir):
+    """
+    BLAST the query.fa in work_dir against the genome.
+
+    Returns a list of hits, each a list of the BLAST tabular output
+    fields. Raises RuntimeError if BLAST fails.
+    """
+    with open(os.path.join(work_dir, 'query.fa'), 'r') as f:
+        chunks = split_fasta(f.read(), settings.BLAST_CHUNKS_PER_JOB)
+
+    num_threads = max(1, settings.BLAST_CHUNKS_PER_JOB // max(1, len(chunks)))
+    processes = []
+
+    for i, chunk in enumerate(chunks):
+        query_path = os.path.join(work_dir, 'chunk{}.fa'.format(i))
+        out_path = os.path.join(work_dir, 'chunk{}.tsv'.format(i))
+
+        with open(query_path, 'w') as f:
+            f.write(chunk)
+
+        process = Popen([
+            settings.BLAST,
+            '-query', query_path,
+            '-db', os.path.join(settings.BLAST_DB_DIR, BLAST_DB),
+            '-out', out_path,
+            '-outfmt', '6',
+            '-max_target_seqs', '1',
+            '-culling_limit', '1',
+            '-num_threads', str(num_threads),
+            '-evalue', '0.00005'],
+            stdout=PIPE,
+            stderr=PIPE,
+        )
+        processes.append((process, out_path))
+
+    hits = []
+
+    for process, out_path in processes:
+        out, err = process.communicate()
+        if process.returncode:
+            raise RuntimeError('BLAST failed: {}'.format(err.strip()))
+
+        with open(out_path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    hits.append(line.rstrip('\n').split('\t'))
+
+    return hits
+
+
+def split_fasta(text, num_chunks):
+    """
+    Split FASTA text into at most num_chunks chunks of whole sequences.
+
+    Sequences are dealt out in turn, so chunks are of similar size.
+    """
+    records = ['>' + record for record in text.split('>') if record.strip()]
+
+    if not records:
+        return []
+
+    num_chunks = min(num_chunks, len(records))
+    return [''.join(records[i::num_chunks]) for i in range(num_chunks)]
+
+
+def annotate_hits(hits):
+    """
+    Get the GFF features overlapping each BLAST hit.
+
+    Returns a list with one row per (hit, feature): query name, subject
+    name, source, method, start, end, and features.
+    """
+    regions = []
+    for hit in hits:
+        start, end = sorted((int(hit[8]), int(hit[9])))
+        regions.append((hit[1], start, end))
+
+    overlapping = get_overlapping_batch(regions)
+    rows = []
+
+    for hit, features in zip(hits, overlapping):
+        for source, method, start, end, attributes in features:
+            rows.append([
+                hit[0],   # query name
+                hit[1],   # subject name
+                source,   # source i.e. blastx, gene
+                method,   # method, i.e. cds
+                start,    # start position
+                end,      # stop position
+                attributes.replace("'", "")  # features
+            ])
+
+    return rows
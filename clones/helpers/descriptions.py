@@ -0,0 +1,130 @@
+"""
+Functions to build the gene descriptions table.
+
+The genes, clone targets and library stocks matching a query are each
+fetched in one query, and joined in memory, so the cost does not grow
+with the number of genes queried.
+"""
+
+import csv
+
+from clones.models import CloneTarget, Gene
+from library.models import LibraryStock
+
+# Columns of the descriptions table, one row per gene and clone target
+COLUMNS = ('gene', 'cosmid', 'locus', 'gene_type', 'gene_class_description',
+           'functional_description', 'clone', 'transcript_isoform', 'stock')
+
+# Delimiter for each download format
+EXPORT_DELIMITERS = {
+    'csv': ',',
+    'tsv': '\t',
+}
+
+
+def get_descriptions(choice_field, query):
+    """
+    Get the genes matching query, with their clone targets and stocks.
+
+    choice_field is one of the GeneSearchForm search choices, saying
+    what kind of ids are in query.
+
+    Returns a list of (gene, targets) tuples, where targets is a list
+    of (clone_id, transcript_isoform, stock_ids) tuples, one per clone
+    target of the gene that matches query.
+    """
+    if choice_field == 'wb_gene_id':
+        genes = Gene.objects.filter(id__in=query)
+        clone_targets = CloneTarget.objects.filter(gene__in=genes.values('id'))
+        stocks = LibraryStock.objects.filter(
+            intended_clone__in=clone_targets.values('clone'))
+
+    elif choice_field == 'locus':
+        genes = Gene.objects.filter(locus__in=query)
+        clone_targets = CloneTarget.objects.filter(gene__in=genes.values('id'))
+        stocks = LibraryStock.objects.filter(
+            intended_clone__in=clone_targets.values('clone'))
+
+    elif choice_field == 'clone_id':
+        clone_targets = CloneTarget.objects.filter(clone__in=query)
+        genes = Gene.objects.filter(id__in=clone_targets.values('gene'))
+        stocks = LibraryStock.objects.filter(
+            intended_clone__in=clone_targets.values('clone'))
+
+    elif choice_field == 'cosmid_id':
+        genes = Gene.objects.filter(cosmid_id__in=query)
+        clone_targets = CloneTarget.objects.filter(gene__in=genes.values('id'))
+        stocks = LibraryStock.objects.filter(
+            intended_clone__in=clone_targets.values('clone'))
+
+    else:
+        stocks = LibraryStock.objects.filter(id__in=query)
+        clone_targets = CloneTarget.objects.filter(
+            clone__in=stocks.values('intended_clone'))
+        genes = Gene.objects.filter(id__in=clone_targets.values('gene'))
+
+    stocks_by_clone = {}
+    for stock_id, clone_id in stocks.values_list('id', 'intended_clone'):
+        stocks_by_clone.setdefault(clone_id, []).append(stock_id)
+
+    targets_by_gene = {}
+    clone_targets = clone_targets.order_by('id').values_list(
+        'gene', 'clone', 'transcript_isoform')
+
+    for gene_id, clone_id, transcript_isoform in clone_targets:
+        targets_by_gene.setdefault(gene_id, []).append(
+            (clone_id, transcript_isoform, stocks_by_clone.get(clone_id, [])))
+
+    return [(gene, targets_by_gene.get(gene.id, [])) for gene in genes]
+
+
+def get_description_rows(descriptions):
+    """
+    Get the rows of the descriptions table, as in COLUMNS.
+
+    descriptions is as returned by get_descriptions. Each gene gets one
+    row per clone target, or a single row if it has no clone targets.
+    """
+    for gene, targets in descriptions:
+        gene_columns = [gene.id, gene.cosmid_id, gene.locus, gene.gene_type,
+                        gene.gene_class_description,
+                        gene.functional_description]
+
+        if not targets:
+            yield gene_columns + ['', '', '']
+
+        for clone_id, transcript_isoform, stock_ids in targets:
+            yield gene_columns + [clone_id, transcript_isoform,
+                                  ','.join(stock_ids)]
+
+
+def stream_delimited(rows, delimiter=','):
+    """
+    Write rows as delimited text, yielding one line at a time.
+
+    Includes a header row of COLUMNS. Suitable for a
+    StreamingHttpResponse.
+    """
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer, delimiter=delimiter)
+
+    writer.writerow(COLUMNS)
+    yield buffer.pop()
+
+    for row in rows:
+        writer.writerow([unicode(x).encode('utf-8') for x in row])
+        yield buffer.pop()
+
+
+class _LineBuffer(object):
+    """File-like object that holds what was last written to it."""
+
+    def __init__(self):
+        self.value = ''
+
+    def write(self, value):
+        self.value += value
+
+    def pop(self):
+        value, self.value = self.value, ''
+        return value
@@ -0,0 +1,160 @@
+"""
+Process-wide cache of genes, for displaying gene descriptions.
+
+Tables such as the secondary scores page show the descriptions of
+hundreds of genes. warm_gene_cache loads the genes of a whole page in
+one query, after which get_gene_by_locus and get_gene_by_id cost no
+queries. Genes are cached by both locus and WormBase ID, and the least
+recently used entries are evicted beyond GENE_CACHE_SIZE.
+
+Commands that change genes (import_functional_descriptions and
+import_mapping_data) call invalidate_gene_cache, which bumps a
+generation number in the Django cache. Processes notice the new
+generation on their next warm_gene_cache. If the Django cache is not
+shared between processes, entries still expire after
+GENE_CACHE_SECONDS.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+from django.core.cache import cache
+
+from clones.models import Gene
+
+# Maximum number of cached entries (each gene is cached twice, by locus
+# and by WormBase ID)
+GENE_CACHE_SIZE = 100000
+
+# Seconds before a cached entry is reloaded from the database
+GENE_CACHE_SECONDS = 3600
+
+# Maximum number of values per query when loading genes
+LOAD_CHUNK_SIZE = 500
+
+GENERATION_KEY = 'gene-cache-generation'
+
+# _entries[(field, value)] = (gene or None, time cached)
+_entries = OrderedDict()
+_generation = None
+_lock = threading.Lock()
+
+
+def get_gene_by_locus(locus):
+    """Get the gene with this locus, or None if there is not exactly one."""
+    return _get('locus', locus)
+
+
+def get_gene_by_id(gene_id):
+    """Get the gene with this WormBase ID, or None if there is none."""
+    return _get('id', gene_id)
+
+
+def warm_gene_cache(loci=(), ids=()):
+    """
+    Load the genes with these loci and WormBase IDs into the cache.
+
+    Genes already cached are not loaded again. Values with no gene are
+    cached as None, so that looking them up does not query either.
+    """
+    _check_generation()
+
+    for field, values in (('locus', loci), ('id', ids)):
+        with _lock:
+            missing = set(value for value in values
+                          if _lookup(field, value) is None)
+
+        if missing:
+            _load(field, missing)
+
+
+def invalidate_gene_cache():
+    """
+    Clear the gene cache.
+
+    Other processes clear theirs on their next warm_gene_cache.
+    """
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+    _clear()
+
+
+def _get(field, value):
+    with _lock:
+        entry = _lookup(field, value)
+
+    if entry is None:
+        _load(field, [value])
+
+        with _lock:
+            entry = _lookup(field, value)
+
+    # Entry can only be missing here if evicted by another thread
+    return entry[0] if entry else None
+
+
+def _lookup(field, value):
+    """
+    Get the (gene, time cached) entry, or None if not cached or expired.
+
+    Must be called with _lock held.
+    """
+    key = (field, value)
+    entry = _entries.pop(key, None)
+
+    if entry is None or time.time() - entry[1] > GENE_CACHE_SECONDS:
+        return None
+
+    # Reinsert, so that entries stay in least recently used order
+    _entries[key] = entry
+    return entry
+
+
+def _load(field, values):
+    """Load the genes where field is one of values into the cache."""
+    values = list(set(values))
+    genes = {}
+    ambiguous = set()
+
+    for i in range(0, len(values), LOAD_CHUNK_SIZE):
+        chunk = values[i:i + LOAD_CHUNK_SIZE]
+
+        for gene in Gene.objects.filter(**{field + '__in': chunk}):
+            value = getattr(gene, field)
+            if value in genes:
+                ambiguous.add(value)
+            genes[value] = gene
+
+    now = time.time()
+
+    with _lock:
+        for value in values:
+            gene = None if value in ambiguous else genes.get(value)
+            _entries[(field, value)] = (gene, now)
+
+            # Cache by the other field too
+            if gene and field == 'locus':
+                _entries[('id', gene.id)] = (gene, now)
+
+        while len(_entries) > GENE_CACHE_SIZE:
+            _entries.popitem(last=False)
+
+
+def _check_generation():
+    """Clear the cache if another process has invalidated it."""
+    global _generation
+
+    generation = cache.get(GENERATION_KEY)
+
+    if generation != _generation:
+        _clear()
+        _generation = generation
+
+
+def _clear():
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,50 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clones.helpers.annotations import (AnnotationIndex, get_gff_path,
+                                        get_index_path)
+
+
+class Command(BaseCommand):
+    """
+    Command to build the annotation index used to annotate BLAST hits.
+
+    The input is the sorted WormBase GFF annotation, by default the one in
+    TABIX_DB_DIR. The index is written to a directory next to it, and
+    web processes pick up the new index on their next BLAST job. Until
+    the index is built, BLAST hits are annotated with tabix, which is
+    much slower for jobs with many hits.
+
+    Run this whenever the GFF is replaced, e.g. for a new WormBase
+    version.
+    """
+
+    help = 'Build the annotation index used to annotate BLAST hits.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gff', default=get_gff_path(),
+                            help='GFF file (optionally gzipped). '
+                                 'Default: the WormBase GFF in '
+                                 'TABIX_DB_DIR')
+
+        parser.add_argument('--output', default=get_index_path(),
+                            help='Directory to write the index to. '
+                                 'Default: the GFF path plus .index')
+
+    def handle(self, **options):
+        gff = options['gff']
+
+        if not os.path.isfile(gff):
+            raise CommandError('{} is not a file'.format(gff))
+
+        start = time.time()
+        index = AnnotationIndex.from_gff(gff)
+        index.save(options['output'])
+
+        self.stdout.write('Indexed {} features on {} chromosomes in '
+                          '{:.1f} seconds; written to {}'.format(
+                              index.get_num_features(),
+                              len(index.chromosomes),
+                              time.time() - start, options['output']))
@@ -3,6 +3,7 @@ import csv
 import json
 from django.core.management.base import BaseCommand, CommandError
 from django.core import serializers
+from clones.helpers.gene_cache import invalidate_gene_cache
 from clones.models import Gene
 from utils.scripting import require_db_write_acknowledgement
 from django.conf import settings
@@ -88,6 +89,7 @@ class Command(BaseCommand):
 
             gene.save()
         _genes_to_json()
+        invalidate_gene_cache()
 
 
 """
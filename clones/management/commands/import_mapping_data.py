@@ -1,14 +1,18 @@
 # import MySQLdb
 import mysql.connector
 
-from django.core.exceptions import ObjectDoesNotExist
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from clones.helpers.gene_cache import invalidate_gene_cache
 from clones.models import Clone, Gene, CloneTarget
 from eegi.localsettings import MAPPING_DATABASE
-from utils.sql import get_field_dictionary
+from utils.sql import bulk_update, get_field_dictionary
 from utils.scripting import require_db_write_acknowledgement
 
+# Number of rows to write per query
+BATCH_SIZE = 500
+
 
 class Command(BaseCommand):
     """
@@ -23,10 +27,17 @@ class Command(BaseCommand):
           existing rows. However, it may add new rows, and may update
           any of the other fields in this table.
 
-        - Deletes all rows in the CloneTarget table, and creates
-          this table from scratch. This is because, in addition
-          to new or changed clone-gene mappings since the last time
-          this command was run, there may be deleted mappings.
+        - Makes the CloneTarget table match the mapping database
+          exactly. This is because, in addition to new or changed
+          clone-gene mappings since the last time this command was
+          run, there may be deleted mappings.
+
+    The new clone, gene, and CloneTarget rows are built entirely in
+    memory and diffed against this database. Only then are the
+    differences written, all in one transaction, so the site never
+    shows a half-built mapping, and a failed import changes nothing.
+
+    Stdout reports the number of mappings added, removed, and changed.
     """
 
     help = "Import RNAi clone mapping data from Firoz's database."
@@ -51,19 +62,19 @@ class Command(BaseCommand):
         all_mapping_genes = _get_all_mapping_genes(cursor)
         all_mapping_targets = _get_all_mapping_targets(cursor)
 
-        # Delete all Clone-to-Gene mappings from this database.
-        CloneTarget.objects.all().delete()
+        genes = {gene.pk: gene for gene in Gene.objects.all()}
+        staged = _StagedMapping(genes)
 
         # Counters to keep track of no-target and multiple-target cases
         num_clones_no_targets = 0
         num_clones_multiple_targets = 0
 
-        # Iterate over the clones in this table, updating all mapping info
+        # Iterate over the clones in this table, staging all mapping info
         clones = Clone.objects.exclude(id='L4440')
         for clone in clones:
             num_targets = _process_clone(
                 clone, pk_translator, all_mapping_clones,
-                all_mapping_genes, all_mapping_targets)
+                all_mapping_genes, all_mapping_targets, staged)
 
             if num_targets == 0:
                 num_clones_no_targets += 1
@@ -71,16 +82,88 @@ class Command(BaseCommand):
             elif num_targets > 1:
                 num_clones_multiple_targets += 1
 
+        added, removed, changed = staged.diff_targets()
+
+        with transaction.atomic():
+            staged.apply(added, removed, changed)
+
+        invalidate_gene_cache()
+
         self.stdout.write('{} clones with no targets.'
                           .format(num_clones_no_targets))
         self.stdout.write('{} clones with multiple targets.'
                           .format(num_clones_multiple_targets))
+        self.stdout.write('{} clones updated; {} genes added, {} updated.'
+                          .format(len(staged.clone_changes),
+                                  len(staged.new_genes),
+                                  len(staged.gene_changes)))
+        self.stdout.write('{} mappings added, {} removed, {} changed.'
+                          .format(len(added), len(removed), len(changed)))
+
+
+class _StagedMapping(object):
+    """
+    The new mapping data, built in memory before being written.
+
+    clone_changes and gene_changes are {pk: {attname: value}} for
+    existing rows, and new_genes and targets are the Genes to add and
+    the new CloneTargets, keyed on pk. genes are all genes, by pk, with staged
+    changes applied.
+    """
+
+    def __init__(self, genes):
+        self.genes = genes
+        self.clone_changes = {}
+        self.gene_changes = {}
+        self.new_genes = {}
+        self.targets = {}
+
+    def diff_targets(self):
+        """
+        Diff the staged targets against the CloneTarget table.
+
+        Returns lists of pks of the added, removed, and changed targets.
+        """
+        fields = CloneTarget._meta.concrete_fields
+        attnames = [field.attname for field in fields]
+
+        old = {row[0]: row for row in
+               CloneTarget.objects.values_list(*attnames).iterator()}
+
+        new = {}
+        for pk, target in self.targets.iteritems():
+            new[pk] = tuple(field.to_python(getattr(target, field.attname))
+                            for field in fields)
+
+        added = [pk for pk in new if pk not in old]
+        removed = [pk for pk in old if pk not in new]
+        changed = [pk for pk in new if pk in old and new[pk] != old[pk]]
+
+        return added, removed, changed
+
+    def apply(self, added, removed, changed):
+        """Write the staged data. Should be called in a transaction."""
+        Gene.objects.bulk_create(self.new_genes.values(),
+                                 batch_size=BATCH_SIZE)
+        bulk_update(Gene, self.gene_changes, BATCH_SIZE)
+        bulk_update(Clone, self.clone_changes, BATCH_SIZE)
+
+        # Changed targets are replaced
+        to_delete = removed + changed
+        for i in range(0, len(to_delete), BATCH_SIZE):
+            (CloneTarget.objects
+             .filter(pk__in=to_delete[i:i + BATCH_SIZE])
+             .delete())
+
+        CloneTarget.objects.bulk_create(
+            [self.targets[pk] for pk in added + changed],
+            batch_size=BATCH_SIZE)
 
 
 def _process_clone(clone, pk_translator, all_mapping_clones,
-                   all_mapping_genes, all_mapping_targets):
+                   all_mapping_genes, all_mapping_targets, staged):
     """
-    Process this clone's mapping information.
+    Stage this clone's mapping information.
 
     Returns the number of targets.
     """
@@ -93,37 +176,43 @@ def _process_clone(clone, pk_translator, all_mapping_clones,
     if len(mapping_pks) > 1:
         raise CommandError('>1 alias match for {}'.format(clone.pk))
 
-    clone.mapping_db_pk = mapping_pks[0]
-
     # Update general information about this clone (e.g. its primers)
-    clone_mapping_info = all_mapping_clones[clone.mapping_db_pk]
-    _update_clone_info(clone, clone_mapping_info)
+    clone_mapping_info = all_mapping_clones[mapping_pks[0]]
+    changes = _update_clone_info(clone, mapping_pks[0], clone_mapping_info)
+    if changes:
+        staged.clone_changes[clone.pk] = changes
 
     # If there are no targets, move on
     try:
-        mapping_targets = all_mapping_targets[clone.mapping_db_pk]
+        mapping_targets = all_mapping_targets[mapping_pks[0]]
 
     except KeyError:
         return 0
 
-    # If there are targets, update the gene and save a new gene-target mapping
+    # If there are targets, update the gene and stage a new gene-target
+    # mapping
     for target_mapping_info in mapping_targets:
         gene_id = target_mapping_info['gene_id']
 
         try:
-            gene = Gene.objects.get(pk=gene_id)
+            gene = staged.genes[gene_id]
 
-        except ObjectDoesNotExist:
+        except KeyError:
             # RNAiCloneMapper uses MyISAM tables which don't enforce FKs
             if gene_id not in all_mapping_genes:
                 raise CommandError('ERROR: Gene {} from targets table not '
                                    'present in RNAiCloneMapper.Gene table'
                                    .format(gene_id))
             gene = Gene(id=gene_id)
+            staged.genes[gene_id] = gene
+            staged.new_genes[gene_id] = gene
 
         gene_mapping_info = all_mapping_genes[gene_id]
-        _update_gene_info(gene, gene_mapping_info)
-        _add_target(clone, target_mapping_info)
+        changes = _update_gene_info(gene, gene_mapping_info)
+        if changes and gene_id not in staged.new_genes:
+            staged.gene_changes.setdefault(gene_id, {}).update(changes)
+
+        _add_target(clone, target_mapping_info, staged)
 
     return len(mapping_targets)
 
@@ -221,41 +310,62 @@ def _get_all_mapping_targets(cursor):
     return all_targets
 
 
-def _update_clone_info(clone, clone_mapping_info):
+def _update_clone_info(clone, mapping_db_pk, clone_mapping_info):
     """
     Update clone's fields according to the clone_mapping_info dictionary.
+
+    Returns the changed fields, as {attname: value}.
     """
-    clone.library = clone_mapping_info['library']
-    clone.clone_type = clone_mapping_info['clone_type']
-    clone.forward_primer = clone_mapping_info['forward_primer']
-    clone.reverse_primer = clone_mapping_info['reverse_primer']
-    clone.save()
+    return _update_fields(clone, {
+        'mapping_db_pk': mapping_db_pk,
+        'library': clone_mapping_info['library'],
+        'clone_type': clone_mapping_info['clone_type'],
+        'forward_primer': clone_mapping_info['forward_primer'],
+        'reverse_primer': clone_mapping_info['reverse_primer'],
+    })
 
 
 def _update_gene_info(gene, gene_mapping_info):
     """
     Update gene's fields according to the gene_mapping_info dictionary.
+
+    Returns the changed fields, as {attname: value}.
     """
-    gene.cosmid_id = gene_mapping_info['cosmid_id']
-    gene.locus = gene_mapping_info['locus']
-    if gene.locus == 'NA':
-        gene.locus = ''
-    gene.gene_type = gene_mapping_info['gene_type']
-    gene.save()
+    locus = gene_mapping_info['locus']
+    if locus == 'NA':
+        locus = ''
+
+    return _update_fields(gene, {
+        'cosmid_id': gene_mapping_info['cosmid_id'],
+        'locus': locus,
+        'gene_type': gene_mapping_info['gene_type'],
+    })
+
+
+def _update_fields(obj, values):
+    """Set obj's fields to values, returning those that changed."""
+    changes = {}
+
+    for attname, value in values.iteritems():
+        if getattr(obj, attname) != value:
+            setattr(obj, attname, value)
+            changes[attname] = value
+
+    return changes
 
 
-def _add_target(clone, target_mapping_info):
+def _add_target(clone, target_mapping_info, staged):
     """
-    Add a new CloneTarget to the database, representing clone targeting gene,
+    Stage a new CloneTarget, representing clone targeting gene,
     and with other fields specified in dictionary target_mapping_info.
     """
     # Keep the target PK consistent between this database and the
     # RNAiCloneMapper database
     target_id = target_mapping_info['id']
 
-    if CloneTarget.objects.filter(id=target_id):
-        raise CommandError('ERROR: all CloneTargets should have been deleted '
-                           'from the database at the start of this command')
+    if target_id in staged.targets:
+        raise CommandError('ERROR: CloneTarget {} appears more than once '
+                           'in the mapping database'.format(target_id))
 
-    target = CloneTarget(clone=clone, **target_mapping_info)
-    target.save()
+    staged.targets[target_id] = CloneTarget(clone=clone,
+                                            **target_mapping_info)
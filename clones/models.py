@@ -1,6 +1,16 @@
+import datetime
+import os
+
+from django.conf import settings
+from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
 from django.db import models
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from utils.reference_cache import get_reference
+
 
 class Clone(models.Model):
     """An RNAi clone used in the screen."""
@@ -26,12 +36,36 @@ class Clone(models.Model):
         return self.id == 'L4440'
 
     def get_targets(self):
+        """
+        Get this clone's targets, with their genes.
+
+        Uses the targets loaded with prefetch_targets, if any.
+        """
+        if hasattr(self, 'prefetched_targets'):
+            return self.prefetched_targets
+
         return self.clonetarget_set.all().select_related('gene')
 
+    @staticmethod
+    def prefetch_targets(lookup='clonetarget_set'):
+        """
+        Get a Prefetch of the targets of the clones at lookup.
+
+        Pass it to prefetch_related, so that get_targets costs no queries.
+        """
+        return Prefetch(lookup,
+                        queryset=CloneTarget.objects.select_related('gene'),
+                        to_attr='prefetched_targets')
+
     @classmethod
     def get_l4440(cls):
-        """Get the L4440 control RNAi clone."""
-        return cls.objects.get(pk='L4440')
+        """
+        Get the L4440 control RNAi clone.
+
+        Cached (see utils.reference_cache), so do not modify it.
+        """
+        return get_reference('l4440', lambda: cls.objects.get(pk='L4440'),
+                             [cls])
 
     @classmethod
     def get_clones_from_search_term(cls, search_term):
@@ -128,3 +162,103 @@ class CloneTarget(models.Model):
 
     def __unicode__(self):
         return unicode(self.clone) + ' targets ' + unicode(self.gene)
+
+
+class BlastJob(models.Model):
+    """
+    A BLAST search of an uploaded FASTA file, run in the background.
+
+    query_hash is the SHA-1 of the uploaded FASTA, so that identical
+    uploads can be served from a finished or in-flight job. results is
+    the JSON list of annotated hits shown on the BLAST page.
+
+    Jobs run in the web process, so are lost if it restarts. A job
+    still queued or running after settings.BLAST_JOB_MAX_SECONDS is
+    assumed lost, and marked failed.
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    user = models.ForeignKey(User, models.SET_NULL, null=True, blank=True)
+    query_hash = models.CharField(max_length=40, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=QUEUED)
+    results = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+
+    # Stored in UTC
+    created = models.DateTimeField(default=timezone.now)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'BlastJob'
+        ordering = ['-created']
+
+    def __unicode__(self):
+        return 'BLAST job {} ({})'.format(self.pk, self.status)
+
+    def get_absolute_url(self):
+        return reverse('blast_job_url', args=[self.pk])
+
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    def fail_if_stale(self):
+        """Mark this job failed if it has been lost (see class docstring)."""
+        if not self.is_finished() and self.created < _get_stale_cutoff():
+            self.status = self.FAILED
+            self.error = _STALE_ERROR
+            self.finished = timezone.now()
+            self.save()
+
+    def get_work_dir(self):
+        """Get the directory holding this job's input and output files."""
+        return os.path.join(settings.FILE_UPLOAD_TEMP_DIR, 'blast',
+                            str(self.pk))
+
+    @classmethod
+    def get_cached(cls, query_hash):
+        """
+        Get a job to reuse for query_hash, or None.
+
+        Prefers the latest successful job, otherwise the latest job
+        still queued or running (stale jobs are marked failed first).
+        """
+        cls.fail_stale_jobs(query_hash=query_hash)
+
+        done = (cls.objects.filter(query_hash=query_hash, status=cls.DONE)
+                .order_by('-finished').first())
+        if done:
+            return done
+
+        return (cls.objects.filter(query_hash=query_hash,
+                                   status__in=(cls.QUEUED, cls.RUNNING))
+                .order_by('-created').first())
+
+    @classmethod
+    def fail_stale_jobs(cls, **filters):
+        """Mark failed the lost jobs matching filters."""
+        (cls.objects
+         .filter(status__in=(cls.QUEUED, cls.RUNNING),
+                 created__lt=_get_stale_cutoff(), **filters)
+         .update(status=cls.FAILED, error=_STALE_ERROR,
+                 finished=timezone.now()))
+
+
+_STALE_ERROR = ('The search did not finish in time, and was probably '
+                'interrupted by a server restart. Please submit it again.')
+
+
+def _get_stale_cutoff():
+    return timezone.now() - datetime.timedelta(
+        seconds=settings.BLAST_JOB_MAX_SECONDS)
@@ -1,11 +1,39 @@
-import os.path
+import datetime
+import os
+import shutil
+import tempfile
+
+import numpy as np
 
 # from django.urls import reverse
 from django.contrib.auth.models import User
-from django.test import TestCase, Client
+from django.test import SimpleTestCase, TestCase, Client, override_settings
 from django.conf import settings
-from clones.models import Clone, Gene, CloneTarget
+from django.utils import timezone
+from clones.models import BlastJob, Clone, Gene, CloneTarget
 from clones.forms import BlastForm
+from clones.helpers.annotations import (AnnotationIndex,
+                                        get_overlapping_batch)
+from clones.helpers.descriptions import get_descriptions, get_description_rows
+from clones.helpers.gene_cache import (get_gene_by_id, get_gene_by_locus,
+                                       invalidate_gene_cache, warm_gene_cache)
+from website.templatetags.extra_tags import (get_comma_separated_targets,
+                                             get_gene_desc)
+
+CLONE_TARGET_KWARGS = {
+    'clone_amplicon_id': 54,
+    'amplicon_evidence': '0011',
+    'length_span': 434,
+    'raw_score': 23,
+    'unique_raw_score': 23,
+    'relative_score': .6,
+    'specificity_index': .4,
+    'unique_chunk_index': .3,
+    'amplicon_is_designed': True,
+    'amplicon_is_unique': True,
+    'is_on_target': True,
+    'is_primary_target': True
+}
 
 
 class CloneTestCase(TestCase):
@@ -27,32 +55,17 @@ class CloneTestCase(TestCase):
         gene_3 = Gene.objects.create(
             id='WBGene3', cosmid_id='P3421T.2', locus='gene-3')
 
-        clone_target_kwargs = {
-            'clone_amplicon_id': 54,
-            'amplicon_evidence': '0011',
-            'length_span': 434,
-            'raw_score': 23,
-            'unique_raw_score': 23,
-            'relative_score': .6,
-            'specificity_index': .4,
-            'unique_chunk_index': .3,
-            'amplicon_is_designed': True,
-            'amplicon_is_unique': True,
-            'is_on_target': True,
-            'is_primary_target': True
-        }
-
         CloneTarget.objects.create(
-            clone=clone_a, gene=gene_1, **clone_target_kwargs)
+            clone=clone_a, gene=gene_1, **CLONE_TARGET_KWARGS)
 
         CloneTarget.objects.create(
-            clone=clone_a, gene=gene_2, **clone_target_kwargs)
+            clone=clone_a, gene=gene_2, **CLONE_TARGET_KWARGS)
 
         CloneTarget.objects.create(
-            clone=clone_b, gene=gene_2, **clone_target_kwargs)
+            clone=clone_b, gene=gene_2, **CLONE_TARGET_KWARGS)
 
         CloneTarget.objects.create(
-            clone=clone_b, gene=gene_3, **clone_target_kwargs)
+            clone=clone_b, gene=gene_3, **CLONE_TARGET_KWARGS)
 
     def test_clone_is_control(self):
         l4440 = Clone.objects.get(pk='L4440')
@@ -75,6 +88,180 @@ class CloneTestCase(TestCase):
         self.assertIn(Gene.objects.get(pk='WBGene3'), genes_b)
 
 
+class DescriptionsTestCase(CloneTestCase):
+    def test_get_descriptions(self):
+        with self.assertNumQueries(3):
+            descriptions = get_descriptions('locus', ['gene-2', 'gene-3'])
+
+        targets = {gene.id: [x[0] for x in gene_targets]
+                   for gene, gene_targets in descriptions}
+        self.assertEqual(targets, {'WBGene2': ['sjj_a', 'sjj_b'],
+                                   'WBGene3': ['sjj_b']})
+
+    def test_get_description_rows(self):
+        descriptions = get_descriptions('clone_id', ['sjj_a'])
+        rows = list(get_description_rows(descriptions))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0][:3], ['WBGene1', 'F4932.3', 'gene-1'])
+        self.assertEqual(rows[0][-3:], ['sjj_a', '', ''])
+
+
+class GeneCacheTestCase(CloneTestCase):
+    def setUp(self):
+        super(GeneCacheTestCase, self).setUp()
+        invalidate_gene_cache()
+
+    def tearDown(self):
+        invalidate_gene_cache()
+
+    def test_warm_gene_cache(self):
+        with self.assertNumQueries(1):
+            warm_gene_cache(loci=['gene-1', 'gene-2', 'gene-1, gene-2'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_gene_by_locus('gene-1').id, 'WBGene1')
+            self.assertEqual(get_gene_by_id('WBGene2').locus, 'gene-2')
+            self.assertIsNone(get_gene_by_locus('gene-1, gene-2'))
+
+    def test_warm_with_target_strings(self):
+        # Clone with no targets, and a clone targeting a gene with no locus
+        Clone.objects.create(id='sjj_c')
+        CloneTarget.objects.create(
+            clone=Clone.objects.create(id='sjj_d'),
+            gene=Gene.objects.create(id='WBGene4', cosmid_id='K04G7.4'),
+            **CLONE_TARGET_KWARGS)
+
+        with self.assertNumQueries(2):
+            clones = list(Clone.objects.exclude(pk='L4440')
+                          .prefetch_related(Clone.prefetch_targets()))
+
+        with self.assertNumQueries(1):
+            warm_gene_cache(loci=[get_comma_separated_targets(clone, False)
+                                  for clone in clones])
+
+        with self.assertNumQueries(0):
+            descriptions = [
+                get_gene_desc(get_comma_separated_targets(clone, False))
+                for clone in clones]
+
+        self.assertEqual(len(descriptions), 4)
+
+    def test_invalidate_gene_cache(self):
+        warm_gene_cache(loci=['gene-1'])
+        Gene.objects.filter(pk='WBGene1').update(functional_description='x')
+        invalidate_gene_cache()
+        self.assertEqual(get_gene_by_locus('gene-1').functional_description,
+                         'x')
+
+
+class AnnotationIndexTestCase(SimpleTestCase):
+    def setUp(self):
+        gff = ''.join(
+            'I\tWormBase\t{}\t{}\t{}\t.\t+\t.\tName "{}"\n'.format(
+                method, start, end, method)
+            for method, start, end in (('gene', 100, 5000),
+                                       ('CDS', 200, 300),
+                                       ('exon', 250, 400),
+                                       ('CDS', 1000, 1200)))
+        self.path = tempfile.mktemp(suffix='.gff')
+        with open(self.path, 'w') as f:
+            f.write('##gff-version 2\n' + gff)
+        self.index = AnnotationIndex.from_gff(self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def get_methods(self, chromosome, start, end):
+        return [row[1] for row in
+                self.index.get_overlapping(chromosome, start, end)]
+
+    def test_get_overlapping(self):
+        self.assertEqual(self.get_methods('I', 290, 310),
+                         ['gene', 'CDS', 'exon'])
+        self.assertEqual(self.get_methods('I', 301, 999), ['gene', 'exon'])
+        self.assertEqual(self.get_methods('I', 1200, 1200), ['gene', 'CDS'])
+        self.assertEqual(self.get_methods('I', 5001, 6000), [])
+        self.assertEqual(self.get_methods('II', 1, 6000), [])
+
+    def test_get_overlapping_rows(self):
+        self.assertEqual(self.index.get_overlapping('I', 1100, 1100), [
+            ('WormBase', 'gene', '100', '5000', 'Name "gene"'),
+            ('WormBase', 'CDS', '1000', '1200', 'Name "CDS"')])
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        index_path = os.path.join(directory, 'index')
+
+        # Saving again replaces the existing index
+        self.index.save(index_path)
+        self.index.save(index_path)
+        loaded = AnnotationIndex.load(index_path)
+        shutil.rmtree(directory)
+
+        self.assertIsInstance(loaded.starts, np.memmap)
+        self.assertEqual(loaded.get_num_features(), 4)
+        for start, end in ((250, 250), (1, 6000), (5001, 6000)):
+            self.assertEqual(loaded.get_overlapping('I', start, end),
+                             self.index.get_overlapping('I', start, end))
+
+    def test_tabix_fallback_without_index(self):
+        directory = tempfile.mkdtemp()
+
+        # Stands in for tabix, printing a feature for the region queried
+        tabix = os.path.join(directory, 'tabix')
+        with open(tabix, 'w') as f:
+            f.write('#!/bin/sh\n'
+                    'printf "I\\tWormBase\\tgene\\t1\\t9\\t.\\t+'
+                    '\\t.\\t%s\\n" "$2"\n')
+        os.chmod(tabix, 0755)
+
+        with override_settings(TABIX=tabix, TABIX_DB_DIR=directory):
+            rows = get_overlapping_batch([('I', 1, 5), ('II', 2, 3)])
+        shutil.rmtree(directory)
+
+        self.assertEqual(rows, [
+            [('WormBase', 'gene', '1', '9', 'I:1-5')],
+            [('WormBase', 'gene', '1', '9', 'II:2-3')]])
+
+
+class BlastJobTestCase(TestCase):
+    def create_job(self, status, seconds_old=0):
+        return BlastJob.objects.create(
+            query_hash='abc', status=status,
+            created=timezone.now() - datetime.timedelta(seconds=seconds_old))
+
+    def test_get_cached_prefers_done(self):
+        self.create_job(BlastJob.RUNNING)
+        done = self.create_job(BlastJob.DONE)
+        self.assertEqual(BlastJob.get_cached('abc'), done)
+
+    def test_get_cached_reuses_in_flight(self):
+        running = self.create_job(BlastJob.RUNNING)
+        self.create_job(BlastJob.FAILED)
+        self.assertEqual(BlastJob.get_cached('abc'), running)
+        self.assertIsNone(BlastJob.get_cached('def'))
+
+    def test_stale_job_not_reused(self):
+        stale = self.create_job(BlastJob.QUEUED,
+                                settings.BLAST_JOB_MAX_SECONDS + 1)
+        self.assertIsNone(BlastJob.get_cached('abc'))
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, BlastJob.FAILED)
+
+    def test_fail_if_stale(self):
+        running = self.create_job(BlastJob.RUNNING)
+        running.fail_if_stale()
+        self.assertEqual(running.status, BlastJob.RUNNING)
+
+        stale = self.create_job(BlastJob.RUNNING,
+                                settings.BLAST_JOB_MAX_SECONDS + 1)
+        stale.fail_if_stale()
+        self.assertTrue(stale.is_finished())
+        self.assertEqual(BlastJob.objects.get(pk=stale.pk).status,
+                         BlastJob.FAILED)
+
+
 class SubmitBlastFormTestCase(TestCase):
 
     @classmethod
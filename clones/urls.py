@@ -9,4 +9,5 @@ urlpatterns = [
     url(r'^clone/([^/]*)/$', views.clone, name='clone_url'),
     url(r'^descriptions/$', views.descriptions, name='descriptions_url'),
     url(r'^blast/$', views.blast, name='blast_url'),
+    url(r'^blast/(\d+)/$', views.blast_job, name='blast_job_url'),
 ]
@@ -1,12 +1,15 @@
-from django.shortcuts import render, get_object_or_404
+from django.http import StreamingHttpResponse
+from django.shortcuts import render, get_object_or_404, redirect
 from django.core import serializers
 from django.conf import settings
 from clones.forms import CloneSearchForm, GeneSearchForm, BlastForm
-from clones.models import Clone, Gene, CloneTarget
-from library.models import LibraryStock
+from clones.helpers.blast import submit_blast_job
+from clones.helpers.descriptions import (EXPORT_DELIMITERS, get_descriptions,
+                                         get_description_rows,
+                                         stream_delimited)
+from clones.models import BlastJob, Clone
 from utils.pagination import get_paginated
 import json
-from subprocess import Popen, PIPE
 from django.contrib.auth.decorators import login_required, permission_required
 
 CLONES_PER_PAGE = 20
@@ -52,9 +55,6 @@ def descriptions(request):
 
     j = ''
     query = []
-    genes = ''
-    clone_targets = ''
-    stocks = ''
 
     if request.method == 'POST':
 
@@ -65,6 +65,11 @@ def descriptions(request):
         else:
             query.append(request.POST['gene_query'])
 
+        export_format = request.POST.get('export_format')
+
+        if export_format in EXPORT_DELIMITERS:
+            return _get_descriptions_download(
+                request.POST['choice_field'], query, export_format)
 
         j = render_table(request.POST['choice_field'], query)
 
@@ -82,32 +87,7 @@ def render_table(choice_field, query):
 
     d = []
 
-    if choice_field == 'wb_gene_id':
-        genes = Gene.objects.filter(id__in=query)
-        clone_targets = CloneTarget.objects.filter(gene__in=genes.values('id'))
-        stocks = LibraryStock.objects.filter(intended_clone__in = clone_targets.values('clone'))
-
-    elif choice_field == 'locus':
-        genes = Gene.objects.filter(locus__in=query)
-        clone_targets = CloneTarget.objects.filter(gene__in=genes.values('id'))
-        stocks = LibraryStock.objects.filter(intended_clone__in = clone_targets.values('clone'))
-
-    elif choice_field == 'clone_id':
-        clone_targets = CloneTarget.objects.filter(clone__in=query)
-        genes = Gene.objects.filter(id__in=clone_targets.values('gene'))
-        stocks = LibraryStock.objects.filter(intended_clone__in=clone_targets.values('clone'))
-
-    elif choice_field == 'cosmid_id':
-        genes = Gene.objects.filter(cosmid_id__in=query)
-        clone_targets = CloneTarget.objects.filter(gene__in=genes.values('id'))
-        stocks = LibraryStock.objects.filter(intended_clone__in = clone_targets.values('clone'))
-
-    else:
-        stocks = LibraryStock.objects.filter(id__in=query)
-        clone_targets = CloneTarget.objects.filter(clone__in=stocks.values('intended_clone'))
-        genes = Gene.objects.filter(id__in=clone_targets.values('gene'))
-
-    for gene in genes:
+    for gene, targets in get_descriptions(choice_field, query):
         row = [ \
             '<a href="'+gene.get_wormbase_url()+'">'+gene.id+'</a>', \
             gene.cosmid_id, \
@@ -116,15 +96,13 @@ def render_table(choice_field, query):
             gene.gene_class_description, \
             gene.functional_description.replace("'","")]
 
-        if clone_targets.filter(gene=gene).exists():
+        if targets:
 
-            for clone_target in clone_targets.filter(gene=gene):
-                stockStr = ""
-                for stock in stocks.filter(intended_clone=clone_target.clone):
-                    stockStr += stock.id+',\n'
+            for clone_id, transcript_isoform, stock_ids in targets:
+                stockStr = ''.join(stock_id + ',\n' for stock_id in stock_ids)
                 row.extend((
-                    clone_target.clone_id,\
-                    clone_target.transcript_isoform,\
+                    clone_id,\
+                    transcript_isoform,\
                     stockStr))
         else:
             row.extend(("","",""))
@@ -133,91 +111,56 @@ def render_table(choice_field, query):
 
     return json.dumps(d)
 
+def _get_descriptions_download(choice_field, query, export_format):
+    """Stream the descriptions table as a delimited text download."""
+    rows = get_description_rows(get_descriptions(choice_field, query))
+    response = StreamingHttpResponse(
+        stream_delimited(rows, EXPORT_DELIMITERS[export_format]),
+        content_type='text/{}'.format(
+            'tab-separated-values' if export_format == 'tsv' else 'csv'))
+    response['Content-Disposition'] = (
+        'attachment; filename="descriptions.{}"'.format(export_format))
+    return response
+
 @login_required
 def blast(request):
-
-    """
-    This method runs blast locally on a user uploaded fasta file.
-    it searches the WS260 version of the C. elegans genome with each query
-    and then runs the ouput against its gff annotation file.
     """
+    Render the page to BLAST a user-uploaded fasta file.
 
-    #TODO: Make a management script that downloads a specific version of this
-    # and updates it.
-
-    data = ''
-    query = ''
-    j = []
+    The search runs in the background; submitting redirects to the
+    page for the job, which shows the results when it finishes.
+    """
     if request.method == 'POST':
         form = BlastForm(request.POST, request.FILES)
 
-        if request.FILES:
-            query = request.FILES['file_field'].read()
-	    with open(settings.FILE_UPLOAD_TEMP_DIR+'/blah.fa', 'w') as f:
-		    f.write(query)
-            """
-            This is handled by TemporaryFileUploadHandler, which writes to disk
-            and is assigned a randomly generated filepath. The uploader is defined
-            in settings.py
-            """
-
-            # runs blast on local server
-            blast_out, blast_err = Popen([
-                settings.BLAST,
-		'-query',settings.FILE_UPLOAD_TEMP_DIR+'/blah.fa',
-		'-db', settings.BLAST_DB_DIR + '/c_elegans.PRJNA13758.WS260.genomic.fa',
-                '-outfmt','6',
-                '-max_target_seqs','1',
-                '-culling_limit','1',
-                '-num_threads','4',
-                '-evalue','0.00005'],
-                stdout=PIPE,
-                stderr=PIPE,
-            ).communicate()
-
-            for hit in blast_out.rstrip().split('\n'):
-                hit = hit.split('\t')
-                print hit
-                start = 0
-                end = 0
-                if hit[8] > hit[9]:
-                    start = hit[9]
-                    end = hit[8]
-                else:
-                    start = hit[8]
-                    end = hit[9]
-                region = hit[1]+':'+start+'-'+end
-                tabix_out, tabix_err = Popen([
-                    settings.TABIX,
-                    settings.TABIX_DB_DIR+'/c_elegans.PRJNA13758.WS260.annotations.sorted.gff2.gz',
-		     region],
-                    stdout=PIPE,
-                    stderr=PIPE
-                ).communicate()
-
-                for tabix in tabix_out.rstrip().split('\n'):
-                    if tabix:
-                        tabix = tabix.split('\t')
-                        l = []
-                        l.extend((
-                            hit[0],   # query name
-                            hit[1],   # subject name
-                            tabix[1], # source i.e. blastx, gene
-                            tabix[2], # method, i.e. cds
-                            tabix[3], # start position
-                            tabix[4], # stop position
-                            tabix[8].replace("'","")  # features
-                        ))
-                        j.append(l)
-            data = json.dumps(j)
-
+        if form.is_valid():
+            query = form.cleaned_data['file_field'].read()
+            job = submit_blast_job(query, user=request.user)
+            return redirect(job)
 
     else:
         form = BlastForm()
 
     context = {
-        'data':data,
-        'form':form,
+        'data': '[]',
+        'form': form,
+    }
+
+    return render(request, 'blast.html', context)
+
+
+@login_required
+def blast_job(request, id):
+    """Render the page for a BLAST job, with results if it has finished."""
+    job = get_object_or_404(BlastJob, pk=id)
+
+    # So that the page stops refreshing for a lost job
+    job.fail_if_stale()
+
+    context = {
+        'job': job,
+        'data': job.results or '[]',
+        'form': BlastForm(),
     }
 
     return render(request, 'blast.html', context)
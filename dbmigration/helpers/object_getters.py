@@ -2,10 +2,28 @@
 This module contains methods for retrieving objects based on legacy values.
 
 These helpers are meant for use while syncing to the legacy database.
+
+Sync steps call these getters for every legacy row (e.g. 96 library
+stocks per legacy plate), so objects are resolved from in-memory
+dictionaries rather than queried one at a time. Small tables (worm
+strains, score codes and users) are loaded whole on first use. For large
+tables, a missing object is loaded along with its neighbours (e.g. all
+stocks of its plate) in one query.
+
+Keys are compared as the production MySQL collation compares them,
+ignoring case and trailing spaces, so that legacy values resolve to the
+same objects as they did with QuerySet.get (e.g. the capitalized allele
+of experiment 32405).
+
+Misses are never cached, since steps add objects as they go. Cached
+objects are shared between callers, so must not be modified; call
+clear_object_caches to see changes made since they were loaded.
+sync_rows does so at the start of each legacy query.
 """
 
 from django.contrib.auth.models import User
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import MultipleObjectsReturned, ObjectDoesNotExist
+from django.db.models import Q
 
 from clones.models import Clone
 from experiments.models import Experiment, ExperimentPlate, ManualScoreCode
@@ -16,6 +34,133 @@ from utils.wells import get_three_character_well
 from worms.models import WormStrain
 
 
+class _Resolver(object):
+    """
+    Dictionary of objects, keyed on a value derived from legacy names.
+
+    get_key(object) gets the key of a loaded object. If load_all is
+    given, load_all() is loaded on first use. Keys still missing are
+    loaded with load_missing(key), which may return other objects too.
+    Keys shared by more than one loaded object are remembered as
+    ambiguous, and looking them up raises MultipleObjectsReturned.
+    """
+
+    def __init__(self, get_key, load_missing, load_all=None):
+        self.get_key = get_key
+        self.load_missing = load_missing
+        self.load_all = load_all
+        self.objects = None
+
+        # ambiguous[key] = name of the model with several objects at key
+        self.ambiguous = {}
+
+        _resolvers.append(self)
+
+    def get(self, key):
+        """Get the object with key, or None if there is none."""
+        if self.objects is None:
+            self.objects = {}
+            if self.load_all:
+                self._add(self.load_all())
+
+        normalized = _normalize_key(key)
+
+        if normalized not in self.objects and normalized not in self.ambiguous:
+            self._add(self.load_missing(key))
+
+        if normalized in self.ambiguous:
+            raise MultipleObjectsReturned(
+                'ERROR: more than one {} matches {} in the new database\n'
+                .format(self.ambiguous[normalized], key))
+
+        return self.objects.get(normalized)
+
+    def clear(self):
+        self.objects = None
+        self.ambiguous = {}
+
+    def _add(self, objects):
+        for obj in objects:
+            key = _normalize_key(self.get_key(obj))
+
+            if key in self.ambiguous:
+                continue
+
+            existing = self.objects.get(key)
+            if existing is not None and existing.pk != obj.pk:
+                del self.objects[key]
+                self.ambiguous[key] = type(obj).__name__
+            else:
+                self.objects[key] = obj
+
+
+def _normalize_key(key):
+    """Normalize key as MySQL compares it: no case, no trailing spaces."""
+    if isinstance(key, tuple):
+        return tuple(_normalize_key(x) for x in key)
+
+    if isinstance(key, basestring):
+        return key.rstrip(' ').lower()
+
+    return key
+
+
+_resolvers = []
+
+
+def clear_object_caches():
+    """Clear the objects cached by the getters in this module."""
+    for resolver in _resolvers:
+        resolver.clear()
+
+
+_clones = _Resolver(
+    get_key=lambda clone: clone.id,
+    load_missing=lambda key: Clone.objects.filter(id=key))
+
+_library_plates = _Resolver(
+    get_key=lambda plate: plate.id,
+    load_missing=lambda key: LibraryPlate.objects.filter(id=key))
+
+# Missing stocks are loaded with the rest of their plate (stock names
+# are the plate name, an underscore, and the well)
+_library_stocks = _Resolver(
+    get_key=lambda stock: stock.id,
+    load_missing=lambda key: LibraryStock.objects.filter(
+        Q(plate_id=key.rsplit('_', 1)[0]) | Q(id=key))
+    .select_related('intended_clone'))
+
+_worm_strains = _Resolver(
+    get_key=lambda strain: (strain.gene, strain.allele),
+    load_missing=lambda key: WormStrain.objects.filter(
+        gene=key[0], allele=key[1]),
+    load_all=WormStrain.objects.all)
+
+_worm_strains_by_id = _Resolver(
+    get_key=lambda strain: strain.id,
+    load_missing=lambda key: WormStrain.objects.filter(id=key),
+    load_all=WormStrain.objects.all)
+
+_experiment_plates = _Resolver(
+    get_key=lambda plate: plate.id,
+    load_missing=lambda key: ExperimentPlate.objects.filter(id=key))
+
+# Missing experiments are loaded with the rest of their plate
+_experiments = _Resolver(
+    get_key=lambda experiment: (experiment.plate_id, experiment.well),
+    load_missing=lambda key: Experiment.objects.filter(plate_id=key[0]))
+
+_score_codes = _Resolver(
+    get_key=lambda score_code: score_code.id,
+    load_missing=lambda key: ManualScoreCode.objects.filter(id=key),
+    load_all=ManualScoreCode.objects.all)
+
+_users = _Resolver(
+    get_key=lambda user: user.username,
+    load_missing=lambda key: User.objects.filter(username=key),
+    load_all=User.objects.all)
+
+
 def get_missing_object_message(klass, **kwargs):
     return ('ERROR: {} with {} not found in the new database\n'
             .format(klass, str(kwargs)))
@@ -23,88 +168,93 @@ def get_missing_object_message(klass, **kwargs):
 
 def get_clone(clone_name):
     """Get a clone from its clone name."""
-    try:
-        return Clone.objects.get(id=clone_name)
+    clone = _clones.get(clone_name)
 
-    except ObjectDoesNotExist:
+    if clone is None:
         raise ObjectDoesNotExist(get_missing_object_message(
             'Clone', id=clone_name))
 
+    return clone
+
 
 def get_library_plate(legacy_plate_name):
     """Get a library plate from a legacy library plate name."""
     legacy_plate_name = generate_library_plate_name(legacy_plate_name)
 
-    try:
-        return LibraryPlate.objects.get(id=legacy_plate_name)
+    library_plate = _library_plates.get(legacy_plate_name)
 
-    except ObjectDoesNotExist:
+    if library_plate is None:
         raise ObjectDoesNotExist(get_missing_object_message(
             'LibraryPlate', id=legacy_plate_name))
 
+    return library_plate
+
 
 def get_library_stock(legacy_plate_name, well):
     """Get a library well from its legacy plate name and well."""
     library_stock_name = generate_library_stock_name(legacy_plate_name, well)
+    library_stock = _library_stocks.get(library_stock_name)
 
-    try:
-        return LibraryStock.objects.get(id=library_stock_name)
-
-    except ObjectDoesNotExist:
+    if library_stock is None:
         raise ObjectDoesNotExist(get_missing_object_message(
             'LibraryStock', id=library_stock_name))
 
+    return library_stock
+
 
 def get_worm_strain(mutant, mutantAllele):
     """Get a worm strain from its mutant gene and mutant allele."""
-    try:
-        if mutant == 'N2':
-            worm_strain = WormStrain.objects.get(id='N2')
-
-        else:
-            if mutantAllele == 'zc310':
-                mutantAllele = 'zu310'
+    if mutant == 'N2':
+        worm_strain = _worm_strains_by_id.get('N2')
 
-            worm_strain = WormStrain.objects.get(gene=mutant,
-                                                 allele=mutantAllele)
+    else:
+        if mutantAllele == 'zc310':
+            mutantAllele = 'zu310'
 
-        return worm_strain
+        worm_strain = _worm_strains.get((mutant, mutantAllele))
 
-    except ObjectDoesNotExist:
+    if worm_strain is None:
         raise ObjectDoesNotExist(get_missing_object_message(
             'WormStrain', gene=mutant, allele=mutantAllele))
 
+    return worm_strain
+
 
 def get_experiment_plate(experiment_plate_id):
     """Get an experiment plate from its id."""
-    try:
-        return ExperimentPlate.objects.get(id=experiment_plate_id)
+    experiment_plate = _experiment_plates.get(
+        ExperimentPlate._meta.pk.to_python(experiment_plate_id))
 
-    except ObjectDoesNotExist:
+    if experiment_plate is None:
         raise ObjectDoesNotExist(get_missing_object_message(
             'ExperimentPlate', id=experiment_plate_id))
 
+    return experiment_plate
+
 
 def get_experiment(experiment_plate_id, well):
-    try:
-        return Experiment.objects.get(
-            plate_id=experiment_plate_id,
-            well=get_three_character_well(well))
+    experiment = _experiments.get(
+        (ExperimentPlate._meta.pk.to_python(experiment_plate_id),
+         get_three_character_well(well)))
 
-    except ObjectDoesNotExist:
+    if experiment is None:
         raise ObjectDoesNotExist(get_missing_object_message(
             'Experiment', plate_id=experiment_plate_id, well=well))
 
+    return experiment
+
 
 def get_score_code(score_code_id):
     """Get a score code from its id."""
-    try:
-        return ManualScoreCode.objects.get(id=score_code_id)
+    score_code = _score_codes.get(
+        ManualScoreCode._meta.pk.to_python(score_code_id))
 
-    except ObjectDoesNotExist:
+    if score_code is None:
         raise ObjectDoesNotExist(get_missing_object_message(
             'ManualScoreCode', id=score_code_id))
 
+    return score_code
+
 
 def get_user(legacy_username):
     """Get a user from its username."""
@@ -113,8 +263,10 @@ def get_user(legacy_username):
     if legacy_username == 'patricia':
         legacy_username = 'giselle'
 
-    try:
-        return User.objects.get(username=legacy_username)
-    except ObjectDoesNotExist:
+    user = _users.get(legacy_username)
+
+    if user is None:
         raise ObjectDoesNotExist(get_missing_object_message(
             'User', username=legacy_username))
+
+    return user
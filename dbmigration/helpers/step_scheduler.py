@@ -0,0 +1,103 @@
+"""
+This module contains a scheduler to run dependent steps in parallel.
+
+Each step is run in its own process (so with its own database
+connections), as soon as the steps it depends on are done, with at most
+a given number of steps running at once. The total time is therefore
+bounded by the slowest chain of dependent steps, rather than the sum of
+all steps.
+"""
+
+from multiprocessing import Pool
+import time
+
+from django.db import connections
+
+# Seconds between checks for finished steps
+POLL_SECONDS = 0.5
+
+
+def run_steps_in_parallel(steps, dependencies, function, jobs, args=(),
+                          on_done=None):
+    """
+    Run function(step, *args) for each of steps, in up to jobs processes.
+
+    dependencies[step] are the steps that must finish before step
+    starts. Dependencies not in steps are assumed to be done already.
+
+    function must be picklable, i.e. defined at module level. When a
+    step finishes, on_done(step, result) is called in this process.
+    If a step raises an exception, no further steps are started, and
+    the exception is raised once the running steps are stopped.
+
+    Returns a dictionary of step to result.
+    """
+    steps = list(steps)
+    pending = list(steps)
+    running = {}
+    results = {}
+
+    # Processes must not share this process's database connections
+    connections.close_all()
+
+    # A fresh process per step, so each step opens its own connections
+    pool = Pool(jobs, maxtasksperchild=1)
+
+    try:
+        while pending or running:
+            for step in list(pending):
+                if len(running) >= jobs:
+                    break
+
+                if all(dependency in results or dependency not in steps
+                       for dependency in dependencies.get(step, ())):
+                    pending.remove(step)
+                    running[step] = pool.apply_async(function,
+                                                     (step,) + args)
+
+            if not running:
+                raise ValueError('Steps {} have circular dependencies'
+                                 .format(pending))
+
+            time.sleep(POLL_SECONDS)
+
+            for step, result in running.items():
+                if result.ready():
+                    del running[step]
+
+                    # Raises the step's exception, if any
+                    results[step] = result.get()
+
+                    if on_done:
+                        on_done(step, results[step])
+
+        pool.close()
+
+    except BaseException:
+        pool.terminate()
+        raise
+
+    finally:
+        pool.join()
+
+    return results
+
+
+def get_critical_path_seconds(durations, dependencies):
+    """
+    Get the duration of the slowest chain of dependent steps.
+
+    durations[step] is the time the step took. Dependencies not in
+    durations are ignored.
+    """
+    finished = {}
+
+    def get_finish(step):
+        if step not in finished:
+            finished[step] = durations[step] + max(
+                [get_finish(dependency)
+                 for dependency in dependencies.get(step, ())
+                 if dependency in durations] or [0])
+        return finished[step]
+
+    return max([get_finish(step) for step in durations] or [0])
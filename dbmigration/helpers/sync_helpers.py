@@ -1,27 +1,122 @@
 """
 This module contains helpers for the sync_legacy_database command.
 
-For example, there are functions to sync sets of rows, and to sync
-individual objects.
+For example, there is a function to sync sets of rows, and TableSync
+to diff objects against a table and apply the differences in bulk.
 """
 
-from django.core.exceptions import ObjectDoesNotExist
+import fcntl
+import hashlib
+import json
+import os
+
+from django.core.management.base import CommandError
+from django.db import transaction
+
+from dbmigration.helpers.object_getters import clear_object_caches
 from utils.comparison import compare_values_for_equality
+from utils.sql import bulk_update
+
+# Number of legacy rows to fetch and sync per transaction
+CHUNK_SIZE = 1000
 
+# Number of objects to add or update per query
+BATCH_SIZE = 1000
 
-def sync_rows(command, cursor, legacy_query, sync_row_function, **kwargs):
+
+def sync_rows(command, cursor, legacy_query, sync_row_function,
+              table_syncs=(), **kwargs):
     """
     Sync rows resulting from legacy database query to the new database.
 
     Syncs according to sync_row_function(single_legacy_row, **kwargs).
+
+    Legacy rows are streamed from cursor in chunks of CHUNK_SIZE, so
+    the whole result is never held in memory (cursor should be
+    unbuffered, i.e. server-side). Each chunk is synced in its own
+    transaction, after which table_syncs are flushed.
+
+    If the command has checkpoints, the last row of each chunk is
+    recorded after the chunk is committed, and a query that was
+    interrupted resumes after that row. The query must therefore have
+    an ORDER BY on all of its columns, so that only identical rows can
+    tie (these are synced again on resuming, which is harmless).
+    Checkpointing a query without an ORDER BY raises CommandError, as
+    does resuming a query whose recorded row is no longer returned.
+
+    The object getters' caches are cleared first, so that objects
+    added by previous queries are seen.
+
+    The number of legacy rows read is added to
+    command.num_legacy_rows, if it is defined.
     """
+    checkpoints = getattr(command, 'checkpoints', None)
+
+    if checkpoints:
+        if 'ORDER BY' not in legacy_query.upper():
+            raise CommandError(
+                'Legacy query:\n\n\t{}\n\nhas no ORDER BY, so cannot be '
+                'resumed from a checkpoint'.format(legacy_query))
+
+        last_key, is_complete = checkpoints.get(legacy_query)
+
+    else:
+        last_key, is_complete = None, False
+
+    if is_complete:
+        command.stdout.write(
+            'Skipping legacy query:\n\n\t{}\n\n'
+            'which was already synced according to the checkpoint file.\n\n'
+            .format(legacy_query))
+        return
+
+    # Objects added or changed by previous queries must be seen
+    clear_object_caches()
+
     cursor.execute(legacy_query)
-    legacy_rows = cursor.fetchall()
+    num_rows = 0
     all_match = True
 
-    for legacy_row in legacy_rows:
-        matches = sync_row_function(legacy_row, **kwargs)
-        all_match &= matches
+    # Skip rows synced before an interruption, up to and including the
+    # last one recorded
+    is_resuming = last_key is not None
+
+    while True:
+        legacy_rows = cursor.fetchmany(CHUNK_SIZE)
+        if not legacy_rows:
+            break
+
+        num_rows += len(legacy_rows)
+        num_synced = 0
+
+        with transaction.atomic():
+            for legacy_row in legacy_rows:
+                if is_resuming:
+                    if _get_row_key(legacy_row) == last_key:
+                        is_resuming = False
+                    continue
+
+                matches = sync_row_function(legacy_row, **kwargs)
+                all_match &= matches
+                num_synced += 1
+
+            for table_sync in table_syncs:
+                table_sync.flush()
+
+        if checkpoints and num_synced:
+            checkpoints.save(legacy_query, _get_row_key(legacy_rows[-1]))
+
+    if is_resuming:
+        raise CommandError(
+            'Legacy query:\n\n\t{}\n\nno longer returns the last row '
+            'recorded in its checkpoint; delete the checkpoint file to '
+            'sync from scratch'.format(legacy_query))
+
+    if checkpoints:
+        checkpoints.save(legacy_query, None, is_complete=True)
+
+    if hasattr(command, 'num_legacy_rows'):
+        command.num_legacy_rows += num_rows
 
     if all_match:
         command.stdout.write(
@@ -37,75 +132,260 @@ def sync_rows(command, cursor, legacy_query, sync_row_function, **kwargs):
             .format(legacy_query))
 
 
-def update_or_save_object(command, new_object, recorded_objects,
-                          fields_to_compare, alternate_pk=False):
-    """
-    Update the database to represent new_object.
+def _get_row_key(legacy_row):
+    """Get a string identifying a legacy row, to record checkpoints."""
+    return repr(tuple(legacy_row))
 
-    If new_object is not present in the database, add it (and print
-    warning to syserr).
 
-    If new_object is already present in the database (according to
-    alternate_pk if specified, pk otherwise), compare the provided
-    fields_to_compare. If any of these fields do not match, update them
-    (and print updates to syserr).
+class SyncCheckpoints(object):
+    """
+    Record of how far each legacy query has been synced.
+
+    Saved as a JSON file at path, keyed on the query. For each query,
+    records the last row synced, and whether the query is complete.
 
-    Returns True if new_object was already present and matched
-    on all provided fields. Returns False otherwise.
+    Several processes may share the file, as long as they sync
+    different queries: each save locks the file and merges in the
+    latest checkpoints of the other processes.
     """
-    try:
-        if alternate_pk:
-            recorded_object = recorded_objects.get(**alternate_pk)
-        else:
-            recorded_object = recorded_objects.get(pk=new_object.pk)
 
-        if fields_to_compare:
-            return compare_fields(command, recorded_object, new_object,
-                                  fields_to_compare, update=True)
+    def __init__(self, path):
+        self.path = path
+
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.checkpoints = json.load(f)
         else:
-            return True
+            self.checkpoints = {}
 
-    except ObjectDoesNotExist:
-        new_object.save()
-        command.stderr.write('Added new record {} to the database\n'
-                             .format(str(new_object)))
-        return False
+    def get(self, legacy_query):
+        """Get (last_key, is_complete) for legacy_query."""
+        checkpoint = self.checkpoints.get(_get_query_key(legacy_query))
+
+        if not checkpoint:
+            return (None, False)
+
+        return (checkpoint['last_key'], checkpoint['is_complete'])
+
+    def save(self, legacy_query, last_key, is_complete=False):
+        query_key = _get_query_key(legacy_query)
+        checkpoint = {
+            'last_key': last_key,
+            'is_complete': is_complete,
+        }
+
+        with open(self.path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    self.checkpoints = json.load(f)
+
+            self.checkpoints[query_key] = checkpoint
+
+            # Write to a temporary file first, so an interruption cannot
+            # leave a partial file
+            temporary = self.path + '.tmp'
+            with open(temporary, 'w') as f:
+                json.dump(self.checkpoints, f, indent=2, sort_keys=True)
+            os.rename(temporary, self.path)
+
+
+def _get_query_key(legacy_query):
+    return hashlib.sha1(legacy_query).hexdigest()
 
 
-def compare_fields(command, old_object, new_object, fields, update=False):
+class TableSync(object):
     """
-    Compare two objects on the provided fields.
+    Sync objects built from legacy rows to one table of the new database.
 
-    Any differences are printed to stderr.
+    Rather than querying the new database once per object, the key and
+    fields_to_compare of every recorded object are loaded once into a
+    dictionary, and each new object is diffed against it in memory.
+    Objects not yet recorded are added with bulk_create, and changed
+    fields are applied with batched updates, whenever batch_size
+    objects are pending and when flush() is called.
 
-    If 'update' is True, old_object is updated to match
-    new_object on these fields.
+    Objects are keyed on key_fields if specified (like an alternate
+    pk), and on pk otherwise.
+
+    depends_on are other TableSyncs that must be flushed before this
+    one, e.g. for the rows this table has foreign keys to.
+
+    If on_flush is specified, on_flush(objects) is called with the
+    objects added or changed since the last flush, in the same
+    transaction as the writes. Since bulk_create and update send no
+    signals, use this to maintain any data derived from this table.
+
+    Additions and changes are printed to stderr. If the command has a
+    diff_file, they are also written there, one JSON object per line.
     """
-    differences = []
-    for field in fields:
-        if not compare_values_for_equality(getattr(old_object, field),
-                                           getattr(new_object, field)):
-            differences.append('{} previously recorded as {}, '
-                               'now {}'
-                               .format(field,
-                                       str(getattr(old_object, field)),
-                                       str(getattr(new_object, field))))
-            if update:
-                setattr(old_object, field, getattr(new_object, field))
-                old_object.save()
-
-    if differences:
-        command.stderr.write(
+
+    def __init__(self, command, model, fields_to_compare=None,
+                 key_fields=None, depends_on=(), batch_size=BATCH_SIZE,
+                 on_flush=None):
+        self.command = command
+        self.model = model
+        self.fields = [model._meta.get_field(field)
+                       for field in fields_to_compare or ()]
+
+        if key_fields:
+            self.key_fields = [model._meta.get_field(field)
+                               for field in key_fields]
+        else:
+            self.key_fields = [model._meta.pk]
+
+        self.depends_on = depends_on
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.diff_file = getattr(command, 'diff_file', None)
+
+        # _recorded[key] = [pk, values], with values as in self.fields
+        self._recorded = None
+        self._to_create = []
+        self._to_update = {}
+        self._changed_objects = []
+
+    def sync(self, new_object):
+        """
+        Sync new_object to the database.
+
+        If new_object is not present in the database (according to the
+        key), it is added. Otherwise, the fields to compare are
+        compared, and any that differ are updated.
+
+        Returns True if new_object was already present and matched
+        on all fields to compare. Returns False otherwise.
+        """
+        if self._recorded is None:
+            self._load()
+
+        key = self._get_key(new_object)
+
+        try:
+            pk, values = self._recorded[key]
+
+        except KeyError:
+            self._add(key, new_object)
+            return False
+
+        differences = []
+        changes = {}
+
+        for i, field in enumerate(self.fields):
+            new_value = getattr(new_object, field.attname)
+
+            if not compare_values_for_equality(values[i], new_value):
+                differences.append('{} previously recorded as {}, now {}'
+                                   .format(field.name, str(values[i]),
+                                           str(new_value)))
+                changes[field.attname] = (values[i], new_value)
+                values[i] = new_value
+
+        if not differences:
+            return True
+
+        self.command.stderr.write(
             'WARNING: Record {} had these changes: {}\n'
-            .format(str(new_object), str([d for d in differences])))
+            '\tThe database was updated to reflect the changes\n\n'
+            .format(str(new_object), str(differences)))
+        self._write_diff('change', key, changes)
+        self._changed_objects.append(new_object)
+
+        if pk is None:
+            # Added during this sync, with an auto-increment pk
+            self._update_added(key, changes)
 
-        if update:
-            command.stderr.write(
-                '\tThe database was updated to reflect the changes\n\n')
         else:
-            command.stderr.write(
-                '\tThe database was NOT updated to reflect the changes\n\n')
+            updates = self._to_update.setdefault(pk, {})
+            for attname, (old, new) in changes.iteritems():
+                updates[attname] = new
+
+            if len(self._to_update) >= self.batch_size:
+                self.flush()
+
         return False
 
-    else:
-        return True
+    def flush(self):
+        """Apply all pending additions and changes to the database."""
+        for other in self.depends_on:
+            other.flush()
+
+        with transaction.atomic():
+            if self._to_create:
+                self.model.objects.bulk_create(self._to_create,
+                                               batch_size=self.batch_size)
+
+            self._apply_updates()
+
+            if self.on_flush and self._changed_objects:
+                self.on_flush(self._changed_objects)
+
+        self._to_create = []
+        self._to_update = {}
+        self._changed_objects = []
+
+    def _load(self):
+        key_attnames = [field.attname for field in self.key_fields]
+        attnames = [field.attname for field in self.fields]
+        num_keys = len(key_attnames)
+
+        self._recorded = {}
+
+        rows = (self.model.objects
+                .values_list(*(key_attnames + ['pk'] + attnames))
+                .order_by()
+                .iterator())
+
+        for row in rows:
+            self._recorded[row[:num_keys]] = [row[num_keys],
+                                              list(row[num_keys + 1:])]
+
+    def _get_key(self, new_object):
+        return tuple(getattr(new_object, field.attname)
+                     for field in self.key_fields)
+
+    def _add(self, key, new_object):
+        self._recorded[key] = [
+            new_object.pk,
+            [getattr(new_object, field.attname) for field in self.fields]]
+        self._to_create.append(new_object)
+        self._changed_objects.append(new_object)
+
+        self.command.stderr.write('Added new record {} to the database\n'
+                                  .format(str(new_object)))
+        self._write_diff('add', key, {
+            field.attname: (None, getattr(new_object, field.attname))
+            for field in self.fields})
+
+        if len(self._to_create) >= self.batch_size:
+            self.flush()
+
+    def _update_added(self, key, changes):
+        """Apply changes to an object added during this sync."""
+        for pending in self._to_create:
+            if self._get_key(pending) == key:
+                for attname, (old, new) in changes.iteritems():
+                    setattr(pending, attname, new)
+                return
+
+        # Already created, so its pk is unknown; update it by key
+        key_filters = {field.attname: value
+                       for field, value in zip(self.key_fields, key)}
+        self.model.objects.filter(**key_filters).update(**{
+            attname: new for attname, (old, new) in changes.iteritems()})
+
+    def _apply_updates(self):
+        """Apply the pending changes, with one UPDATE per field per batch."""
+        bulk_update(self.model, self._to_update, self.batch_size)
+
+    def _write_diff(self, action, key, changes):
+        if not self.diff_file:
+            return
+
+        self.diff_file.write(json.dumps({
+            'model': self.model._meta.label,
+            'action': action,
+            'key': key,
+            'changes': changes,
+        }, default=str) + '\n')
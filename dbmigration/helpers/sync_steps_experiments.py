@@ -10,14 +10,14 @@ from django.core.management.base import CommandError
 
 
 from dbmigration.helpers.object_getters import (
-    get_experiment, get_experiment_plate,
-    get_worm_strain, get_library_stock, get_score_code, get_user)
-from dbmigration.helpers.sync_helpers import (
-    sync_rows, update_or_save_object)
+    get_experiment, get_worm_strain, get_library_stock, get_score_code,
+    get_user)
+from dbmigration.helpers.sync_helpers import TableSync, sync_rows
 
 from experiments.helpers.naming import generate_experiment_id
 from experiments.models import (Experiment, ExperimentPlate, DevstarScore,
-                                ManualScoreCode, ManualScore)
+                                ManualScoreCode, ManualScore,
+                                ManualScoreSummary)
 from utils.comparison import compare_floats_for_equality
 from utils.plates import get_well_list
 from utils.time_conversion import get_timestamp, get_timestamp_from_ymd
@@ -41,15 +41,16 @@ def update_Experiment_tables(command, cursor):
     Also, experiments of Julie's (which were done with a line of spn-4 worms
     later deemed untrustworthy) are excluded.
     """
-    recorded_plates = ExperimentPlate.objects.all()
-    recorded_wells = Experiment.objects.all()
-
     plate_fields_to_compare = ('screen_stage', 'temperature', 'date',
                                'comment')
 
     well_fields_to_compare = ('plate', 'well', 'worm_strain',
                               'library_stock', 'is_junk')
 
+    plates = TableSync(command, ExperimentPlate, plate_fields_to_compare)
+    wells = TableSync(command, Experiment, well_fields_to_compare,
+                      depends_on=[plates])
+
     legacy_query = ('SELECT expID, mutant, mutantAllele, RNAiPlateID, '
                     'CAST(SUBSTRING_INDEX(temperature, "C", 1) '
                     'AS DECIMAL(3,1)), '
@@ -57,7 +58,8 @@ def update_Experiment_tables(command, cursor):
                     'FROM RawData '
                     'WHERE (expID < 40000 OR expID >= 50000) '
                     'AND RNAiPlateID NOT LIKE "Julie%" '
-                    'ORDER BY expID')
+                    'ORDER BY expID, mutant, mutantAllele, RNAiPlateID, '
+                    'temperature, recordDate, isJunk, comment')
 
     def sync_experiment_row(legacy_row):
         experiment_plate_id = legacy_row[0]
@@ -82,27 +84,23 @@ def update_Experiment_tables(command, cursor):
             date=date,
             comment=comment)
 
-        all_match &= update_or_save_object(
-            command, new_plate, recorded_plates, plate_fields_to_compare)
-
-        experiment_plate = get_experiment_plate(experiment_plate_id)
+        all_match &= plates.sync(new_plate)
 
         for well in get_well_list():
             new_well = Experiment(
                 id=generate_experiment_id(experiment_plate_id, well),
-                plate=experiment_plate, well=well,
+                plate=new_plate, well=well,
                 worm_strain=worm_strain,
                 library_stock=get_library_stock(
                     legacy_library_plate_name, well),
                 is_junk=is_junk)
 
-            all_match &= update_or_save_object(
-                command, new_well, recorded_wells,
-                well_fields_to_compare)
+            all_match &= wells.sync(new_well)
 
         return all_match
 
-    sync_rows(command, cursor, legacy_query, sync_experiment_row)
+    sync_rows(command, cursor, legacy_query, sync_experiment_row,
+              table_syncs=[wells])
 
 
 def update_DevstarScore_table(command, cursor):
@@ -126,8 +124,6 @@ def update_DevstarScore_table(command, cursor):
           adult=0 we DO now calculate survival and lethality
         - machineCall becomes a Boolean
     """
-    recorded_scores = DevstarScore.objects.all()
-
     fields_to_compare = ('area_adult', 'area_larva', 'area_embryo',
                          'count_adult', 'count_larva', 'is_bacteria_present',
                          'count_embryo', 'larva_per_adult',
@@ -135,6 +131,9 @@ def update_DevstarScore_table(command, cursor):
                          'selected_for_scoring', 'gi_score_larva_per_adult',
                          'gi_score_survival')
 
+    scores = TableSync(command, DevstarScore, fields_to_compare,
+                       key_fields=('experiment',))
+
     legacy_query = ('SELECT expID, 96well, '
                     'mutantAllele, targetRNAiClone, RNAiPlateID, '
                     'areaWorm, areaLarvae, areaEmbryo, '
@@ -145,7 +144,13 @@ def update_DevstarScore_table(command, cursor):
                     'FROM RawDataWithScore '
                     'WHERE (expID < 40000 OR expID >= 50000) '
                     'AND RNAiPlateID NOT LIKE "Julie%" '
-                    'ORDER BY expID, 96well')
+                    'ORDER BY expID, 96well, '
+                    'mutantAllele, targetRNAiClone, RNAiPlateID, '
+                    'areaWorm, areaLarvae, areaEmbryo, '
+                    'AdultCount, LarvaeCount, EggCount, '
+                    'EggPerWorm, LarvaePerWorm, survival, lethality, '
+                    'machineCall, machineDetectBac, '
+                    'GIscoreLarvaePerWorm, GIscoreSurvival')
 
     def sync_score_row(legacy_row):
         # Build the object using the minimimum fields
@@ -243,11 +248,10 @@ def update_DevstarScore_table(command, cursor):
                 'DevstarScore for {}:{} had these errors: {}'
                 .format(legacy_row[0], legacy_row[1], errors))
 
-        return update_or_save_object(
-            command, new_score, recorded_scores, fields_to_compare,
-            alternate_pk={'experiment': new_score.experiment})
+        return scores.sync(new_score)
 
-    sync_rows(command, cursor, legacy_query, sync_score_row)
+    sync_rows(command, cursor, legacy_query, sync_score_row,
+              table_syncs=[scores])
 
 
 def update_ManualScoreCode_table(command, cursor):
@@ -270,22 +274,23 @@ def update_ManualScoreCode_table(command, cursor):
     - Migrate these antiquated codes, but do not show in interface:
         -5: IA Error
     """
-    recorded_score_codes = ManualScoreCode.objects.all()
     fields_to_compare = ('legacy_description',)
+    score_codes = TableSync(command, ManualScoreCode, fields_to_compare)
 
     legacy_query = ('SELECT code, definition FROM ManualScoreCode '
                     'WHERE code != -8 AND code != -1 AND code != 4 '
-                    'AND code != 5 AND code != 6 AND code != -6')
+                    'AND code != 5 AND code != 6 AND code != -6 '
+                    'ORDER BY code, definition')
 
     def sync_score_code_row(legacy_row):
         new_score_code = ManualScoreCode(
             id=legacy_row[0],
             legacy_description=legacy_row[1].decode('utf8'))
 
-        return update_or_save_object(
-            command, new_score_code, recorded_score_codes, fields_to_compare)
+        return score_codes.sync(new_score_code)
 
-    sync_rows(command, cursor, legacy_query, sync_score_code_row)
+    sync_rows(command, cursor, legacy_query, sync_score_code_row,
+              table_syncs=[score_codes])
 
 
 def update_ManualScore_table_primary(command, cursor):
@@ -326,8 +331,10 @@ def update_ManualScore_table_primary(command, cursor):
         - for sherly and patricia's ENH scores, ensure that any medium or
           strong enhancers were caught by official scorers
     """
-    recorded_scores = ManualScore.objects.all()
-    fields_to_compare = None
+    scores = TableSync(
+        command, ManualScore,
+        key_fields=('experiment', 'score_code', 'scorer', 'timestamp'),
+        on_flush=ManualScoreSummary.refresh_for_scores)
 
     legacy_query = ('SELECT ManualScore.expID, ImgName, score, scoreBy, '
                     'scoreYMD, ScoreYear, ScoreMonth, ScoreDate, '
@@ -337,7 +344,9 @@ def update_ManualScore_table_primary(command, cursor):
                     'ON ManualScore.expID = RawData.expID '
                     'WHERE score != -8 AND score != -1 AND score != 4 '
                     'AND score != 5 AND score != 6 '
-                    'ORDER BY ManualScore.expID, ImgName')
+                    'ORDER BY ManualScore.expID, ImgName, score, '
+                    'scoreBy, scoreYMD, ScoreYear, ScoreMonth, ScoreDate, '
+                    'ScoreTime, mutant, screenFor')
 
     def sync_score_row(legacy_row):
         legacy_score_code = legacy_row[2]
@@ -389,23 +398,22 @@ def update_ManualScore_table_primary(command, cursor):
             scorer=scorer,
             timestamp=timestamp)
 
-        return update_or_save_object(
-            command, new_score, recorded_scores, fields_to_compare,
-            alternate_pk={'experiment': new_score.experiment,
-                          'score_code': new_score.score_code,
-                          'scorer': new_score.scorer,
-                          'timestamp': new_score.timestamp})
+        return scores.sync(new_score)
 
-    sync_rows(command, cursor, legacy_query, sync_score_row)
+    sync_rows(command, cursor, legacy_query, sync_score_row,
+              table_syncs=[scores])
 
 
 def update_ManualScore_table_secondary(command, cursor):
-    recorded_scores = ManualScore.objects.all()
-    fields_to_compare = None
+    scores = TableSync(
+        command, ManualScore,
+        key_fields=('experiment', 'score_code', 'scorer', 'timestamp'),
+        on_flush=ManualScoreSummary.refresh_for_scores)
     legacy_query = ('SELECT expID, ImgName, score, '
                     'scoreBy, scoreYMD, ScoreTime '
                     'FROM ScoreResultsManual '
-                    'ORDER BY expID, ImgName')
+                    'ORDER BY expID, ImgName, score, '
+                    'scoreBy, scoreYMD, ScoreTime')
 
     def sync_score_row(legacy_row):
         legacy_score_code = legacy_row[2]
@@ -427,11 +435,7 @@ def update_ManualScore_table_secondary(command, cursor):
             scorer=scorer,
             timestamp=timestamp)
 
-        return update_or_save_object(
-            command, new_score, recorded_scores, fields_to_compare,
-            alternate_pk={'experiment': new_score.experiment,
-                          'score_code': new_score.score_code,
-                          'scorer': new_score.scorer,
-                          'timestamp': new_score.timestamp})
+        return scores.sync(new_score)
 
-    sync_rows(command, cursor, legacy_query, sync_score_row)
+    sync_rows(command, cursor, legacy_query, sync_score_row,
+              table_syncs=[scores])
@@ -14,8 +14,7 @@ from clones.helpers.naming import generate_vidal_clone_name
 from clones.models import Clone
 from dbmigration.helpers.object_getters import (
     get_clone, get_library_stock, get_library_plate)
-from dbmigration.helpers.sync_helpers import (
-    sync_rows, update_or_save_object)
+from dbmigration.helpers.sync_helpers import TableSync, sync_rows
 from library.helpers.naming import (
     generate_ahringer_384_plate_name, generate_library_plate_name,
     generate_library_stock_name)
@@ -36,29 +35,30 @@ def update_Clone_table(command, cursor):
     (note that we are no longer using the 'mv_X'-style Vidal clone names,
     and our PK for Vidal clones will now be in 'GHR-X@X' style).
     """
-    recorded_clones = Clone.objects.all()
-    fields_to_compare = None
+    clones = TableSync(command, Clone)
 
     legacy_query = ('SELECT DISTINCT clone FROM RNAiPlate '
-                    'WHERE clone LIKE "sjj%" OR clone = "L4440"')
+                    'WHERE clone LIKE "sjj%" OR clone = "L4440" '
+                    'ORDER BY clone')
 
     def sync_clone_row(legacy_row):
         new_clone = Clone(id=legacy_row[0])
-        return update_or_save_object(command, new_clone, recorded_clones,
-                                     fields_to_compare)
+        return clones.sync(new_clone)
 
     legacy_query_vidal = ('SELECT DISTINCT 384PlateID, 384Well FROM RNAiPlate '
-                          'WHERE clone LIKE "mv%"')
+                          'WHERE clone LIKE "mv%" '
+                          'ORDER BY 384PlateID, 384Well')
 
     def sync_clone_row_vidal(legacy_row):
         vidal_clone_name = generate_vidal_clone_name(legacy_row[0],
                                                      legacy_row[1])
         new_clone = Clone(id=vidal_clone_name)
-        return update_or_save_object(command, new_clone, recorded_clones,
-                                     fields_to_compare)
+        return clones.sync(new_clone)
 
-    sync_rows(command, cursor, legacy_query, sync_clone_row)
-    sync_rows(command, cursor, legacy_query_vidal, sync_clone_row_vidal)
+    sync_rows(command, cursor, legacy_query, sync_clone_row,
+              table_syncs=[clones])
+    sync_rows(command, cursor, legacy_query_vidal, sync_clone_row_vidal,
+              table_syncs=[clones])
 
 
 def update_LibraryPlate_table(command, cursor):
@@ -84,33 +84,39 @@ def update_LibraryPlate_table(command, cursor):
     separating the primary and secondary screens into two tables, we have
     the same L4440 plate listed in both tables in the legacy database).
     """
-    recorded_plates = LibraryPlate.objects.all()
     fields_to_compare = ('screen_stage', 'number_of_wells')
+    plates = TableSync(command, LibraryPlate, fields_to_compare)
 
     legacy_query_384_plates = ('SELECT DISTINCT chromosome, 384PlateID '
                                'FROM RNAiPlate '
                                'WHERE 384PlateID NOT LIKE "GHR-%" '
-                               'AND 384PlateID != 0')
+                               'AND 384PlateID != 0 '
+                               'ORDER BY chromosome, 384PlateID')
 
     legacy_query_orfeome_plates = ('SELECT DISTINCT 384PlateID '
                                    'FROM RNAiPlate '
-                                   'WHERE 384PlateID LIKE "GHR-%"')
+                                   'WHERE 384PlateID LIKE "GHR-%" '
+                                   'ORDER BY 384PlateID')
 
     legacy_query_l4440_plate = ('SELECT DISTINCT RNAiPlateID '
                                 'FROM RNAiPlate '
-                                'WHERE RNAiPlateID = "L4440"')
+                                'WHERE RNAiPlateID = "L4440" '
+                                'ORDER BY RNAiPlateID')
 
     legacy_query_primary_plates = ('SELECT DISTINCT RNAiPlateID '
                                    'FROM RNAiPlate '
-                                   'WHERE RNAiPlateID != "L4440"')
+                                   'WHERE RNAiPlateID != "L4440" '
+                                   'ORDER BY RNAiPlateID')
 
     legacy_query_eliana_rearrays = ('SELECT DISTINCT RNAiPlateID FROM '
                                     'ReArrayRNAiPlate WHERE RNAiPlateID '
-                                    'LIKE "Eliana%"')
+                                    'LIKE "Eliana%" '
+                                    'ORDER BY RNAiPlateID')
 
     legacy_query_secondary_plates = ('SELECT DISTINCT RNAiPlateID '
                                      'FROM CherryPickRNAiPlate '
-                                     'WHERE RNAiPlateID != "L4440"')
+                                     'WHERE RNAiPlateID != "L4440" '
+                                     'ORDER BY RNAiPlateID')
 
     def sync_library_plate_row(legacy_row, screen_stage=None,
                                number_of_wells=96):
@@ -123,37 +129,36 @@ def update_LibraryPlate_table(command, cursor):
         new_plate = LibraryPlate(id=plate_name, screen_stage=screen_stage,
                                  number_of_wells=number_of_wells)
 
-        return update_or_save_object(command, new_plate, recorded_plates,
-                                     fields_to_compare)
+        return plates.sync(new_plate)
 
     # Sync the 384-well Ahringer plates from which our 96-well Ahringer plates
     # were arrayed
     sync_rows(command, cursor, legacy_query_384_plates,
-              sync_library_plate_row, screen_stage=0,
+              sync_library_plate_row, table_syncs=[plates], screen_stage=0,
               number_of_wells=384)
 
     # Sync the 96-well Orfeome plates from which our 96-well Vidal rearrays
     # were cherry-picked
     sync_rows(command, cursor, legacy_query_orfeome_plates,
-              sync_library_plate_row, screen_stage=0)
+              sync_library_plate_row, table_syncs=[plates], screen_stage=0)
 
     # Sync the L4440 plate used in both Primary and Seconday experiments
     sync_rows(command, cursor, legacy_query_l4440_plate,
-              sync_library_plate_row)
+              sync_library_plate_row, table_syncs=[plates])
 
     # Sync the 96-well plates used in our Primary experiments (includes
     # Ahringer plates and Vidal plates)
     sync_rows(command, cursor, legacy_query_primary_plates,
-              sync_library_plate_row, screen_stage=1)
+              sync_library_plate_row, table_syncs=[plates], screen_stage=1)
 
     # Sync the 96-well "Eliana Rearray" plates, which tried to salvage wells
     # that did not grow consistently in the other primary screen plates
     sync_rows(command, cursor, legacy_query_eliana_rearrays,
-              sync_library_plate_row, screen_stage=1)
+              sync_library_plate_row, table_syncs=[plates], screen_stage=1)
 
     # Sync the 96-well plates used for our Secondary experiments
     sync_rows(command, cursor, legacy_query_secondary_plates,
-              sync_library_plate_row, screen_stage=2)
+              sync_library_plate_row, table_syncs=[plates], screen_stage=2)
 
 
 def update_LibraryStock_table(command, cursor):
@@ -164,9 +169,9 @@ def update_LibraryStock_table(command, cursor):
     primarily according to legacy tables RNAiPlate and CherryPickRNAiPlate.
     Detailed comments inline.
     """
-    recorded_wells = LibraryStock.objects.all()
     fields_to_compare = ('plate', 'well', 'parent_stock',
                          'intended_clone')
+    wells = TableSync(command, LibraryStock, fields_to_compare)
 
     # 'Source' plates are Ahringer 384 plates and original Orfeome
     # plates (e.g. GHR-10001). Plate names are captured as they
@@ -176,7 +181,8 @@ def update_LibraryStock_table(command, cursor):
     # sjj clones, and source plate@well for mv clones).
     legacy_query_source = ('SELECT DISTINCT 384PlateID, 384Well, '
                            'chromosome, clone FROM RNAiPlate '
-                           'WHERE clone LIKE "sjj%" OR clone LIKE "mv%"')
+                           'WHERE clone LIKE "sjj%" OR clone LIKE "mv%" '
+                           'ORDER BY 384PlateID, 384Well, chromosome, clone')
 
     def sync_source_row(legacy_row):
         plate_name = legacy_row[0]
@@ -199,8 +205,7 @@ def update_LibraryStock_table(command, cursor):
             plate=get_library_plate(plate_name), well=well_proper,
             parent_stock=None, intended_clone=get_clone(clone_name))
 
-        return update_or_save_object(command, new_well, recorded_wells,
-                                     fields_to_compare)
+        return wells.sync(new_well)
 
     # Primary well layout captured in RNAiPlate table (fields RNAiPlateID
     # and 96well). Clone is determined the same way as described in
@@ -209,7 +214,9 @@ def update_LibraryStock_table(command, cursor):
     # plates determined using fields 384PlateID, chromosome, and 384Well.
     legacy_query_primary = ('SELECT RNAiPlateID, 96well, clone, '
                             'chromosome, 384PlateID, 384Well '
-                            'FROM RNAiPlate')
+                            'FROM RNAiPlate '
+                            'ORDER BY RNAiPlateID, 96well, clone, '
+                            'chromosome, 384PlateID, 384Well')
 
     def sync_primary_row(legacy_row):
         plate_name = legacy_row[0]
@@ -247,15 +254,15 @@ def update_LibraryStock_table(command, cursor):
             parent_stock=parent_stock,
             intended_clone=intended_clone)
 
-        return update_or_save_object(command, new_well, recorded_wells,
-                                     fields_to_compare)
+        return wells.sync(new_well)
 
     # L4440 wells from secondary screen are treated specially (since
     # the complicated join used to resolve parents below complicates things
     # for L4440). L4440 wells have no recorded parent.
     legacy_query_secondary_L4440 = ('SELECT RNAiPlateID, 96well '
                                     'FROM CherryPickRNAiPlate '
-                                    'WHERE clone = "L4440"')
+                                    'WHERE clone = "L4440" '
+                                    'ORDER BY RNAiPlateID, 96well')
 
     def sync_secondary_L4440_row(legacy_row):
         plate_name = legacy_row[0]
@@ -266,8 +273,7 @@ def update_LibraryStock_table(command, cursor):
             plate=get_library_plate(plate_name), well=well,
             parent_stock=None, intended_clone=get_clone('L4440'))
 
-        return update_or_save_object(command, new_well, recorded_wells,
-                                     fields_to_compare)
+        return wells.sync(new_well)
 
     # Secondary well layout is captured in CherryPickRNAiPlate table (fields
     # RNAiPlate and 96well). However, there are no columns in this table
@@ -291,7 +297,8 @@ def update_LibraryStock_table(command, cursor):
         '(T.RNAiPlateID IS NULL OR '
         '(T.RNAiPlateID=R.RNAiPlateID AND T.96well=R.96well)) '
         'WHERE C.clone != "L4440" '
-        'ORDER BY C.RNAiPlateID, C.96well')
+        'ORDER BY C.RNAiPlateID, C.96well, C.clone, T.RNAiPlateID, '
+        'T.96well, R.RNAiPlateID, R.96well, R.clone')
 
     def sync_secondary_row(legacy_row):
         plate_name = legacy_row[0]
@@ -370,12 +377,12 @@ def update_LibraryStock_table(command, cursor):
             parent_stock=parent_stock,
             intended_clone=intended_clone)
 
-        return update_or_save_object(command, new_well, recorded_wells,
-                                     fields_to_compare)
+        return wells.sync(new_well)
 
     legacy_query_eliana = (
         'SELECT RNAiPlateID, 96well, OldPlateID, OldWellPosition '
-        'FROM ReArrayRNAiPlate WHERE RNAiPlateID LIKE "Eliana%"')
+        'FROM ReArrayRNAiPlate WHERE RNAiPlateID LIKE "Eliana%" '
+        'ORDER BY RNAiPlateID, 96well, OldPlateID, OldWellPosition')
 
     def sync_eliana_row(legacy_row):
         plate_name = legacy_row[0]
@@ -399,12 +406,17 @@ def update_LibraryStock_table(command, cursor):
             parent_stock=parent_stock,
             intended_clone=intended_clone)
 
-        return update_or_save_object(command, new_well, recorded_wells,
-                                     fields_to_compare)
+        return wells.sync(new_well)
 
-    sync_rows(command, cursor, legacy_query_source, sync_source_row)
-    sync_rows(command, cursor, legacy_query_primary, sync_primary_row)
-    sync_rows(command, cursor, legacy_query_eliana, sync_eliana_row)
+    # Each query is flushed before the next, since later queries look up
+    # parent stocks added by earlier ones
+    sync_rows(command, cursor, legacy_query_source, sync_source_row,
+              table_syncs=[wells])
+    sync_rows(command, cursor, legacy_query_primary, sync_primary_row,
+              table_syncs=[wells])
+    sync_rows(command, cursor, legacy_query_eliana, sync_eliana_row,
+              table_syncs=[wells])
     sync_rows(command, cursor, legacy_query_secondary_L4440,
-              sync_secondary_L4440_row)
-    sync_rows(command, cursor, legacy_query_secondary, sync_secondary_row)
+              sync_secondary_L4440_row, table_syncs=[wells])
+    sync_rows(command, cursor, legacy_query_secondary, sync_secondary_row,
+              table_syncs=[wells])
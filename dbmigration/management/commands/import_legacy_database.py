@@ -1,8 +1,13 @@
 # import MySQLdb
+import time
+
 import mysql.connector
 
 from django.core.management.base import BaseCommand, CommandError
 
+from dbmigration.helpers.step_scheduler import (
+    get_critical_path_seconds, run_steps_in_parallel)
+from dbmigration.helpers.sync_helpers import SyncCheckpoints
 from dbmigration.helpers.sync_steps_library import (
     update_Clone_table, update_LibraryPlate_table, update_LibraryStock_table)
 
@@ -27,13 +32,23 @@ STEPS = (
 
 LAST_STEP = len(STEPS) - 1
 
+# Steps that must be done before each step (as in ARG_HELP below).
+# Step 3 also requires the WormStrain table, which is populated by hand.
+STEP_DEPENDENCIES = {
+    2: (0, 1),
+    3: (1, 2),
+    4: (3,),
+    6: (3, 5),
+    7: (3, 5),
+}
+
 ARG_HELP = '''
     Step to {} with, inclusive. If not provided, defaults to {}.
     The steps are (dependencies in parentheses):
         [0: Clone;
         1: LibraryPlate;
         2: LibraryStock (0,1);
-        3: ExperimentWell&Experiment (WormStrain,1);
+        3: ExperimentWell&Experiment (WormStrain,1,2);
         4: DevstarScore (3);
         5: ManualScoreCode;
         6: ManualScore primary (3,5);
@@ -60,7 +75,7 @@ class Command(BaseCommand):
         0: Clone;
         1: LibraryPlate;
         2: LibraryStock (0,1);
-        3: ExperimentPlate&Experiment (WormStrain,1);
+        3: ExperimentPlate&Experiment (WormStrain,1,2);
         4: DevstarScore (3);
         5: ManualScoreCode;
         6: ManualScore primary (3,5);
@@ -84,6 +99,35 @@ class Command(BaseCommand):
 
         Stderr reports every change (such as an added row), so can get
         quite long; consider redirecting with 2> stderr.out.
+
+        With --diff-file, every change is also written to that file as
+        one JSON object per line, with keys model, action ('add' or
+        'change'), key, and changes ({field: [old, new]}).
+
+    Performance:
+
+        Each step loads the compared fields of its new database table
+        once, diffs the legacy rows against them in memory, and writes
+        additions and changes in batches (see
+        dbmigration.helpers.sync_helpers.TableSync).
+
+        With --jobs greater than 1, steps are run in parallel
+        processes, each as soon as the steps it depends on are done.
+        Stdout reports the time and number of legacy rows of each step.
+
+        Legacy rows are streamed with unbuffered cursors in chunks, and
+        each chunk is committed in its own transaction, so memory use
+        does not grow with the size of the legacy tables.
+
+    Resuming:
+
+        With --checkpoint-file, the last row synced by every legacy
+        query is recorded in that file after each chunk. If the command
+        is interrupted, running it again with the same file skips the
+        queries already synced and resumes the interrupted one after
+        that row (every legacy query is ordered on all of its columns,
+        so this is well defined). Delete the file to sync from scratch,
+        e.g. if the legacy database has changed since the interruption.
     """
 
     help = 'Sync the database according to any changes in the legacy database.'
@@ -93,6 +137,15 @@ class Command(BaseCommand):
                             help=(ARG_HELP.format('start', 0)))
         parser.add_argument('end', type=int, nargs='?', default=LAST_STEP,
                             help=(ARG_HELP.format('end', LAST_STEP)))
+        parser.add_argument('--diff-file',
+                            help='File to also write every addition and '
+                                 'change to, one JSON object per line')
+        parser.add_argument('--checkpoint-file',
+                            help='File to record progress in, and to '
+                                 'resume from if it exists')
+        parser.add_argument('--jobs', type=int, default=1,
+                            help='Number of steps to run in parallel '
+                                 '(default 1)')
 
     def handle(self, **options):
         start = options['start']
@@ -105,33 +158,100 @@ class Command(BaseCommand):
             raise CommandError('Start and end must be in range 0-{}'
                                .format(LAST_STEP))
 
-        if end == LAST_STEP:
-            do_last_step = True
-            end = LAST_STEP - 1
-
-        else:
-            do_last_step = False
+        if options['jobs'] < 1:
+            raise CommandError('Jobs must be at least 1')
 
         require_db_write_acknowledgement()
 
-        # Do the steps that involve connecting to Huey-Ling's legacy_db
-        # legacy_db = MySQLdb.connect(host=LEGACY_DATABASE['HOST'],
-        legacy_db = mysql.connector.connect(host=LEGACY_DATABASE['HOST'],
-                                    user=LEGACY_DATABASE['USER'],
-                                    passwd=LEGACY_DATABASE['PASSWORD'],
-                                    db=LEGACY_DATABASE['NAME'])
-
-        cursor = legacy_db.cursor()
-
-        for step in range(start, end + 1):
-            STEPS[step](self, cursor)
-
-        # This step requires connecting to Kris's legacy_db_2
-        if do_last_step:
-            # legacy_db_2 = MySQLdb.connect(host=LEGACY_DATABASE_2['HOST'],
-            legacy_db_2 = mysql.connector.connect(host=LEGACY_DATABASE_2['HOST'],
-                                          user=LEGACY_DATABASE_2['USER'],
-                                          passwd=LEGACY_DATABASE_2['PASSWORD'],
-                                          db=LEGACY_DATABASE_2['NAME'])
-            cursor = legacy_db_2.cursor()
-            STEPS[LAST_STEP](self, cursor)
+        self.diff_path = options['diff_file']
+        self.checkpoint_path = options['checkpoint_file']
+
+        if self.diff_path:
+            # Truncate, since steps append to it
+            open(self.diff_path, 'w').close()
+
+        steps = range(start, end + 1)
+        start_time = time.time()
+
+        if options['jobs'] == 1:
+            durations = {}
+            for step in steps:
+                durations[step], num_rows = run_step(self, step)
+                self._report_step(step, durations[step], num_rows)
+
+        else:
+            def on_done(step, result):
+                self._report_step(step, *result)
+
+            results = run_steps_in_parallel(
+                steps, STEP_DEPENDENCIES, _run_step_in_process,
+                options['jobs'],
+                args=(self.diff_path, self.checkpoint_path),
+                on_done=on_done)
+            durations = {step: results[step][0] for step in results}
+
+        self.stdout.write(
+            'All steps took {:.1f} seconds (slowest chain of dependent '
+            'steps: {:.1f} seconds)\n'.format(
+                time.time() - start_time,
+                get_critical_path_seconds(durations, STEP_DEPENDENCIES)))
+
+    def _report_step(self, step, seconds, num_rows):
+        self.stdout.write(
+            'Step {} ({}) took {:.1f} seconds for {} legacy rows '
+            '({:.0f} rows per second)\n'.format(
+                step, STEPS[step].__name__, seconds, num_rows,
+                num_rows / max(seconds, 0.001)))
+
+
+def run_step(command, step):
+    """
+    Run a step with its own connection to the legacy database.
+
+    Returns the seconds taken and the number of legacy rows read.
+    """
+    # This step requires connecting to Kris's legacy_db_2; the others
+    # to Huey-Ling's legacy_db
+    if step == LAST_STEP:
+        database = LEGACY_DATABASE_2
+    else:
+        database = LEGACY_DATABASE
+
+    # legacy_db = MySQLdb.connect(host=database['HOST'],
+    legacy_db = mysql.connector.connect(host=database['HOST'],
+                                        user=database['USER'],
+                                        passwd=database['PASSWORD'],
+                                        db=database['NAME'])
+
+    # Steps append to the diff file, line buffered so that lines from
+    # parallel steps are not interleaved
+    if command.diff_path:
+        command.diff_file = open(command.diff_path, 'a', 1)
+    else:
+        command.diff_file = None
+
+    if command.checkpoint_path:
+        command.checkpoints = SyncCheckpoints(command.checkpoint_path)
+    else:
+        command.checkpoints = None
+
+    command.num_legacy_rows = 0
+    start = time.time()
+
+    try:
+        # Unbuffered, so rows are streamed rather than fetched all at once
+        STEPS[step](command, legacy_db.cursor(buffered=False))
+
+    finally:
+        legacy_db.close()
+        if command.diff_file:
+            command.diff_file.close()
+
+    return time.time() - start, command.num_legacy_rows
+
+
+def _run_step_in_process(step, diff_path, checkpoint_path):
+    command = Command()
+    command.diff_path = diff_path
+    command.checkpoint_path = checkpoint_path
+    return run_step(command, step)
@@ -0,0 +1,40 @@
+from django.core.exceptions import MultipleObjectsReturned, ObjectDoesNotExist
+from django.test import TestCase
+
+from clones.models import Clone
+from dbmigration.helpers.object_getters import (clear_object_caches,
+                                                get_clone, get_worm_strain)
+from worms.models import WormStrain
+
+
+class ObjectGettersTestCase(TestCase):
+    def setUp(self):
+        clear_object_caches()
+
+    def tearDown(self):
+        clear_object_caches()
+
+    def test_case_and_trailing_spaces_ignored(self):
+        worm = WormStrain.objects.create(id='MJ69', gene='emb-8',
+                                         allele='hc69')
+        Clone.objects.create(id='sjj_AH10.4')
+
+        self.assertEqual(get_worm_strain('emb-8', 'HC69'), worm)
+        self.assertEqual(get_worm_strain('emb-8 ', 'hc69'), worm)
+        self.assertEqual(get_clone('sjj_AH10.4').pk, 'sjj_AH10.4')
+
+    def test_not_found(self):
+        with self.assertRaises(ObjectDoesNotExist):
+            get_clone('sjj_missing')
+
+    def test_shared_key_is_ambiguous(self):
+        WormStrain.objects.create(id='EU1006', gene='dnc-1', allele='or404')
+        WormStrain.objects.create(id='EU1007', gene='dnc-1', allele='OR404')
+
+        with self.assertRaises(MultipleObjectsReturned):
+            get_worm_strain('dnc-1', 'or404')
+
+        # Remembered, rather than looked up again
+        with self.assertNumQueries(0):
+            with self.assertRaises(MultipleObjectsReturned):
+                get_worm_strain('dnc-1', 'or404')
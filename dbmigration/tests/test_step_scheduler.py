@@ -0,0 +1,86 @@
+import time
+
+from django.test import SimpleTestCase
+
+from dbmigration.helpers import step_scheduler
+from dbmigration.helpers.step_scheduler import (get_critical_path_seconds,
+                                                run_steps_in_parallel)
+
+SLEEP_SECONDS = 0.3
+
+
+# Run in worker processes, so must be defined at module level
+def _sleep_step(step, seconds):
+    start = time.time()
+    time.sleep(seconds)
+    return start, time.time()
+
+
+def _failing_step(step):
+    raise ValueError('step {} failed'.format(step))
+
+
+class RunStepsInParallelTestCase(SimpleTestCase):
+    def setUp(self):
+        self.poll_seconds = step_scheduler.POLL_SECONDS
+        step_scheduler.POLL_SECONDS = 0.01
+
+    def tearDown(self):
+        step_scheduler.POLL_SECONDS = self.poll_seconds
+
+    def test_dependencies_finish_first(self):
+        dependencies = {2: (0, 1), 3: (2,)}
+        results = run_steps_in_parallel(range(4), dependencies,
+                                        _sleep_step, 4, args=(0.05,))
+
+        self.assertEqual(sorted(results), [0, 1, 2, 3])
+        for step, step_dependencies in dependencies.items():
+            for dependency in step_dependencies:
+                self.assertLessEqual(results[dependency][1],
+                                     results[step][0])
+
+    def test_independent_steps_overlap(self):
+        start = time.time()
+        results = run_steps_in_parallel(range(3), {}, _sleep_step, 3,
+                                        args=(SLEEP_SECONDS,))
+
+        self.assertLess(time.time() - start, 3 * SLEEP_SECONDS)
+        self.assertLess(max(r[0] for r in results.values()),
+                        min(r[1] for r in results.values()))
+
+    def test_dependencies_outside_steps_ignored(self):
+        results = run_steps_in_parallel([4], {4: (3,)}, _sleep_step, 2,
+                                        args=(0,))
+        self.assertEqual(results.keys(), [4])
+
+    def test_on_done(self):
+        done = []
+        run_steps_in_parallel([0, 1], {1: (0,)}, _sleep_step, 2, args=(0,),
+                              on_done=lambda step, result: done.append(step))
+        self.assertEqual(done, [0, 1])
+
+    def test_step_exception_raised(self):
+        with self.assertRaises(ValueError):
+            run_steps_in_parallel([0], {}, _failing_step, 2)
+
+    def test_circular_dependencies(self):
+        with self.assertRaises(ValueError):
+            run_steps_in_parallel([0, 1], {0: (1,), 1: (0,)},
+                                  _sleep_step, 2, args=(0,))
+
+
+class GetCriticalPathSecondsTestCase(SimpleTestCase):
+    def test_chain(self):
+        durations = {0: 1, 1: 2, 2: 4, 3: 8}
+        dependencies = {2: (0, 1), 3: (2,)}
+        self.assertEqual(get_critical_path_seconds(durations, dependencies),
+                         14)
+
+    def test_independent(self):
+        self.assertEqual(get_critical_path_seconds({0: 1, 1: 5}, {}), 5)
+
+    def test_dependencies_outside_durations_ignored(self):
+        self.assertEqual(get_critical_path_seconds({4: 3}, {4: (3,)}), 3)
+
+    def test_empty(self):
+        self.assertEqual(get_critical_path_seconds({}, {}), 0)
@@ -0,0 +1,206 @@
+from StringIO import StringIO
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from clones.models import BlastJob, Clone
+from dbmigration.helpers import sync_helpers
+from dbmigration.helpers.sync_helpers import (SyncCheckpoints, TableSync,
+                                              sync_rows)
+from library.models import LibraryPlate, LibraryStock
+
+QUERY = 'SELECT clone, library FROM Clone ORDER BY clone, library'
+
+
+class FakeCommand(object):
+    def __init__(self, checkpoint_path=None):
+        self.stdout = StringIO()
+        self.stderr = StringIO()
+
+        if checkpoint_path:
+            self.checkpoints = SyncCheckpoints(checkpoint_path)
+
+
+class FakeCursor(object):
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query):
+        self.position = 0
+
+    def fetchmany(self, size):
+        rows = self.rows[self.position:self.position + size]
+        self.position += size
+        return rows
+
+
+class Interruption(Exception):
+    pass
+
+
+class TableSyncTestCase(TestCase):
+    def setUp(self):
+        self.command = FakeCommand()
+
+    def test_add(self):
+        clones = TableSync(self.command, Clone, ['library'])
+
+        self.assertFalse(clones.sync(Clone(id='sjj_A', library='Ahringer')))
+        self.assertFalse(Clone.objects.exists())
+
+        clones.flush()
+        self.assertEqual(Clone.objects.get(id='sjj_A').library, 'Ahringer')
+
+    def test_match(self):
+        Clone.objects.create(id='sjj_A', library='Ahringer')
+        clones = TableSync(self.command, Clone, ['library'])
+
+        self.assertTrue(clones.sync(Clone(id='sjj_A', library='Ahringer')))
+
+    def test_change_several_rows(self):
+        Clone.objects.create(id='sjj_A', library='old')
+        Clone.objects.create(id='sjj_B', library='old')
+        Clone.objects.create(id='sjj_C', library='old')
+
+        clones = TableSync(self.command, Clone, ['library'])
+        self.assertFalse(clones.sync(Clone(id='sjj_A', library='Ahringer')))
+        self.assertFalse(clones.sync(Clone(id='sjj_B', library='Vidal')))
+        clones.flush()
+
+        self.assertEqual(
+            dict(Clone.objects.values_list('id', 'library')),
+            {'sjj_A': 'Ahringer', 'sjj_B': 'Vidal', 'sjj_C': 'old'})
+
+    def test_change_several_batches(self):
+        for i in range(5):
+            Clone.objects.create(id='sjj_{}'.format(i), library='old')
+
+        clones = TableSync(self.command, Clone, ['library'], batch_size=2)
+        for i in range(5):
+            clones.sync(Clone(id='sjj_{}'.format(i), library=str(i)))
+        clones.flush()
+
+        for clone in Clone.objects.all():
+            self.assertEqual(clone.library, clone.id[-1])
+
+    def test_change_pending_addition(self):
+        clones = TableSync(self.command, Clone, ['library'])
+        clones.sync(Clone(id='sjj_A', library='old'))
+        clones.sync(Clone(id='sjj_A', library='new'))
+        clones.flush()
+
+        self.assertEqual(Clone.objects.get(id='sjj_A').library, 'new')
+
+    def test_change_created_addition_with_auto_pk(self):
+        jobs = TableSync(self.command, BlastJob, ['status'],
+                         key_fields=['query_hash'])
+        jobs.sync(BlastJob(query_hash='a', status=BlastJob.QUEUED))
+        jobs.sync(BlastJob(query_hash='b', status=BlastJob.QUEUED))
+        jobs.flush()
+
+        self.assertFalse(jobs.sync(BlastJob(query_hash='a',
+                                            status=BlastJob.DONE)))
+        jobs.flush()
+
+        self.assertEqual(
+            dict(BlastJob.objects.values_list('query_hash', 'status')),
+            {'a': BlastJob.DONE, 'b': BlastJob.QUEUED})
+
+    def test_depends_on_flushed_first(self):
+        plates = TableSync(self.command, LibraryPlate, ['number_of_wells'])
+        stocks = TableSync(self.command, LibraryStock, ['plate'],
+                           depends_on=[plates])
+
+        plate = LibraryPlate(id='I-1-A1', number_of_wells=96)
+        plates.sync(plate)
+        stocks.sync(LibraryStock(id='I-1-A1_A01', plate=plate, well='A01'))
+
+        stocks.flush()
+
+        self.assertTrue(LibraryPlate.objects.filter(id='I-1-A1').exists())
+        self.assertEqual(LibraryStock.objects.get().plate_id, 'I-1-A1')
+
+    def test_on_flush(self):
+        Clone.objects.create(id='sjj_A', library='old')
+        Clone.objects.create(id='sjj_B', library='old')
+        flushed = []
+
+        clones = TableSync(self.command, Clone, ['library'],
+                           on_flush=lambda objects: flushed.append(
+                               sorted(clone.id for clone in objects)))
+        clones.sync(Clone(id='sjj_A', library='new'))
+        clones.sync(Clone(id='sjj_B', library='old'))
+        clones.sync(Clone(id='sjj_C', library='new'))
+        clones.flush()
+        clones.flush()
+
+        self.assertEqual(flushed, [['sjj_A', 'sjj_C']])
+
+
+class SyncRowsTestCase(TestCase):
+    def setUp(self):
+        self.chunk_size = sync_helpers.CHUNK_SIZE
+        sync_helpers.CHUNK_SIZE = 3
+
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint_path = os.path.join(self.directory, 'checkpoints')
+
+        self.rows = [('sjj_{}'.format(i), 'Ahringer') for i in range(10)]
+        self.synced = []
+
+    def tearDown(self):
+        sync_helpers.CHUNK_SIZE = self.chunk_size
+        shutil.rmtree(self.directory)
+
+    def sync(self, rows, interrupt_at=None):
+        command = FakeCommand(self.checkpoint_path)
+        clones = TableSync(command, Clone, ['library'])
+
+        def sync_clone_row(legacy_row):
+            if legacy_row[0] == interrupt_at:
+                raise Interruption
+            self.synced.append(legacy_row[0])
+            return clones.sync(Clone(id=legacy_row[0],
+                                     library=legacy_row[1]))
+
+        sync_rows(command, FakeCursor(rows), QUERY, sync_clone_row,
+                  table_syncs=[clones])
+        return command
+
+    def test_interrupt_and_resume(self):
+        with self.assertRaises(Interruption):
+            self.sync(self.rows, interrupt_at='sjj_7')
+
+        # The interrupted chunk (rows 6-8) is rolled back
+        self.assertEqual(Clone.objects.count(), 6)
+
+        self.synced = []
+        self.sync(self.rows)
+
+        self.assertEqual(self.synced, ['sjj_6', 'sjj_7', 'sjj_8', 'sjj_9'])
+        self.assertEqual(Clone.objects.count(), 10)
+
+    def test_complete_query_skipped(self):
+        self.sync(self.rows)
+        self.synced = []
+        command = self.sync(self.rows)
+
+        self.assertEqual(self.synced, [])
+        self.assertIn('Skipping', command.stdout.getvalue())
+
+    def test_resume_with_missing_row(self):
+        with self.assertRaises(Interruption):
+            self.sync(self.rows, interrupt_at='sjj_7')
+
+        rows = self.rows[:5] + self.rows[6:]
+        with self.assertRaises(CommandError):
+            self.sync(rows)
+
+    def test_query_without_order_by(self):
+        command = FakeCommand(self.checkpoint_path)
+        with self.assertRaises(CommandError):
+            sync_rows(command, FakeCursor(self.rows),
+                      'SELECT clone, library FROM Clone', lambda row: True)
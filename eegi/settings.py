@@ -19,6 +19,18 @@ from .localsettings import (
     FILE_UPLOAD_TEMP_DIR, BLAST_DB_DIR, TABIX, TABIX_DB_DIR, BLAST)
 
 
+# Optionally, a cache shared by all web processes and management commands
+# (e.g. memcached), so that cached reference data and genes are
+# invalidated everywhere at once when changed. Without one, each process
+# has its own cache, and sees changes made elsewhere only once its cached
+# values expire.
+
+try:
+    from .localsettings import CACHES
+except ImportError:
+    pass
+
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 
 import os
@@ -79,6 +91,16 @@ FILE_UPLOAD_HANDLERS = (
     'django.core.files.uploadhandler.TemporaryFileUploadHandler',
 )
 
+# BLAST searches run in the background; at most BLAST_MAX_JOBS at a
+# time per web process, each split across up to BLAST_CHUNKS_PER_JOB
+# simultaneous BLAST processes
+BLAST_MAX_JOBS = 2
+BLAST_CHUNKS_PER_JOB = 4
+
+# Jobs are lost if their web process restarts; jobs not finished after
+# this many seconds are assumed lost, and marked failed
+BLAST_JOB_MAX_SECONDS = 3600
+
 # Internationalization
 # https://docs.djangoproject.com/en/dev/topics/i18n/
 
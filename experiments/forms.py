@@ -1,15 +1,24 @@
+from collections import defaultdict
+from functools import partial
+import hashlib
 import os
+import random
 
 from django import forms
 from django.conf import settings
 from django.core.validators import MinLengthValidator
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 
 from clones.forms import RNAiKnockdownField
+from experiments.helpers import scoring_queues
 from experiments.models import (Experiment, ExperimentPlate,
-                                ManualScore, ManualScoreCode)
+                                ManualScore, ManualScoreCode,
+                                ManualScoreSummary)
 from library.forms import LibraryPlateField
 from utils.forms import EMPTY_CHOICE, BlankNullBooleanSelect, RangeField
+from utils.reference_cache import get_reference
 from worms.forms import (MutantKnockdownField, WormChoiceField,
                          clean_mutant_query_and_screen_type)
 from worms.models import WormStrain
@@ -114,19 +123,13 @@ class SingleScoreField(forms.TypedChoiceField):
     """
 
     def __init__(self, key, junk_to_last=False, **kwargs):
-        choices = []
-        cant = (IMPOSSIBLE, 'Can\'t')
-        for code in ManualScoreCode.get_codes(key):
-            choices.append((code.pk, str(code)))
+        # Callable, so the choices are not queried at import time, and
+        # follow the cached codes if they change
+        kwargs['choices'] = partial(get_score_choices, key,
+                                    include_impossible=True,
+                                    junk_to_last=junk_to_last)
 
-        if junk_to_last:
-            choices.insert(len(choices) - 1, cant)
-        else:
-            choices.append((IMPOSSIBLE, 'Can\'t'))
-
-        kwargs['choices'] = choices
-
-        kwargs['coerce'] = _coerce_to_manualscorecode
+        kwargs['coerce'] = partial(_coerce_to_manualscorecode, key=key)
 
         if 'required' not in kwargs:
             kwargs['required'] = True
@@ -137,11 +140,17 @@ class SingleScoreField(forms.TypedChoiceField):
         super(SingleScoreField, self).__init__(**kwargs)
 
 
-class MultiScoreField(forms.ModelMultipleChoiceField):
-    """Field for selecting auxiliary scores."""
+class MultiScoreField(forms.TypedMultipleChoiceField):
+    """Field for selecting auxiliary scores.
+
+    NOTE: avoid ModelMultipleChoiceField, which queries the codes again
+    for every form that is rendered or cleaned.
+    """
 
     def __init__(self, key, **kwargs):
-        kwargs['queryset'] = ManualScoreCode.get_codes(key)
+        kwargs['choices'] = partial(get_score_choices, key)
+
+        kwargs['coerce'] = partial(_coerce_to_manualscorecode, key=key)
 
         if 'widget' not in kwargs:
             kwargs['widget'] = forms.CheckboxSelectMultiple(
@@ -150,11 +159,45 @@ class MultiScoreField(forms.ModelMultipleChoiceField):
         super(MultiScoreField, self).__init__(**kwargs)
 
 
-def _coerce_to_manualscorecode(value):
+def get_score_choices(key, include_impossible=False, junk_to_last=False):
+    """
+    Get the choices of the score codes for scoring key.
+
+    The choices are (pk, label) tuples, optionally with the IMPOSSIBLE
+    choice, either last or (with junk_to_last) before the last code.
+
+    The choices are built once from the cached codes (see
+    ManualScoreCode.get_cached_codes) and shared by every score form,
+    so must not be modified.
+    """
+    return get_reference(
+        ('score-choices', key, include_impossible, junk_to_last),
+        lambda: _build_score_choices(key, include_impossible, junk_to_last),
+        [ManualScoreCode])
+
+
+def _build_score_choices(key, include_impossible, junk_to_last):
+    choices = [(code.pk, str(code))
+               for code in ManualScoreCode.get_cached_codes(key)]
+    cant = (IMPOSSIBLE, 'Can\'t')
+
+    if include_impossible and junk_to_last:
+        choices.insert(len(choices) - 1, cant)
+    elif include_impossible:
+        choices.append(cant)
+
+    return tuple(choices)
+
+
+def _coerce_to_manualscorecode(value, key):
     if value == IMPOSSIBLE:
         return IMPOSSIBLE
 
-    return ManualScoreCode.objects.get(pk=value)
+    for code in ManualScoreCode.get_cached_codes(key):
+        if str(code.pk) == value:
+            return code
+
+    raise ValueError('{} is not a {} score code'.format(value, key))
 
 
 ##############
@@ -286,7 +329,10 @@ class FilterExperimentWellsForm(_FilterExperimentsBaseForm):
         screen_type = cleaned_data.pop('screen_type')
 
         _remove_empties_and_none(cleaned_data)
-        experiments = Experiment.objects.filter(**cleaned_data)
+
+        # Image availability is shown with each experiment's image
+        experiments = (Experiment.objects.filter(**cleaned_data)
+                       .select_related('imageavailability'))
 
         if exclude_no_clone:
             experiments = experiments.exclude(
@@ -296,7 +342,6 @@ class FilterExperimentWellsForm(_FilterExperimentsBaseForm):
             experiments = experiments.exclude(
                 library_stock__intended_clone='L4440')
 
-        # Must be done last, since it post-processes the query
         if screen_type:
             experiments = _limit_to_screen_type(experiments, screen_type)
 
@@ -393,8 +438,10 @@ class FilterExperimentWellsToScoreForm(_FilterExperimentsBaseForm):
 
     # this is a user defined method.
     # process is making the queries to score
-    def process(self):
+    # queue_cursor is where to continue a randomized scoring queue
+    def process(self, queue_cursor=None):
         cleaned_data = self.cleaned_data
+        signature = _get_filter_signature(cleaned_data)
 
         # removing parameters that can not be used to filter the django way
         score_form_key = cleaned_data.pop('score_form_key')
@@ -1151,64 +1198,8 @@ class FilterExperimentWellsToScoreForm(_FilterExperimentsBaseForm):
         for that session and will need to be executed again.
         '''
         if score_only_4_reps:
-
-            score_ids = ManualScore.objects.all().values_list('experiment_id', flat=True)
-
-            #This is the working query
-
-            replicate_plates = (
-                experiments
-                .values('well', 'worm_strain_id','library_stock_id',
-                'plate__date','plate__temperature')
-                .order_by('well', 'worm_strain_id', 'library_stock_id',
-                'plate__date', 'plate__temperature')
-                .distinct()
-            )
-
-            '''
-            # test set
-            replicate_plates = (
-                experiments
-                .filter(
-                plate__date="2015-05-20",
-                plate__temperature=15,
-                worm_strain="AR1",
-                well="A01",
-                library_stock="mr17-E1_A01")
-                .values('well', 'worm_strain_id','library_stock_id',
-                'plate__date','plate__temperature')
-                .order_by()
-                .distinct()
-            )
-            '''
-
-
-            to_score = []
-
-            for rep in replicate_plates.order_by('?')[:1000]:
-
-                rep_set = (experiments
-                    .filter(**rep)
-                    .select_related('worm_strain','plate','library_stock')
-                    .prefetch_related('manualscore_set')
-                )
-
-                reps_scored_already = rep_set.exclude(id__in=score_ids).values('pk')
-                count = reps_scored_already.count()
-                if count <= 4:
-                    continue
-                elif count == 8:
-                    to_score.extend(rep_set
-                        .order_by('?')[:4]
-                        .values_list('id', flat=True))
-                else:
-                    count = count - 4
-                    to_score.extend(rep_set
-                        .order_by('?')[:count]
-                        .values_list('id', flat=True))
-
-
-            experiments = experiments.filter(id__in=to_score)
+            experiments = experiments.filter(
+                id__in=_get_replicates_to_score(experiments))
 
         # Special case for Malcolm to score subset defined in a file
         # Trash it or make it able to upload file
@@ -1223,23 +1214,86 @@ class FilterExperimentWellsToScoreForm(_FilterExperimentsBaseForm):
                     experiments = experiments.filter(
                         library_stock__in=scoring_list)
 
-        if randomize_order:
-            # Warning: Django docs mentions that `order_by(?)` may be
-            # expensive and slow. If performance becomes an issue, switch
-            # to another way
-            experiments = experiments.order_by('?')
-
-        # Must be done last, since it post-processes the query
         if screen_type:
             experiments = _limit_to_screen_type(experiments, screen_type)
 
+        num_to_score = None
+        next_queue_cursor = None
+
+        if randomize_order:
+            # Rather than sorting randomly on every page, shuffle the
+            # matching experiments once per scorer and set of filters,
+            # and take each page from that queue at queue_cursor
+            def get_candidate_ids():
+                return experiments.values_list('id', flat=True)
+
+            experiments, num_to_score, next_queue_cursor = (
+                scoring_queues.get_next_experiments(
+                    self.user, signature, get_candidate_ids,
+                    images_per_page, queue_cursor))
+
         return {
             'experiments': experiments,
+            'num_to_score': num_to_score,
+            'next_queue_cursor': next_queue_cursor,
             'score_form': get_score_form(score_form_key),
             'images_per_page': images_per_page,
             'unscored_by_user': unscored_by_user,
         }
 
+def _get_filter_signature(cleaned_data):
+    """
+    Get a hash identifying the experiments selected by scoring filters.
+
+    images_per_page is ignored, since it does not change which
+    experiments are selected.
+    """
+    items = sorted((key, unicode(value))
+                   for key, value in cleaned_data.iteritems()
+                   if key != 'images_per_page')
+    return hashlib.sha1(repr(items)).hexdigest()
+
+
+def _get_replicates_to_score(experiments, max_groups=1000):
+    """
+    Get ids of experiments to score so that each replicate set gets 4 scores.
+
+    Replicate sets are experiments with the same well, worm strain,
+    library stock, date and temperature. Up to max_groups sets are
+    chosen at random. For a set with more than 4 unscored experiments,
+    (number unscored - 4) of its experiments are chosen at random.
+
+    The experiments and their scored status are fetched in two queries,
+    and grouped in memory.
+    """
+    rows = experiments.order_by().values_list(
+        'id', 'well', 'worm_strain_id', 'library_stock_id',
+        'plate__date', 'plate__temperature')
+
+    groups = defaultdict(list)
+    for row in rows:
+        groups[row[1:]].append(row[0])
+
+    scored = set(ManualScore.objects
+                 .filter(experiment__in=experiments.values('id'))
+                 .values_list('experiment_id', flat=True))
+
+    keys = groups.keys()
+    if len(keys) > max_groups:
+        keys = random.sample(keys, max_groups)
+
+    to_score = []
+
+    for key in keys:
+        ids = groups[key]
+        num_unscored = len([x for x in ids if x not in scored])
+
+        if num_unscored > 4:
+            to_score.extend(random.sample(ids, num_unscored - 4))
+
+    return to_score
+
+
 def _remove_empties_and_none(d):
     """Remove key-value pairs from dictionary if the value is '' or None."""
     for k, v in d.items():
@@ -1254,7 +1308,7 @@ def _remove_empties_and_none(d):
 
 def _limit_to_screen_type(experiments, screen_type):
     '''
-    Post-process experiments QuerySet such that each experiment was done at its
+    Limit experiments QuerySet such that each experiment was done at its
     worm's SUP or ENH temperature. Since N2 does not have a SUP or ENH
     temperature, N2 will not be in this result.
 
@@ -1268,31 +1322,27 @@ def _limit_to_screen_type(experiments, screen_type):
     with different SUP/ENH temperatures (e.g. maybe Noah wants to see all
     experiments from one date).
 
-    Question: Why not just join between ExperimentPlate.temperature and
-    WormStrain.permissive_temperature / .restrictive_temperature?
-
-    This would involve joining WormStrain on a second field. While easy with
-    raw SQL, this is not easy with Django, requiring either 1) soon-to-
-    be-deprecated `empty()`, 2) overriding low level query processing in ways
-    that are subject to syntax changes, or 3) using `raw()` to write raw SQL.
-    While I was tempted to do 3), since these filtering forms are meant to be
-    generic and applicable (able to take dozens of possible keys to filter on),
-    this one case doesn't warrant losing the readability and protections
-    against SQL injection attacks that Django QuerySets provide.
+    So instead, this filters on the disjunction of (temperature, worms at
+    that temperature) over all worms, which keeps the QuerySet lazy and lets
+    the database do the work. There are few distinct temperatures, so the
+    condition stays small.
     '''
-    # Create a dictionary
     to_temperature = WormStrain.get_worm_to_temperature_dictionary(screen_type)
-    filtered = []
 
-    for experiment in experiments.prefetch_related('worm_strain', 'plate'):
-        temperature = experiment.plate.temperature
-        # print "plate temperature",temperature
-        # print "worm strain temperature",to_temperature[experiment.worm_strain]
+    worms_by_temperature = defaultdict(list)
+    for worm, temperature in to_temperature.iteritems():
+        if temperature is not None:
+            worms_by_temperature[temperature].append(worm.pk)
+
+    if not worms_by_temperature:
+        return experiments.none()
 
-        if temperature == to_temperature[experiment.worm_strain]:
-            filtered.append(experiment)
+    condition = Q()
+    for temperature, worm_pks in worms_by_temperature.iteritems():
+        condition |= Q(plate__temperature=temperature,
+                       worm_strain__in=worm_pks)
 
-    return filtered
+    return experiments.filter(condition)
 
 
 ###################
@@ -1372,6 +1422,28 @@ class ScoreForm(forms.Form):
         self.user = kwargs.pop('user', None)
         super(ScoreForm, self).__init__(*args, **kwargs)
 
+    def get_score_codes(self):
+        """
+        Get the ManualScoreCodes (or IMPOSSIBLE) chosen in this form.
+
+        Collects the cleaned values of the form's score fields, in field
+        order.
+        """
+        score_codes = []
+
+        for name, field in self.fields.iteritems():
+            value = self.cleaned_data.get(name)
+
+            if isinstance(field, MultiScoreField):
+                score_codes.extend(value or [])
+            elif isinstance(field, SingleScoreField) and value is not None:
+                score_codes.append(value)
+
+        return score_codes
+
+    def process(self):
+        process_score_forms([self])
+
 # THis is the secondary suppressor scoring form
 class SuppressorScoreForm(ScoreForm):
 
@@ -1388,15 +1460,6 @@ class SuppressorScoreForm(ScoreForm):
                                         'some auxiliary score')
         return cleaned_data
 
-    def process(self):
-        cleaned_data = self.cleaned_data
-        save_score = _get_save_score(self)
-
-        save_score(cleaned_data.get('sup_score'))
-
-        for code in cleaned_data.get('auxiliary_scores'):
-            save_score(code)
-
 
 # This is the secondary enhancer scoring form (the one where you actually score)
 class LevelsScoreForm(ScoreForm):
@@ -1432,93 +1495,140 @@ class LevelsScoreForm(ScoreForm):
                                         'some auxiliary score')
         return cleaned_data
 
-    def process(self):
-        cleaned_data = self.cleaned_data
-        save_score = _get_save_score(self)
-
-        # save_score(cleaned_data.get('emb_score'))
-        # save_score(cleaned_data.get('ste_score'))
-        save_score(cleaned_data.get('ste_relative_score'))
-        save_score(cleaned_data.get('emb_relative_score'))
-        save_score(cleaned_data.get('n2_rnai_ste_score'))
-        save_score(cleaned_data.get('n2_rnai_emb_score'))
-        save_score(cleaned_data.get('mut_rnai_ste_score'))
-        save_score(cleaned_data.get('mut_rnai_emb_score'))
-        save_score(cleaned_data.get('mut_hits'))
-        for code in cleaned_data.get('auxiliary_scores'):
-            save_score(code)
-
-
-def _get_save_score(form):
-    experiment = Experiment.objects.get(pk=form.prefix)
-
-    # Each simultaneously-scored score for this image should get the same
-    # timestamp
-    time = timezone.now()
-
-    # This overrides the save function, and though it's nested it somehow gets
-    # called by save_score
-    def save_score(score_code):
-        # If it's completely emb, ste is impossible to judge
-        # likewise for ste
-        if score_code == IMPOSSIBLE:
-            return
-
-
-        # SQL query to delete all misassigned rows
-        # delete record from ManualScore record join Experiment on experiment_id = Experiment.id where timestamp >= '2018-04-01' and worm_strain_id != 'N2' and `score_code_id` in (47, 48, 49, 20)
-
-        # if score_code.id in [20,47,48,49]:
-
-        aux = [-14, -13, -12, -11, -10, -19, -9, 
-               -7, -5, -4, -3, -2, 7, 8, 10, 11]
-        emb_rel = [12, 13, 14, 15, 73]
-        ste_rel = [16, 17, 18, 19, 74]
-        n2_rnai_ste_cons = [71, 47, 48, 49, 53]
-        n2_rnai_emb_cons = [72, 50, 51, 52, 53]
-        mut_rnai_ste_cons = [63, 64, 65, 66]
-        mut_rnai_emb_cons = [67, 68, 69, 70]
-        mut_hits = [54, 55, 56, 57, 58, 59, 60, 61, 62]
-
-        n2_scores = n2_rnai_ste_cons + n2_rnai_emb_cons
-        mut_scores = aux + emb_rel + ste_rel + mut_rnai_ste_cons + mut_rnai_emb_cons + mut_hits
-
-        if score_code.id in n2_scores:
-            for control in experiment.get_link_to_exact_n2_control():
-                control_score = ManualScore(
-                    experiment=control, score_code=score_code,
-                    scorer=form.user, timestamp=time
-                )
-                control_score.save()
 
-        elif score_code.id in mut_scores:
-            for exp in experiment.get_experiment_replicate_plates():
-                exp_score = ManualScore(
-                    experiment=exp, score_code=score_code,
-                    scorer=form.user, timestamp=time
-                )
-                exp_score.save()
-        
-        else:
-            score = ManualScore(
-                experiment=experiment, score_code=score_code,
-                scorer=form.user, timestamp=time)
-            score.save()
-
-            # if score_code.id in [63, 64, 65, 66, 67, 68, 69, 70]:
-            #     for exp in experiment.get_experiment_replicate_plates():
-            #         exp_score = ManualScore(
-            #             experiment=exp, score_code=score_code,
-            #             scorer=form.user, timestamp=time
-            #         )
-            #         exp_score.save()
-            # else:
-            #     score = ManualScore(
-            #         experiment=experiment, score_code=score_code,
-            #         scorer=form.user, timestamp=time)
-            #     score.save()
-
-    return save_score
+# Score codes that apply to the experiment's N2 controls, rather than to
+# the experiment itself
+N2_SCORE_CODES = (
+    [71, 47, 48, 49, 53] +  # N2 RNAi ste consensus
+    [72, 50, 51, 52, 53]    # N2 RNAi emb consensus
+)
+
+# Score codes that apply to all of the experiment's replicates
+REPLICATE_SCORE_CODES = (
+    [-14, -13, -12, -11, -10, -19, -9,
+     -7, -5, -4, -3, -2, 7, 8, 10, 11] +  # auxiliary
+    [12, 13, 14, 15, 73] +                # emb relative
+    [16, 17, 18, 19, 74] +                # ste relative
+    [63, 64, 65, 66] +                    # mutant RNAi ste consensus
+    [67, 68, 69, 70] +                    # mutant RNAi emb consensus
+    [54, 55, 56, 57, 58, 59, 60, 61, 62]  # mutant hits
+)
+
+
+def process_score_forms(score_forms):
+    """
+    Save the scores from valid score forms, in one transaction.
+
+    Each form's prefix is the pk of the experiment it scores. Codes in
+    N2_SCORE_CODES are saved to the experiment's N2 controls, and codes
+    in REPLICATE_SCORE_CODES to all of the experiment's replicates.
+
+    The experiments, their N2 controls and their replicates are each
+    looked up in one query for all forms, and all scores are written
+    with a single bulk_create. Each form's scores get the same
+    timestamp. Since bulk_create sends no signals, the affected score
+    summaries are refreshed here, in the same transaction.
+    """
+    experiments = (Experiment.objects.select_related('plate')
+                   .in_bulk([form.prefix for form in score_forms]))
+    n2_controls = _get_n2_controls(experiments.values())
+    replicates = _get_replicates(experiments.values())
+
+    scores = []
+
+    for form in score_forms:
+        experiment = experiments[form.prefix]
+        time = timezone.now()
+
+        for score_code in form.get_score_codes():
+            # If it's completely emb, ste is impossible to judge,
+            # and likewise for ste
+            if score_code == IMPOSSIBLE:
+                continue
+
+            if score_code.id in N2_SCORE_CODES:
+                targets = n2_controls[experiment.pk]
+            elif score_code.id in REPLICATE_SCORE_CODES:
+                targets = replicates[_get_replicate_key(experiment)]
+            else:
+                targets = [experiment.pk]
+
+            for target in targets:
+                scores.append(ManualScore(
+                    experiment_id=target, score_code=score_code,
+                    scorer=form.user, timestamp=time))
+
+    with transaction.atomic():
+        ManualScore.objects.bulk_create(scores)
+        ManualScoreSummary.refresh_for_scores(scores)
+
+
+def _get_replicate_key(experiment):
+    return (experiment.well, experiment.worm_strain_id,
+            experiment.library_stock_id, experiment.date(),
+            experiment.temperature())
+
+
+def _get_replicates(experiments):
+    """
+    Get the replicates of experiments.
+
+    Returns a dictionary from replicate key (see _get_replicate_key)
+    to the ids of the experiments with that key. Fetches all candidates
+    in one query.
+    """
+    keys = set(_get_replicate_key(experiment) for experiment in experiments)
+    replicates = defaultdict(list)
+
+    if not keys:
+        return replicates
+
+    rows = Experiment.objects.filter(
+        well__in=set(key[0] for key in keys),
+        worm_strain__in=set(key[1] for key in keys),
+        library_stock__in=set(key[2] for key in keys),
+        plate__date__in=set(key[3] for key in keys),
+    ).order_by().values_list('id', 'well', 'worm_strain_id', 'library_stock_id',
+                  'plate__date', 'plate__temperature')
+
+    for row in rows:
+        if row[1:] in keys:
+            replicates[row[1:]].append(row[0])
+
+    return replicates
+
+
+def _get_n2_controls(experiments):
+    """
+    Get the N2 controls of experiments.
+
+    Returns a dictionary from experiment id to the ids of its N2 controls,
+    matching Experiment.get_n2_control_filters (non-junk N2 experiments
+    with the same library stock, date and temperature). Fetches all
+    candidates in one query.
+    """
+    controls = {}
+
+    if not experiments:
+        return controls
+
+    rows = Experiment.objects.filter(
+        is_junk=False, worm_strain=WormStrain.get_n2(),
+        library_stock__in=set(x.library_stock_id for x in experiments),
+        plate__date__in=set(x.date() for x in experiments),
+    ).order_by().values_list('id', 'library_stock_id', 'plate__date',
+                             'plate__temperature')
+
+    candidates = defaultdict(list)
+    for row in rows:
+        candidates[row[1:]].append(row[0])
+
+    for experiment in experiments:
+        controls[experiment.pk] = candidates[(experiment.library_stock_id,
+                                              experiment.date(),
+                                              experiment.temperature())]
+
+    return controls
 
 
 ##################################
@@ -1584,30 +1694,27 @@ class ChangeExperimentPlatesForm(forms.Form):
         'library_plate', 'is_junk', 'plate_comment', 'well_comment']
 
 
-def process_ChangeExperimentPlatesForm_data(experiment_plate, data):
+def process_ChangeExperimentPlatesForm_data(experiment_plates, data):
     """
-    Helper to apply the ChangeExperimentPlateForm changes to a specific
-    plate.
+    Helper to apply the ChangeExperimentPlateForm changes to many
+    plates at once.
 
     data should be the cleaned_data from a ChangeExperimentPlatesForm.
     """
-    # First update straightforward plate fields
+    # Only update the plate fields that were filled in
+    fields = {}
     for key in ('screen_stage', 'date', 'temperature', 'comment',):
         value = data.get(key)
 
         if value:
-            setattr(experiment_plate, key, value)
-            experiment_plate.save()
-
-    # Next update plate methods
-    if data.get('worm_strain'):
-        experiment_plate.set_worm_strain(data.get('worm_strain'))
-
-    if data.get('library_plate'):
-        experiment_plate.set_library_stocks(data.get('library_plate'))
-
-    if data.get('is_junk') is not None:
-        experiment_plate.set_junk(data.get('is_junk'))
+            fields[key] = value
+
+    ExperimentPlate.change_plates(
+        experiment_plates,
+        worm_strain=data.get('worm_strain') or None,
+        library_plate=data.get('library_plate') or None,
+        is_junk=data.get('is_junk'),
+        **fields)
 
     return
 
@@ -0,0 +1,127 @@
+"""
+Helpers to work with manual scores without hydrating model instances.
+
+Scores are pulled from the database as plain tuples and wrapped in
+lightweight CompactScore records, whose category is looked up from the
+score code id alone. These records support the same category methods as
+ManualScore, so they can be passed to the criteria and score matrix
+helpers. This path is intended for screen-wide work (e.g. positive calls
+over the whole primary screen), where building ManualScore, Experiment
+and LibraryStock instances for every score is too costly.
+"""
+
+from collections import OrderedDict
+
+from experiments.helpers.score_matrix import (OTHER, NEGATIVE, WEAK,
+                                              MEDIUM, STRONG)
+from experiments.helpers.scores import get_most_relevant_score_per_experiment
+from experiments.models import ManualScore, ManualScoreCode
+
+FIELDS = ('experiment_id', 'experiment__library_stock_id',
+          'score_code_id', 'scorer_id', 'timestamp')
+
+_CATEGORIES = {
+    OTHER: ManualScore.OTHER,
+    NEGATIVE: ManualScore.NEGATIVE,
+    WEAK: ManualScore.WEAK,
+    MEDIUM: ManualScore.MEDIUM,
+    STRONG: ManualScore.STRONG,
+}
+
+# Category code for each score code with a category other than OTHER
+_CODE_TO_CATEGORY = {}
+for _codes, _category in ((ManualScoreCode.NEGATIVE_CODES, NEGATIVE),
+                          (ManualScoreCode.WEAK_CODES, WEAK),
+                          (ManualScoreCode.MEDIUM_CODES, MEDIUM),
+                          (ManualScoreCode.STRONG_CODES, STRONG)):
+    for _code in _codes:
+        _CODE_TO_CATEGORY[_code] = _category
+
+
+class CompactScore(object):
+    """A manual score, without its related objects."""
+
+    __slots__ = ('experiment_id', 'library_stock_id', 'score_code_id',
+                 'scorer_id', 'timestamp', 'category_code')
+
+    def __init__(self, experiment_id, library_stock_id, score_code_id,
+                 scorer_id, timestamp):
+        self.experiment_id = experiment_id
+        self.library_stock_id = library_stock_id
+        self.score_code_id = score_code_id
+        self.scorer_id = scorer_id
+        self.timestamp = timestamp
+        self.category_code = _CODE_TO_CATEGORY.get(score_code_id, OTHER)
+
+    def __repr__(self):
+        return '<CompactScore {} scored {} by {}>'.format(
+            self.experiment_id, self.score_code_id, self.scorer_id)
+
+    def is_strong(self):
+        return self.category_code == STRONG
+
+    def is_medium(self):
+        return self.category_code == MEDIUM
+
+    def is_weak(self):
+        return self.category_code == WEAK
+
+    def is_negative(self):
+        return self.category_code == NEGATIVE
+
+    def is_other(self):
+        return self.category_code == OTHER
+
+    def get_category(self):
+        """Get this score's more general score category."""
+        return _CATEGORIES[self.category_code]
+
+    def get_weight(self):
+        """Get the relevance weight for this score."""
+        return ManualScore.WEIGHTS[self.get_category()]
+
+    def get_relevance_per_replicate(self):
+        """Get this score's relevance within an experiment replicate."""
+        return self.category_code
+
+
+def get_compact_scores(scores):
+    """
+    Get CompactScores for a queryset of ManualScores.
+
+    Only the columns needed are selected, and no related objects are
+    fetched.
+    """
+    return [CompactScore(*row) for row in scores.values_list(*FIELDS)]
+
+
+def organize_compact_scores(scores, most_relevant_only=False):
+    """
+    Organize CompactScores into a structured dictionary.
+
+    This mirrors organize_manual_scores, but is keyed by ids:
+        s[library_stock_id][experiment_id] = [scores]
+
+    Or, if most_relevant_only is set to True:
+        s[library_stock_id][experiment_id] = most_relevant_score
+    """
+    data = {}
+
+    for score in scores:
+        if score.library_stock_id not in data:
+            data[score.library_stock_id] = OrderedDict()
+
+        experiments = data[score.library_stock_id]
+
+        if score.experiment_id not in experiments:
+            experiments[score.experiment_id] = []
+
+        experiments[score.experiment_id].append(score)
+
+    if most_relevant_only:
+        for experiments in data.itervalues():
+            for experiment_id, scores in experiments.iteritems():
+                experiments[experiment_id] = (
+                    get_most_relevant_score_per_experiment(scores))
+
+    return data
@@ -0,0 +1,77 @@
+"""
+Functions to locate and parse DevStaR output files.
+
+DevStaR writes one Tile000001cnt.txt file per image, with one line per
+measurement, e.g. 'LC 1234'.
+"""
+
+from django.conf import settings
+
+from utils.well_tile_conversion import well_to_tile
+
+# Line prefixes in cnt.txt, in the order returned by parse_count_file
+PATTERNS = ('bacteria', 'W', 'LC', 'EC', 'NewcntW', 'NewcntL')
+
+# DevstarScore fields corresponding to each of PATTERNS
+FIELDS = ('is_bacteria_present', 'area_adult', 'area_larva', 'area_embryo',
+          'count_adult', 'count_larva')
+
+
+def get_count_path(plate_id, well):
+    """Get the path to the DevStaR count file for an experiment well."""
+    return '{}/{}/{}cnt.txt'.format(settings.BASE_DIR_DEVSTAR_OUTPUT,
+                                    plate_id, well_to_tile(well))
+
+
+def parse_count_file(path):
+    """
+    Parse a DevStaR count file.
+
+    Returns a list with the value for each of PATTERNS, with None for
+    those missing from the file. Reading stops as soon as all patterns
+    have been found.
+
+    Raises IOError if the file cannot be read, and ValueError if a
+    matching line cannot be parsed.
+    """
+    counts = [None] * len(PATTERNS)
+    remaining = len(PATTERNS)
+
+    with open(path, 'r') as f:
+        for line_number, line in enumerate(f, start=1):
+            for i, pattern in enumerate(PATTERNS):
+                if line.startswith(pattern):
+                    try:
+                        value = int(line.split()[1])
+                    except (IndexError, ValueError):
+                        raise ValueError('Error parsing line {} of {}'
+                                         .format(line_number, path))
+
+                    if counts[i] is None:
+                        remaining -= 1
+                    counts[i] = value
+
+            if not remaining:
+                break
+
+    if counts[0] is not None:
+        counts[0] = bool(counts[0])
+
+    return counts
+
+
+def parse_count_file_for_experiment(job):
+    """
+    Parse the count file for an experiment, catching errors.
+
+    job is a 2-tuple of (experiment_id, path). Returns a 3-tuple of
+    (experiment_id, counts, error), where exactly one of counts and
+    error is None. Module-level so that it can be used with a
+    multiprocessing pool.
+    """
+    experiment_id, path = job
+
+    try:
+        return (experiment_id, parse_count_file(path), None)
+    except (IOError, ValueError) as e:
+        return (experiment_id, None, str(e))
@@ -0,0 +1,203 @@
+"""
+Helpers to gather the experiments shown on the knockdown pages.
+
+These fetch each category of experiment (e.g. mutant + RNAi, N2 + L4440)
+for all requested clones at once, and organize them in memory, so that
+the number of queries does not grow with the number of clones or dates.
+"""
+
+from collections import OrderedDict
+
+from django.db.models import Prefetch
+
+from clones.models import Clone
+from experiments.models import Experiment, ManualScore
+from library.models import LibraryStock
+from utils.comparison import get_closest_candidate
+from utils.http import build_url
+from worms.models import WormStrain
+
+
+def get_double_knockdown_data(mutant, clones, temperature):
+    """
+    Get the experiments for the double knockdown page.
+
+    The data returned is organized as:
+
+        {clone: {
+            library_stock: {
+                date: {
+                    'mutant_rnai': {
+                        'experiments': [experiments], 'link_to_all': url
+                    },
+                    'n2_rnai': {...},
+                    'mutant_l4440': {...},
+                    'n2_l4440': {...},
+                }
+            }
+        }}
+
+    Dates are those on which mutant was tested with the library stock
+    at temperature. The N2 controls are restricted to the temperature
+    closest to temperature on that date.
+    """
+    n2 = WormStrain.get_n2()
+    l4440 = Clone.get_l4440()
+
+    library_stocks = list(
+        LibraryStock.objects.filter(intended_clone__in=clones)
+        .order_by('-plate__screen_stage', 'id'))
+
+    mutant_rnai = _get_experiments(
+        {
+            'is_junk': False,
+            'worm_strain': mutant.pk,
+            'library_stock__in': library_stocks,
+            'plate__temperature': temperature,
+        },
+        join_manual=True)
+
+    dates = set(experiment.plate.date for experiment in mutant_rnai)
+
+    mutant_l4440 = _get_experiments({
+        'is_junk': False,
+        'worm_strain': mutant.pk,
+        'library_stock__intended_clone': l4440,
+        'plate__temperature': temperature,
+        'plate__date__in': dates,
+    })
+
+    n2_rnai = _get_experiments({
+        'is_junk': False,
+        'worm_strain': n2.pk,
+        'library_stock__in': library_stocks,
+        'plate__date__in': dates,
+    })
+
+    n2_l4440 = _get_experiments({
+        'is_junk': False,
+        'worm_strain': n2.pk,
+        'library_stock__intended_clone': l4440,
+        'plate__date__in': dates,
+    })
+
+    mutant_rnai = _group(mutant_rnai, lambda e: (e.library_stock_id,
+                                                 e.plate.date))
+    mutant_l4440 = _group(mutant_l4440, lambda e: e.plate.date)
+    n2_rnai = _group(n2_rnai, lambda e: (e.library_stock_id, e.plate.date))
+    n2_l4440 = _group(n2_l4440, lambda e: e.plate.date)
+
+    stocks_by_clone = {}
+    for library_stock in library_stocks:
+        stocks_by_clone.setdefault(library_stock.intended_clone_id,
+                                   []).append(library_stock)
+
+    dates_by_stock = {}
+    for library_stock_pk, date in mutant_rnai:
+        dates_by_stock.setdefault(library_stock_pk, []).append(date)
+
+    data = OrderedDict()
+
+    for clone in clones:
+        data_per_clone = OrderedDict()
+
+        for library_stock in stocks_by_clone.get(clone.pk, []):
+            data_per_well = OrderedDict()
+
+            stock_dates = dates_by_stock.get(library_stock.pk, [])
+
+            for date in sorted(stock_dates, reverse=True):
+                data_per_well[date] = {
+                    'mutant_rnai': _create_inner_dictionary(
+                        mutant_rnai[(library_stock.pk, date)], {
+                            'is_junk': False,
+                            'plate__date': date,
+                            'worm_strain': mutant.pk,
+                            'library_stock': library_stock,
+                            'plate__temperature': temperature,
+                        }),
+
+                    'mutant_l4440': _create_inner_dictionary(
+                        mutant_l4440.get(date, []), {
+                            'is_junk': False,
+                            'plate__date': date,
+                            'worm_strain': mutant.pk,
+                            'library_stock__intended_clone': l4440,
+                            'plate__temperature': temperature,
+                        }),
+
+                    'n2_rnai': _create_closest_temperature_dictionary(
+                        n2_rnai.get((library_stock.pk, date), []),
+                        temperature, {
+                            'is_junk': False,
+                            'plate__date': date,
+                            'worm_strain': n2.pk,
+                            'library_stock': library_stock,
+                        }),
+
+                    'n2_l4440': _create_closest_temperature_dictionary(
+                        n2_l4440.get(date, []), temperature, {
+                            'is_junk': False,
+                            'plate__date': date,
+                            'worm_strain': n2.pk,
+                            'library_stock__intended_clone': l4440,
+                        }),
+                }
+
+            if data_per_well:
+                data_per_clone[library_stock] = data_per_well
+
+        data[clone] = data_per_clone
+
+    return data
+
+
+def _get_experiments(filters, join_manual=False):
+    """
+    Get the experiments matching filters, with their scores prefetched.
+
+    Returns a list in the default Experiment ordering.
+    """
+    experiments = (Experiment.objects.filter(**filters)
+                   .select_related('plate')
+                   .prefetch_related('devstarscore_set'))
+
+    if join_manual:
+        experiments = experiments.prefetch_related(Prefetch(
+            'manualscore_set',
+            queryset=ManualScore.objects.select_related('scorer',
+                                                        'score_code')))
+
+    return list(experiments)
+
+
+def _group(experiments, get_key):
+    """Group experiments into a dictionary of lists according to get_key."""
+    grouped = {}
+    for experiment in experiments:
+        grouped.setdefault(get_key(experiment), []).append(experiment)
+    return grouped
+
+
+def _create_inner_dictionary(experiments, filters):
+    return {
+        'experiments': experiments,
+        'link_to_all': build_url('find_experiment_wells_url', get=filters),
+    }
+
+
+def _create_closest_temperature_dictionary(experiments, goal, filters):
+    """
+    Limit experiments to the temperature closest to goal.
+
+    This mirrors Experiment.get_closest_temperature, which breaks ties
+    in favor of the lower temperature.
+    """
+    temperatures = sorted(set(e.plate.temperature for e in experiments))
+    closest = get_closest_candidate(goal, temperatures)
+
+    filters['plate__temperature'] = closest
+    experiments = [e for e in experiments
+                   if e.plate.temperature == closest]
+
+    return _create_inner_dictionary(experiments, filters)
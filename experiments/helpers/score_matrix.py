@@ -0,0 +1,136 @@
+"""
+Helpers to evaluate score criteria for many library stocks at once.
+
+The most relevant score per replicate is boiled down to an integer
+category, giving a matrix with one row per library stock and one column
+per replicate. Each criteria in experiments.helpers.criteria then
+becomes a handful of NumPy operations over the whole matrix, rather than
+a Python loop over score objects per library stock.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from experiments.helpers.criteria import (
+    passes_enh_primary, passes_sup_secondary_count,
+    passes_sup_secondary_percent, passes_sup_secondary_stringent,
+    shows_any_suppression)
+
+# Category codes. Apart from MISSING (used to pad rows with fewer
+# replicates), these match the index of each category in
+# ManualScore.RELEVANCE_PER_REPLICATE.
+MISSING = -1
+OTHER = 0
+NEGATIVE = 1
+WEAK = 2
+MEDIUM = 3
+STRONG = 4
+
+# Weight of each category code, offset by one so that MISSING is index 0
+_WEIGHTS = np.array([0, 0, 0, 1, 2, 3])
+
+# The criteria functions that have a vectorized equivalent, mapped to
+# the key of that equivalent in the output of evaluate_criteria
+VECTORIZED_CRITERIA = {
+    passes_sup_secondary_stringent: 'passes_stringent',
+    passes_sup_secondary_percent: 'passes_percent',
+    passes_sup_secondary_count: 'passes_count',
+    shows_any_suppression: 'shows_any_suppression',
+    passes_enh_primary: 'passes_enh_primary',
+}
+
+
+def build_score_matrix(data):
+    """
+    Build a category matrix from organized scores.
+
+    data should be organized as returned by
+    WormStrain.get_organized_scores with most_relevant_only=True:
+        data[library_stock][experiment] = most_relevant_score
+
+    Returns a 2-tuple of the library stocks (in row order) and the
+    matrix.
+    """
+    library_stocks = list(data)
+    width = max([len(data[stock]) for stock in library_stocks] or [0])
+    matrix = np.full((len(library_stocks), width), MISSING, dtype=np.int8)
+
+    for i, library_stock in enumerate(library_stocks):
+        row = [score.get_relevance_per_replicate()
+               for score in data[library_stock].itervalues()]
+        matrix[i, :len(row)] = row
+
+    return (library_stocks, matrix)
+
+
+def evaluate_criteria(matrix, singles=None):
+    """
+    Evaluate all criteria for every row of a category matrix.
+
+    singles is an optional boolean array flagging rows for library
+    stocks that only had a single copy tested (see passes_enh_primary).
+
+    Returns a dictionary of arrays, one value per row, keyed by
+    'passes_stringent', 'passes_percent', 'passes_count',
+    'shows_any_suppression', 'passes_enh_primary', and 'average_weight'.
+    """
+    total = np.count_nonzero(matrix != MISSING, axis=1)
+    other = np.count_nonzero(matrix == OTHER, axis=1)
+    weak = np.count_nonzero(matrix == WEAK, axis=1)
+    yes = np.count_nonzero((matrix == MEDIUM) | (matrix == STRONG), axis=1)
+    countable = total - other
+
+    if singles is None:
+        singles = np.zeros(len(matrix), dtype=bool)
+
+    passes_count = ((yes >= 3) |
+                    ((yes >= 1) & (yes + weak >= 4)) |
+                    (yes + weak >= 5))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        passes_stringent = (total > 0) & (yes / total >= .375)
+
+        yes_fraction = yes / countable
+        weak_fraction = weak / countable
+        passes_percent = np.where(
+            countable == 0, False,
+            np.where(countable < 8, passes_count,
+                     (yes_fraction >= .375) |
+                     ((yes_fraction >= .125) &
+                      (yes_fraction + weak_fraction >= .5)) |
+                     (yes_fraction + weak_fraction >= .625)))
+
+        total_weight = _WEIGHTS[matrix + 1].sum(axis=1)
+        average_weight = np.where(countable > 0,
+                                  total_weight / countable, 0)
+
+    return {
+        'passes_stringent': passes_stringent,
+        'passes_percent': passes_percent.astype(bool),
+        'passes_count': passes_count,
+        'shows_any_suppression': (yes + weak) > 0,
+        'passes_enh_primary': (yes > 0) | (weak >= 2) |
+                              ((weak == 1) & singles),
+        'average_weight': average_weight,
+    }
+
+
+def get_passing_stocks(data, key, singles=None):
+    """
+    Get the set of library stocks in data that pass a criteria.
+
+    data is organized as for build_score_matrix. key is one of the
+    boolean keys returned by evaluate_criteria. singles is an optional
+    list of library stocks that only had a single copy tested.
+    """
+    library_stocks, matrix = build_score_matrix(data)
+
+    if singles is not None:
+        singles = set(singles)
+        singles = np.array([stock in singles for stock in library_stocks],
+                           dtype=bool)
+
+    passes = evaluate_criteria(matrix, singles=singles)[key]
+
+    return set(library_stocks[i] for i in np.flatnonzero(passes))
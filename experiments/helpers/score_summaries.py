@@ -0,0 +1,99 @@
+"""
+Helpers to summarize the scores of experiments for display.
+
+Listing pages show a manual and DevStaR score summary for every
+experiment. Rather than querying the scores (and each score's scorer
+and code) per experiment, attach_score_summaries loads the scores of a
+whole page of experiments in a fixed number of queries, and attaches
+ready-made summaries that the template filters use.
+"""
+
+from collections import OrderedDict
+
+from django.db.models import Prefetch
+from django.db.models.query import prefetch_related_objects
+from django.utils.timezone import localtime
+
+from experiments.models import DevstarScore, ManualScore
+
+
+def attach_score_summaries(experiments):
+    """
+    Load the scores of experiments in bulk, and attach their summaries.
+
+    Sets manual_score_summary and devstar_score_summary on each
+    experiment. The scores themselves are attached as
+    prefetched_manual_scores and prefetched_devstar_scores, which
+    get_manual_scores and get_devstar_scores use instead of querying.
+
+    Costs two queries, however many experiments there are. Returns
+    experiments as a list.
+    """
+    experiments = list(experiments)
+
+    prefetch_related_objects(experiments, [
+        Prefetch('manualscore_set',
+                 queryset=ManualScore.objects.select_related(
+                     'scorer', 'score_code'),
+                 to_attr='prefetched_manual_scores'),
+        Prefetch('devstarscore_set',
+                 queryset=DevstarScore.objects.all(),
+                 to_attr='prefetched_devstar_scores'),
+    ])
+
+    for experiment in experiments:
+        experiment.manual_score_summary = summarize_manual_scores(
+            experiment.prefetched_manual_scores)
+        experiment.devstar_score_summary = summarize_devstar_scores(
+            experiment.prefetched_devstar_scores)
+
+    return experiments
+
+
+def summarize_manual_scores(scores):
+    """
+    Get a string summarizing manual scores.
+
+    Groups such that scores by different scorers, and scores made at
+    different timepoints, can be distinguished.
+    """
+    d = OrderedDict()
+    for score in scores:
+        scorer = score.scorer
+        timestamp = localtime(score.timestamp)
+        if scorer not in d:
+            d[scorer] = OrderedDict()
+        if timestamp not in d[scorer]:
+            d[scorer][timestamp] = []
+        d[scorer][timestamp].append(score.score_code.short_description)
+
+    people = []
+    for s in d:
+        output = '{}:'.format(s.get_short_name())
+        for t in d[s]:
+            t_string = t.strftime('%Y-%m-%d %H:%M')
+            joined = ', '.join(str(item) for item in d[s][t])
+            output += ' {} ({})'.format(joined, t_string)
+        people.append(output)
+
+    return '; '.join(str(item) for item in people)
+
+
+def summarize_devstar_scores(scores):
+    """Get a string summarizing DevStaR scores."""
+    output = []
+
+    for score in scores:
+        o = '{} adults, {} larvae, {} embryos'.format(
+            score.count_adult, score.count_larva, score.count_embryo)
+
+        if isinstance(score.survival, float):
+            o += ', {:.2f} survival'.format(score.survival)
+        else:
+            o += ', {} survival'.format(score.survival)
+
+        if score.is_bacteria_present:
+            o += ', bacteria detected'
+        output.append(o)
+
+    return '; '.join(str(item) for item in output)
@@ -1,10 +1,8 @@
 from __future__ import division
 from collections import OrderedDict
 
-from experiments.helpers.criteria import (
-    passes_sup_secondary_percent,
-    passes_sup_secondary_count,
-    passes_sup_secondary_stringent)
+from experiments.helpers.score_matrix import (build_score_matrix,
+                                              evaluate_criteria)
 
 from worms.models import WormStrain
 
@@ -74,34 +72,59 @@ def organize_manual_scores(scores, most_relevant_only=False):
 
 # pass in the organized scores from views_secondary_scores
 def calculate_average_scores(data):
+    """
+    Annotate each library stock in data with its criteria results.
+
+    data should be organized as returned by
+    WormStrain.get_organized_scores with most_relevant_only=True.
+
+    Sets avg, passes_stringent, passes_percent and passes_count on
+    each library stock, and returns counts of each.
+    """
+    library_stocks, matrix = build_score_matrix(data)
+    results = evaluate_criteria(matrix)
 
-    data_stats = {}
+    for i, stock in enumerate(library_stocks):
+        stock.avg = float(results['average_weight'][i])
+        stock.passes_stringent = bool(results['passes_stringent'][i])
+        stock.passes_percent = bool(results['passes_percent'][i])
+        stock.passes_count = bool(results['passes_count'][i])
 
-    data_stats['num_passes_stringent'] = 0
-    data_stats['num_passes_percent'] = 0
-    data_stats['num_passes_count'] = 0
-    data_stats['num_experiment_columns'] = 0
+    return {
+        'num_passes_stringent': int(results['passes_stringent'].sum()),
+        'num_passes_percent': int(results['passes_percent'].sum()),
+        'num_passes_count': int(results['passes_count'].sum()),
+        'num_experiment_columns': matrix.shape[1],
+    }
 
-    for stock, expts in data.iteritems():
-        scores = expts.values()
-        stock.avg = get_average_score_weight(scores)
 
-        stock.passes_stringent = passes_sup_secondary_stringent(scores)
-        stock.passes_percent = passes_sup_secondary_percent(
-            scores)
-        stock.passes_count = passes_sup_secondary_count(scores)
+def get_summary_stats(summaries):
+    """
+    Get the number of summaries passing each criteria.
 
-        if stock.passes_stringent:
+    summaries should be ManualScoreSummary instances. Also includes
+    the largest number of replicates in any one summary, as
+    'num_experiment_columns'.
+    """
+    data_stats = {
+        'num_passes_stringent': 0,
+        'num_passes_percent': 0,
+        'num_passes_count': 0,
+        'num_experiment_columns': 0,
+    }
+
+    for summary in summaries:
+        if summary.passes_stringent:
             data_stats['num_passes_stringent'] += 1
 
-        if stock.passes_percent:
+        if summary.passes_percent:
             data_stats['num_passes_percent'] += 1
 
-        if stock.passes_count:
+        if summary.passes_count:
             data_stats['num_passes_count'] += 1
 
-        if len(expts) > data_stats['num_experiment_columns']:
-            data_stats['num_experiment_columns'] = len(expts)
+        if summary.num_replicates > data_stats['num_experiment_columns']:
+            data_stats['num_experiment_columns'] = summary.num_replicates
 
     return data_stats
 
@@ -0,0 +1,64 @@
+"""
+Functions to build scoring queues in the background.
+
+Writing a queue's items (one row per experiment to score) takes too
+long for a page request on a large screen, so it is done by a worker
+thread in the web process. Until a queue is built, pages are taken from
+the front of its shuffled order, computed in memory. If the web process
+restarts mid-build, the queue is claimed and built again once
+ScoringQueue.BUILD_TIMEOUT has passed.
+"""
+
+from multiprocessing.pool import ThreadPool
+import threading
+
+from django.db import connection
+
+from experiments.models import ScoringQueue, get_experiments_in_order
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_next_experiments(scorer, signature, get_candidate_ids, num,
+                         cursor=None):
+    """
+    Get the next num experiments from the scorer's queue for signature.
+
+    get_candidate_ids is a callable returning the ids of the experiments
+    to score, which should already exclude those scored by scorer. It is
+    only called if the queue must be built.
+
+    Returns a 3-tuple as ScoringQueue.get_next_experiments. Until the
+    queue is built, the cursor returned is None.
+    """
+    queue, must_build = ScoringQueue.claim(scorer, signature)
+
+    if queue.is_ready:
+        return queue.get_next_experiments(num, cursor)
+
+    candidate_ids = list(get_candidate_ids())
+
+    if must_build:
+        _get_pool().apply_async(_build_in_worker, (queue, candidate_ids))
+
+    ids = queue.shuffle(candidate_ids)[:num]
+    return (get_experiments_in_order(ids), len(candidate_ids), None)
+
+
+def _get_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(1)
+
+    return _pool
+
+
+def _build_in_worker(queue, experiment_ids):
+    try:
+        queue.build(experiment_ids)
+    finally:
+        # Worker threads each get their own connection
+        connection.close()
@@ -1,22 +1,32 @@
+from abc import ABCMeta, abstractmethod
 import argparse
 import csv
+from multiprocessing.pool import ThreadPool
 import os
 import re
 import requests
 import shutil
+import tarfile
+import tempfile
+import zipfile
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 
 from utils.well_tile_conversion import well_to_tile
 
+# Extension for each image mode, following Experiment.get_image_url
+EXTENSIONS = {
+    'big': '.bmp',
+    'thumbnail': '.jpg',
+    'devstar': 'res.png',
+}
+
 
 class Command(BaseCommand):
     """
     Command to copy a set of images from the server to a local directory.
 
-    Currently works only for the full-size, original .bmp images.
-
     Input is a csv in which each row is in format `experiment_id,well`
     or `experiment_id,tile`. For example, all these rows are okay:
 
@@ -32,6 +42,14 @@ class Command(BaseCommand):
     If the first element cannot be converted to an int, or if the second
     cannot be converted to a well, the row is skipped. So having a
     header row is okay.
+
+    Images are fetched over HTTP by default, or copied from --source-dir
+    if the images are on this machine. Copies run in parallel. Each image
+    is written to a temporary file and renamed when complete, and images
+    already in output_dir with the expected size are skipped, so an
+    interrupted copy can be resumed by running the command again.
+    Failed images are listed in failures.csv in output_dir, rather than
+    stopping the copy.
     """
 
     help = 'Copy a set of images to a local directory.'
@@ -45,49 +63,252 @@ class Command(BaseCommand):
         parser.add_argument('output_dir',
                             help='Directory in which to write the images.')
 
+        parser.add_argument('--mode', choices=sorted(EXTENSIONS),
+                            default='big',
+                            help=('Which images to copy: full-size bmp '
+                                  '(default), jpg thumbnail, or DevStaR '
+                                  'png'))
+
+        parser.add_argument('--source-dir',
+                            help=('Copy from this local directory (with '
+                                  'one subdirectory per experiment) '
+                                  'instead of over HTTP'))
+
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Number of simultaneous copies. Default 8')
+
+        parser.add_argument('--archive',
+                            help=('Also add the images to this .tar, '
+                                  '.tar.gz or .zip file, as they are '
+                                  'copied'))
+
     def handle(self, **options):
         input_file = options['input_file']
         output_dir = options['output_dir']
+        archive_path = options['archive']
 
-        # Create output directory, exiting if already exists
-        if os.path.exists(output_dir):
-            raise CommandError('Output directory {} already exists'
-                               .format(output_dir))
-        else:
+        if options['threads'] < 1:
+            raise CommandError('--threads must be positive')
+
+        if options['source_dir'] and not os.path.isdir(options['source_dir']):
+            raise CommandError('{} is not a directory'
+                               .format(options['source_dir']))
+
+        if not os.path.isdir(output_dir):
             os.makedirs(output_dir)
 
-        # Parse input
-        reader = csv.reader(input_file, delimiter=',')
+        jobs = _parse_input(input_file, options['mode'])
+
+        if options['source_dir']:
+            copier = LocalCopier(options['source_dir'], output_dir)
+        else:
+            copier = HTTPCopier(_get_base_url(options['mode']), output_dir,
+                                options['threads'])
+
+        archive = _open_archive(archive_path) if archive_path else None
+        failures = []
+        num_copied = 0
+        num_skipped = 0
+
+        pool = ThreadPool(options['threads'])
+        try:
+            results = pool.imap_unordered(copier.copy, jobs)
+
+            for filename, status, error in results:
+                if status == 'failed':
+                    self.stderr.write('FAILED {}: {}'.format(filename, error))
+                    failures.append((filename, error))
+                    continue
+
+                if status == 'copied':
+                    num_copied += 1
+                    self.stdout.write('{} written'.format(filename))
+                else:
+                    num_skipped += 1
+
+                if archive:
+                    _add_to_archive(archive,
+                                    os.path.join(output_dir, filename),
+                                    filename)
+
+        finally:
+            pool.terminate()
+            if archive:
+                archive.close()
+
+        report_path = os.path.join(output_dir, 'failures.csv')
+        if failures:
+            with open(report_path, 'wb') as f:
+                writer = csv.writer(f)
+                writer.writerow(('filename', 'error'))
+                writer.writerows(failures)
+        elif os.path.exists(report_path):
+            os.remove(report_path)
+
+        self.stdout.write('{} copied, {} already present, {} failed'
+                          .format(num_copied, num_skipped, len(failures)))
+
+        if failures:
+            self.stdout.write('Failures listed in {}'.format(report_path))
+
+
+class Copier(object):
+    """
+    Copies one image per job into output_dir.
+
+    Subclasses define where images are copied from, by implementing
+    get_size and write. copy is called from multiple threads.
+    """
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def copy(self, job):
+        """
+        Copy the image for job, a 3-tuple (experiment_id, tile, extension).
 
-        for experiment_id, well in reader:
+        Returns a 3-tuple of (output filename, status, error), where
+        status is 'copied', 'present' or 'failed'.
+        """
+        experiment_id, tile, extension = job
+        source = '{}/{}{}'.format(experiment_id, tile, extension)
+        filename = '{}_{}{}'.format(experiment_id, tile, extension)
+        path = os.path.join(self.output_dir, filename)
+
+        try:
+            size = self.get_size(source)
+
+            if (size is not None and os.path.isfile(path) and
+                    os.path.getsize(path) == size):
+                return (filename, 'present', None)
+
+            temporary = tempfile.NamedTemporaryFile(
+                dir=self.output_dir, prefix='.' + filename, delete=False)
+            try:
+                with temporary:
+                    self.write(source, temporary)
+
+                # Temporary files are only readable by the owner
+                os.chmod(temporary.name, 0o644)
+                os.rename(temporary.name, path)
+            except BaseException:
+                os.remove(temporary.name)
+                raise
+
+        except Exception as e:
+            return (filename, 'failed', str(e))
+
+        return (filename, 'copied', None)
+
+    @abstractmethod
+    def get_size(self, source):
+        """Get the size of source in bytes, or None if unknown."""
+
+    @abstractmethod
+    def write(self, source, f):
+        """Write the contents of source to open file f."""
+
+
+class LocalCopier(Copier):
+    def __init__(self, source_dir, output_dir):
+        super(LocalCopier, self).__init__(output_dir)
+        self.source_dir = source_dir
+
+    def get_size(self, source):
+        return os.path.getsize(os.path.join(self.source_dir, source))
+
+    def write(self, source, f):
+        with open(os.path.join(self.source_dir, source), 'rb') as source_f:
+            shutil.copyfileobj(source_f, f)
+
+
+class HTTPCopier(Copier):
+    def __init__(self, base_url, output_dir, num_connections):
+        super(HTTPCopier, self).__init__(output_dir)
+        self.base_url = base_url
+
+        # One session shared by all threads, so connections are reused
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=num_connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_size(self, source):
+        r = self.session.head(self._get_url(source), timeout=30)
+        r.raise_for_status()
+        size = r.headers.get('content-length')
+        return int(size) if size is not None else None
+
+    def write(self, source, f):
+        r = self.session.get(self._get_url(source), stream=True, timeout=30)
+        r.raise_for_status()
+        for chunk in r.iter_content(chunk_size=64 * 1024):
+            f.write(chunk)
+
+    def _get_url(self, source):
+        return '{}/{}'.format(self.base_url, source)
+
+
+def _parse_input(input_file, mode):
+    """Get the list of unique (experiment_id, tile, extension) to copy."""
+    extension = EXTENSIONS[mode]
+    jobs = []
+    seen = set()
+
+    reader = csv.reader(input_file, delimiter=',')
+
+    for experiment_id, well in reader:
+        try:
+            experiment_id = int(experiment_id.strip())
+        except ValueError:
+            continue
+
+        well = well.strip()
+
+        if re.match('Tile0000\d\d\.bmp', well):
+            tile = well.split('.bmp')[0]
+        elif re.match('Tile0000\d\d', well):
+            tile = well
+        else:
             try:
-                experiment_id = int(experiment_id.strip())
+                tile = well_to_tile(well)
             except ValueError:
                 continue
 
-            well = well.strip()
+        job = (experiment_id, tile, extension)
+        if job not in seen:
+            seen.add(job)
+            jobs.append(job)
+
+    return jobs
+
+
+def _get_base_url(mode):
+    if mode == 'thumbnail':
+        return settings.BASE_URL_THUMBNAIL
+    elif mode == 'devstar':
+        return settings.BASE_URL_DEVSTAR
+    else:
+        return settings.BASE_URL_IMG
 
-            if re.match('Tile0000\d\d\.bmp', well):
-                tile = well.split('.bmp')[0]
-            elif re.match('Tile0000\d\d', well):
-                tile = well
-            else:
-                try:
-                    tile = well_to_tile(well)
-                except ValueError:
-                    continue
 
-            input_image_url = '{}/{}/{}.bmp'.format(
-                settings.BASE_URL_IMG, experiment_id, tile)
-            output_image_path = '{}/{}_{}.bmp'.format(
-                output_dir, experiment_id, tile)
-            r = requests.get(input_image_url, stream=True)
-            if r.status_code != 200:
-                raise CommandError('non-ok GET status for {}'
-                                   .format(input_image_url))
+def _open_archive(path):
+    if path.endswith('.zip'):
+        return zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED,
+                               allowZip64=True)
+    elif path.endswith('.tar.gz') or path.endswith('.tgz'):
+        return tarfile.open(path, 'w:gz')
+    elif path.endswith('.tar'):
+        return tarfile.open(path, 'w')
+    else:
+        raise CommandError('--archive must end in .tar, .tar.gz or .zip')
 
-            with open(output_image_path, 'wb') as f:
-                r.raw.decode_content = True
-                shutil.copyfileobj(r.raw, f)
 
-            self.stdout.write('{} written'.format(output_image_path))
+def _add_to_archive(archive, path, name):
+    if isinstance(archive, zipfile.ZipFile):
+        archive.write(path, name)
+    else:
+        archive.add(path, name)
@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 
-from experiments.helpers.criteria import passes_sup_secondary_stringent
+from experiments.models import ManualScoreSummary
 from library.helpers.sequencing import categorize_sequences_by_blat_results
 from library.models import LibrarySequencing
 from worms.models import WormStrain
@@ -51,8 +51,8 @@ class Command(BaseCommand):
         # and add to the list of interactions
         w = {}
         for worm in worms:
-            positives = worm.get_positives('SUP', 2,
-                                           passes_sup_secondary_stringent)
+            positives = ManualScoreSummary.get_positives(
+                worm, 'SUP', 2, 'passes_stringent')
 
             pos_verified = positives.intersection(verified)
 
@@ -1,12 +1,11 @@
 from django.core.management.base import BaseCommand
 
-from experiments.helpers.criteria import (
-    shows_any_suppression as criteria)
-from experiments.helpers.scores import get_positives_any_worm
+from experiments.models import ManualScoreSummary
 from library.helpers.sequencing import (
     categorize_sequences_by_blat_results, NO_BLAT, NO_MATCH, NO_CLONE_BLAT)
 from library.models import LibrarySequencing
 from utils.plates import assign_to_plates, get_plate_assignment_rows
+from worms.models import WormStrain
 
 
 class Command(BaseCommand):
@@ -30,7 +29,10 @@ class Command(BaseCommand):
             help='Number of empty wells per output plate')
 
     def handle(self, **options):
-        positives = get_positives_any_worm('SUP', 2, criteria)
+        positives = set()
+        for worm in WormStrain.get_worms_for_screen_type('SUP'):
+            positives.update(ManualScoreSummary.get_positives(
+                worm, 'SUP', 2, 'shows_any_suppression'))
 
         seqs = (LibrarySequencing.objects
                 .filter(source_stock__in=positives)
@@ -1,20 +1,30 @@
-from itertools import chain
-import os
+from multiprocessing import cpu_count, Pool
+import time
 
-from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
 
+from experiments.helpers.devstar import (FIELDS, get_count_path,
+                                         parse_count_file_for_experiment)
 from experiments.models import Experiment, DevstarScore
 from utils.scripting import require_db_write_acknowledgement
 
 
-PATTERNS = ('bacteria', 'W', 'LC', 'EC', 'NewcntW', 'NewcntL')
+class Command(BaseCommand):
+    """
+    Command to import DevStaR counts from the DevStaR txt output.
 
+    The cnt.txt files are parsed in parallel. New DevstarScore rows are
+    created in batches, each batch in its own transaction. Existing rows
+    with no raw counts are filled in. Existing rows with counts are
+    checked against the txt output, and mismatches are reported.
 
-class Command(BaseCommand):
-    help = ('WORK IN PROGRESS -- does not yet save anything to database. '
-            'Waiting on Lior to normalize cnt.txt output. '
-            'Parse DevStaR txt output, to add to this database.')
+    By default, only experiments without DevStaR counts in the database
+    are parsed, so an interrupted import can be resumed by running
+    this command again.
+    """
+
+    help = 'Import DevStaR counts from the DevStaR txt output.'
 
     def add_arguments(self, parser):
         parser.add_argument('--all', action='store_true', dest='all',
@@ -23,89 +33,129 @@ class Command(BaseCommand):
                                   'those without DevStaR counts in the '
                                   'database'))
 
+        parser.add_argument('--processes', type=int, default=cpu_count(),
+                            help=('Number of processes parsing files. '
+                                  'Default: number of CPUs'))
+
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help=('Number of experiments per database '
+                                  'transaction. Default 1000'))
+
     def handle(self, **options):
-        require_db_write_acknowledgement()
-        return
-
-        if options['all']:
-            experiments = Experiment.objects.all()
-        else:
-            null_devstar_experiment_pks = (
-                DevstarScore.objects.filter(
-                    area_adult__isnull=True,
-                    area_larva__isnull=True,
-                    area_embryo__isnull=True)
-                .values_list('experiment', flat=True))
-
-            null_devstar_experiments = Experiment.objects.filter(
-                pk__in=null_devstar_experiment_pks)
-
-            all_devstar_experiment_pks = (
-                DevstarScore.objects.all()
-                .values_list('experiment', flat=True))
-
-            no_devstar_experiments = Experiment.objects.exclude(
-                pk__in=all_devstar_experiment_pks)
-
-            experiments = sorted(
-                chain(null_devstar_experiments, no_devstar_experiments),
-                key=lambda instance: instance.id)
-
-        for experiment in experiments:
-            path = experiment.get_devstar_count_path()
-
-            if not os.path.isfile(path):
-                self.stderr.write('WARNING: Skipping experiment {} due to '
-                                  'DevStaR file not found'
-                                  .format(experiment))
-                continue
+        if options['processes'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--processes and --batch-size must be '
+                               'positive')
 
-            counts = [None] * 6
+        require_db_write_acknowledgement()
 
-            with open(path, 'r') as f:
-                for line in f:
-                    for i, pattern in enumerate(PATTERNS):
-                        if line.startswith(pattern):
-                            try:
-                                counts[i] = int(line.split()[1])
-                            except Exception:
-                                raise CommandError('Error parsing line {} '
-                                                   'in experiment {}'
-                                                   .format(i, experiment))
+        existing = {}
+        for score in DevstarScore.objects.all().iterator():
+            existing[score.experiment_id] = score
+
+        experiments = (Experiment.objects.order_by('id')
+                       .values_list('id', 'plate_id', 'well'))
+
+        jobs = []
+        for experiment_id, plate_id, well in experiments:
+            score = existing.get(experiment_id)
+            if options['all'] or score is None or _has_no_counts(score):
+                jobs.append((experiment_id, get_count_path(plate_id, well)))
+
+        self.stdout.write('{} experiments to parse'.format(len(jobs)))
+
+        self.num_created = 0
+        self.num_filled = 0
+        self.num_matched = 0
+        self.num_mismatched = 0
+        self.num_skipped = 0
+        start = time.time()
+
+        # Workers only read files; do not share the database connection
+        connections.close_all()
+        pool = Pool(options['processes'])
+        try:
+            results = pool.imap(parse_count_file_for_experiment, jobs,
+                                chunksize=100)
+
+            batch = []
+            for i, result in enumerate(results, start=1):
+                batch.append(result)
+
+                if len(batch) == options['batch_size'] or i == len(jobs):
+                    self._process_batch(batch, existing)
+                    batch = []
+
+                    elapsed = time.time() - start
+                    self.stdout.write(
+                        '{}/{} parsed ({:.0f} per second): {} created, '
+                        '{} filled in, {} matched, {} mismatched, '
+                        '{} skipped'.format(
+                            i, len(jobs), i / elapsed if elapsed else 0,
+                            self.num_created, self.num_filled,
+                            self.num_matched, self.num_mismatched,
+                            self.num_skipped))
+
+        finally:
+            pool.terminate()
+
+    def _process_batch(self, batch, existing):
+        to_create = []
+        to_fill = []
+
+        for experiment_id, counts, error in batch:
+            if error:
+                self.stderr.write('WARNING: Skipping experiment {}: {}'
+                                  .format(experiment_id, error))
+                self.num_skipped += 1
+                continue
 
-            for i, count in enumerate(counts):
+            for field, count in zip(FIELDS, counts):
                 if count is None:
                     self.stderr.write('WARNING: {} count is missing '
                                       'for experiment {}'
-                                      .format(PATTERNS[i], experiment))
-
-            new_score = DevstarScore(
-                experiment=experiment,
-                is_bacteria_present=counts[0], area_adult=counts[1],
-                area_larva=counts[2], area_embryo=counts[3],
-                count_adult=counts[4], count_larva=counts[5],
-            )
-
-            # If score already exists in database, check for match
-            try:
-                previous_score = DevstarScore.objects.get(
-                    experiment=experiment)
-
-                if not previous_score.matches_raw_fields(new_score):
-                    raise CommandError('The DevStaR txt output does '
-                                       'not match the existing database '
-                                       'entry for Experiment {}'
-                                       .format(experiment))
-
-            except ObjectDoesNotExist:
-                self.stderr.write('DevStaR object not found for {}. '
-                                  'Attempting to save.'
-                                  .format(experiment))
-                try:
-                    new_score.full_clean()
-
-                except ValidationError:
-                    raise CommandError('Cleaning DevStaR object {} '
-                                       'raised ValidationError'
-                                       .format(new_score))
-                # new_score.save()
+                                      .format(field, experiment_id))
+
+            new_score = DevstarScore(experiment_id=experiment_id,
+                                     **dict(zip(FIELDS, counts)))
+            new_score.clean()
+
+            previous_score = existing.get(experiment_id)
+
+            if previous_score is None:
+                to_create.append(new_score)
+
+            elif _has_no_counts(previous_score):
+                new_score.pk = previous_score.pk
+                to_fill.append(new_score)
+
+            elif previous_score.matches_raw_fields(new_score):
+                self.num_matched += 1
+
+            else:
+                self.stderr.write('WARNING: The DevStaR txt output does '
+                                  'not match the existing database '
+                                  'entry for Experiment {}'
+                                  .format(experiment_id))
+                self.num_mismatched += 1
+
+        with transaction.atomic():
+            DevstarScore.objects.bulk_create(to_create)
+
+            for score in to_fill:
+                DevstarScore.objects.filter(pk=score.pk).update(
+                    **_get_count_fields(score))
+
+        self.num_created += len(to_create)
+        self.num_filled += len(to_fill)
+
+
+def _has_no_counts(score):
+    return (score.area_adult is None and score.area_larva is None and
+            score.area_embryo is None)
+
+
+def _get_count_fields(score):
+    """Get the raw and derived count fields of score, as a dictionary."""
+    fields = FIELDS + ('count_embryo', 'larva_per_adult',
+                       'embryo_per_adult', 'survival', 'lethality')
+    return {field: getattr(score, field) for field in fields}
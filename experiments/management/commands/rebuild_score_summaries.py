@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from experiments.models import ManualScoreSummary
+from utils.scripting import require_db_write_acknowledgement
+from worms.models import WormStrain
+
+
+class Command(BaseCommand):
+    """
+    Command to rebuild the stored manual score summaries.
+
+    Rebuilds the all-scorers summary for each worm in the screen, plus
+    any scorer-limited summaries that have previously been built.
+    Scores saved or deleted through the ORM, bulk-created by the scoring
+    pages, or synced from the legacy database refresh their summaries
+    automatically. Run this after changing manual scores any other way
+    (e.g. with QuerySet.update or raw SQL).
+    """
+
+    help = 'Rebuild the stored manual score summaries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--screen-type', dest='screen_type',
+                            choices=('ENH', 'SUP'), default='SUP',
+                            help='Screen type to rebuild. Default SUP')
+
+        parser.add_argument('--screen-stage', dest='screen_stage',
+                            type=int, choices=(1, 2), default=2,
+                            help='Screen stage to rebuild. Default 2')
+
+        parser.add_argument('--worm', dest='worm',
+                            help='Limit to the worm strain with this pk')
+
+    def handle(self, **options):
+        require_db_write_acknowledgement()
+
+        screen_type = options['screen_type']
+        screen_stage = options['screen_stage']
+
+        worms = WormStrain.get_worms_for_screen_type(screen_type)
+
+        if options['worm']:
+            worms = worms.filter(pk=options['worm'])
+            if not worms:
+                raise CommandError('No {} worm strain with pk {}'
+                                   .format(screen_type, options['worm']))
+
+        for worm in worms:
+            scorers_keys = set(
+                ManualScoreSummary.objects
+                .filter(worm_strain=worm, screen_type=screen_type,
+                        screen_stage=screen_stage)
+                .values_list('scorers', flat=True))
+            scorers_keys.add('')
+
+            for scorers_key in sorted(scorers_keys):
+                scorers = ManualScoreSummary.get_scorers_from_key(scorers_key)
+                summaries = ManualScoreSummary.rebuild(
+                    worm, screen_type, screen_stage, scorers=scorers)
+
+                self.stdout.write('{} {} {} [{}]: {} summaries'.format(
+                    worm, screen_type, screen_stage,
+                    scorers_key or 'all scorers', len(summaries)))
@@ -0,0 +1,132 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from experiments.models import Experiment, ExperimentPlate, ImageAvailability
+from utils.scripting import require_db_write_acknowledgement
+from utils.well_tile_conversion import well_to_tile
+
+# Filename suffix after the tile for each ImageAvailability field
+SUFFIXES = {
+    'image': '.bmp',
+    'thumbnail': '.jpg',
+    'devstar': 'res.png',
+}
+
+
+class Command(BaseCommand):
+    """
+    Command to scan image directories into the ImageAvailability index.
+
+    Each directory is expected to contain one subdirectory per
+    experiment plate, with one file per tile (the same layout as the
+    image urls). Each plate directory is listed once, rather than
+    checking each file.
+
+    Modes whose directory is not provided are left as they are, to be
+    filled in on demand by Experiment.is_image_available, except that
+    missing entries that have expired are cleared (the scan updates each
+    row's timestamp, which would otherwise renew them). This is meant
+    to be run periodically (e.g. nightly from cron), and after new
+    images are added.
+    """
+
+    help = 'Scan image directories into the image availability index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image-dir',
+                            help='Directory with the full-size images')
+
+        parser.add_argument('--thumbnail-dir',
+                            help='Directory with the thumbnail images')
+
+        parser.add_argument('--devstar-dir',
+                            default=settings.BASE_DIR_DEVSTAR_OUTPUT,
+                            help=('Directory with the DevStaR-labelled '
+                                  'images. Default: '
+                                  'BASE_DIR_DEVSTAR_OUTPUT'))
+
+        parser.add_argument('--plates', nargs='+', type=int,
+                            help='Limit to these experiment plates')
+
+    def handle(self, **options):
+        directories = {
+            'image': options['image_dir'],
+            'thumbnail': options['thumbnail_dir'],
+            'devstar': options['devstar_dir'],
+        }
+        directories = {field: directory
+                       for field, directory in directories.iteritems()
+                       if directory}
+
+        for field, directory in directories.iteritems():
+            if not os.path.isdir(directory):
+                raise CommandError('{} is not a directory'.format(directory))
+
+        require_db_write_acknowledgement()
+
+        plates = ExperimentPlate.objects.order_by('id')
+        if options['plates']:
+            plates = plates.filter(pk__in=options['plates'])
+
+        plate_ids = plates.values_list('id', flat=True)
+
+        for plate_id in plate_ids:
+            counts = self._scan_plate(plate_id, directories)
+            self.stdout.write('Plate {}: {}'.format(plate_id, ', '.join(
+                '{} {}/{}'.format(field, num_available, num_total)
+                for field, (num_available, num_total)
+                in sorted(counts.iteritems()))))
+
+    def _scan_plate(self, plate_id, directories):
+        wells = dict(Experiment.objects.filter(plate_id=plate_id)
+                     .values_list('id', 'well'))
+
+        indexed = set(ImageAvailability.objects
+                      .filter(experiment__in=wells.keys())
+                      .values_list('experiment_id', flat=True))
+
+        counts = {}
+        now = timezone.now()
+        cutoff = ImageAvailability.get_missing_cutoff()
+
+        with transaction.atomic():
+            ImageAvailability.objects.bulk_create(
+                [ImageAvailability(experiment_id=experiment_id)
+                 for experiment_id in wells
+                 if experiment_id not in indexed])
+
+            for field in ImageAvailability.FIELDS:
+                if field not in directories:
+                    ImageAvailability.objects.filter(
+                        experiment__in=wells.keys(), timestamp__lt=cutoff,
+                        **{field: False}).update(**{field: None})
+
+            for field, directory in directories.iteritems():
+                filenames = _list_directory(
+                    os.path.join(directory, str(plate_id)))
+
+                available = [
+                    experiment_id for experiment_id, well in wells.iteritems()
+                    if well_to_tile(well) + SUFFIXES[field] in filenames]
+
+                index = ImageAvailability.objects.filter(
+                    experiment__in=wells.keys())
+                index.filter(experiment__in=available).update(
+                    timestamp=now, **{field: True})
+                index.exclude(experiment__in=available).update(
+                    timestamp=now, **{field: False})
+
+                counts[field] = (len(available), len(wells))
+
+        return counts
+
+
+def _list_directory(path):
+    try:
+        return set(os.listdir(path))
+    except OSError:
+        return set()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 20:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worms', '0003_auto_20160729_2216'),
+        ('library', '0009_auto_20160224_0452'),
+        ('experiments', '0007_auto_20190313_1327'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ManualScoreSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('screen_type', models.CharField(max_length=3)),
+                ('screen_stage', models.PositiveSmallIntegerField()),
+                ('scorers', models.CharField(blank=True, max_length=100)),
+                ('replicate_scores', models.TextField(blank=True)),
+                ('num_replicates', models.PositiveSmallIntegerField()),
+                ('average_weight', models.FloatField()),
+                ('passes_stringent', models.BooleanField()),
+                ('passes_percent', models.BooleanField()),
+                ('passes_count', models.BooleanField()),
+                ('shows_any_suppression', models.BooleanField()),
+                ('timestamp', models.DateTimeField(auto_now=True)),
+                ('library_stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='library.LibraryStock')),
+                ('worm_strain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='worms.WormStrain')),
+            ],
+            options={
+                'ordering': ['worm_strain', 'screen_type', 'screen_stage', 'scorers', 'library_stock'],
+                'db_table': 'ManualScoreSummary',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='manualscoresummary',
+            unique_together=set([('worm_strain', 'library_stock', 'screen_type', 'screen_stage', 'scorers')]),
+        ),
+    ]
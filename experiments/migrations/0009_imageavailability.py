@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 20:55
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0008_auto_20261018_1650'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageAvailability',
+            fields=[
+                ('experiment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='experiments.Experiment')),
+                ('image', models.NullBooleanField(default=None)),
+                ('thumbnail', models.NullBooleanField(default=None)),
+                ('devstar', models.NullBooleanField(default=None)),
+                ('timestamp', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['experiment'],
+                'db_table': 'ImageAvailability',
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 21:38
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def delete_queues(apps, schema_editor):
+    # Queues are rebuilt on demand, and existing ones have no items
+    apps.get_model('experiments', 'ScoringQueue').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0010_auto_20261018_1700'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_queues, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='ScoringQueueItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('experiment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='experiments.Experiment')),
+            ],
+            options={
+                'ordering': ['queue', 'position'],
+                'db_table': 'ScoringQueueItem',
+            },
+        ),
+        migrations.RemoveField(
+            model_name='scoringqueue',
+            name='experiment_ids',
+        ),
+        migrations.AddField(
+            model_name='scoringqueueitem',
+            name='queue',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='experiments.ScoringQueue'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='scoringqueueitem',
+            unique_together=set([('queue', 'position')]),
+        ),
+    ]
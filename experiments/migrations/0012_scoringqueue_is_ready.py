@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 21:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0011_auto_20261018_1738'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scoringqueue',
+            name='is_ready',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,22 +1,34 @@
 from __future__ import division
+from datetime import timedelta
+import json
+import random
 
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
-from django.db import models
-from django.db.models import Case, When
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Value, When
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.utils import timezone
 
 from clones.models import Clone
+from experiments.helpers.devstar import get_count_path
 from experiments.helpers.naming import generate_experiment_id
+from experiments.helpers.score_matrix import (build_score_matrix,
+                                              evaluate_criteria)
 from experiments.helpers.scores import get_most_relevant_score_per_experiment
 from library.models import LibraryPlate, LibraryStock
 from utils.comparison import get_closest_candidate
-from utils.http import build_url
+from utils.http import build_url, http_head_ok
 from utils.plates import get_well_list
+from utils.reference_cache import get_reference
 from utils.well_tile_conversion import well_to_tile
 from worms.models import WormStrain
 
+# ExperimentPlate fields that decide which screen a plate's scores are in
+# (see WormStrain.get_scores), and so which ManualScoreSummary rows
+SUMMARY_PLATE_FIELDS = ('temperature', 'screen_stage')
+
 
 class ExperimentPlate(models.Model):
     """A plate-level experiment."""
@@ -42,11 +54,13 @@ class ExperimentPlate(models.Model):
         """
         Get the experiment wells for this plate, ordered by well.
 
-        Selects the related library stocks and intended clones.
+        Selects the related library stocks, intended clones, and image
+        availability.
         """
         experiments = (self.experiment_set
                        .select_related('library_stock',
-                                       'library_stock__intended_clone')
+                                       'library_stock__intended_clone',
+                                       'imageavailability')
                        .order_by('well'))
 
         return experiments
@@ -95,9 +109,7 @@ class ExperimentPlate(models.Model):
 
     def set_worm_strain(self, worm_strain):
         """Set the worm strain for all wells in this plate."""
-        for experiment in self.experiment_set.all():
-            experiment.worm_strain = worm_strain
-            experiment.save()
+        ExperimentPlate.change_plates([self], worm_strain=worm_strain)
 
     def get_library_plates(self):
         """
@@ -121,11 +133,7 @@ class ExperimentPlate(models.Model):
         Assumes the standard mapping from library_plate positions
         to experiment_plate positions.
         """
-        stocks_by_well = library_plate.get_stocks_as_dictionary()
-        for experiment in self.experiment_set.all():
-            well = experiment.well
-            experiment.library_stock = stocks_by_well[well]
-            experiment.save()
+        ExperimentPlate.change_plates([self], library_plate=library_plate)
 
     def has_junk(self):
         """
@@ -136,9 +144,67 @@ class ExperimentPlate(models.Model):
 
     def set_junk(self, is_junk):
         """Set the junk field for all wells in this plate."""
-        for experiment in self.experiment_set.all():
-            experiment.is_junk = is_junk
-            experiment.save()
+        ExperimentPlate.change_plates([self], is_junk=is_junk)
+
+    @classmethod
+    def change_plates(cls, experiment_plates, worm_strain=None,
+                      library_plate=None, is_junk=None, **fields):
+        """
+        Change many experiment plates, and their wells, at once.
+
+        fields are set on the plates themselves. worm_strain, is_junk,
+        and (using the standard mapping from library_plate positions to
+        experiment_plate positions) library stocks are set for all wells
+        in these plates, unless None.
+
+        Changes are made with one UPDATE per field, in a single
+        transaction. Plate instances passed in are updated to match.
+        Score summaries of the wells, before and after the change, are
+        refreshed in the same transaction.
+        """
+        pks = [experiment_plate.pk for experiment_plate in experiment_plates]
+        wells = Experiment.objects.filter(plate__in=pks)
+
+        changes_summaries = (
+            worm_strain is not None or library_plate is not None or
+            is_junk is not None or
+            any(field in fields for field in SUMMARY_PLATE_FIELDS))
+
+        with transaction.atomic():
+            if changes_summaries:
+                old_wells = list(wells.select_related('plate',
+                                                      'worm_strain'))
+
+            if fields:
+                cls.objects.filter(pk__in=pks).update(**fields)
+
+            if worm_strain is not None:
+                wells.update(worm_strain=worm_strain)
+
+            if is_junk is not None:
+                wells.update(is_junk=is_junk)
+
+            if library_plate is not None:
+                stocks_by_well = library_plate.get_stocks_as_dictionary()
+                missing = wells.exclude(well__in=stocks_by_well.keys())
+                if missing.exists():
+                    raise ValueError('Library plate {} lacks wells {}'.format(
+                        library_plate, sorted(set(
+                            missing.values_list('well', flat=True)))))
+
+                wells.update(library_stock=Case(
+                    *[When(well=well, then=Value(stock.pk))
+                      for well, stock in stocks_by_well.iteritems()],
+                    output_field=models.CharField()))
+
+            if changes_summaries:
+                ManualScoreSummary.refresh_for_experiments(
+                    old_wells + list(wells.select_related('plate',
+                                                          'worm_strain')))
+
+        for experiment_plate in experiment_plates:
+            for key, value in fields.iteritems():
+                setattr(experiment_plate, key, value)
 
     @classmethod
     def get_tested_temperatures(cls):
@@ -265,12 +331,47 @@ class Experiment(models.Model):
             url += '.bmp'
         return url
 
+    def is_image_available(self, mode=None, probe=True):
+        """
+        Check if the image for this experiment is available.
+
+        Consults the ImageAvailability index. If the index does not
+        know (or only knows the image was missing, and that answer has
+        expired), and probe is True, sends a HEAD request for the image
+        and stores the answer in the index. If probe is False, or the
+        HEAD request fails without an answer, returns None.
+        """
+        field = ImageAvailability.get_field(mode)
+
+        try:
+            availability = self.imageavailability
+        except ImageAvailability.DoesNotExist:
+            availability = ImageAvailability(experiment=self)
+
+        is_available = availability.get_availability(field)
+
+        if is_available is None and probe:
+            is_available = http_head_ok(self.get_image_url(mode=mode))
+
+            if is_available is not None:
+                setattr(availability, field, is_available)
+                availability.save()
+
+        return is_available
+
     def is_manually_scored(self):
         """Check if an experiment was manually scored."""
         return not not self.get_manual_scores()
 
     def get_manual_scores(self):
-        """Get all manual scores for this experiment well."""
+        """
+        Get all manual scores for this experiment well.
+
+        Uses the scores loaded by attach_score_summaries, if any.
+        """
+        if hasattr(self, 'prefetched_manual_scores'):
+            return self.prefetched_manual_scores
+
         return self.manualscore_set.all()
 
     def get_most_relevant_manual_score(self):
@@ -283,15 +384,18 @@ class Experiment(models.Model):
         return not not self.get_devstar_scores()
 
     def get_devstar_scores(self):
-        """Get all DevStaR scores for this experiment."""
+        """
+        Get all DevStaR scores for this experiment.
+
+        Uses the scores loaded by attach_score_summaries, if any.
+        """
+        if hasattr(self, 'prefetched_devstar_scores'):
+            return self.prefetched_devstar_scores
+
         return self.devstarscore_set.all()
 
     def get_devstar_count_path(self):
-        tile = well_to_tile(self.well)
-        f = '/'.join((settings.BASE_DIR_DEVSTAR_OUTPUT,
-                      str(self.plate_id), tile))
-        f += 'cnt.txt'
-        return f
+        return get_count_path(self.plate_id, self.well)
 
     def get_l4440_control_filters(self):
         """
@@ -412,7 +516,10 @@ class Experiment(models.Model):
         if this experiment is junk, change it to not junk.
         """
         self.is_junk = not self.is_junk
-        self.save()
+
+        with transaction.atomic():
+            self.save()
+            ManualScoreSummary.refresh_for_experiments([self])
 
     # @classmethod
     # def get_experiment_replicate_plates(cls, filters):
@@ -449,6 +556,69 @@ class Experiment(models.Model):
         return get_closest_candidate(goal, options)
 
 
+class ImageAvailability(models.Model):
+    """
+    Index of which images exist for an experiment.
+
+    There is one field per image mode (full-size image, thumbnail, and
+    DevStaR-labelled image). None means not yet known. False (missing)
+    is only trusted for MISSING_MAX_AGE after the row was last updated,
+    since images may be added later, or a check may have been wrong.
+
+    This is populated by the scan_image_availability command, and
+    filled in on demand by Experiment.is_image_available.
+    """
+
+    experiment = models.OneToOneField(Experiment, models.CASCADE,
+                                      primary_key=True)
+    image = models.NullBooleanField(default=None)
+    thumbnail = models.NullBooleanField(default=None)
+    devstar = models.NullBooleanField(default=None)
+    timestamp = models.DateTimeField(auto_now=True)
+
+    # Field for each mode of Experiment.get_image_url
+    MODE_FIELDS = {
+        'thumbnail': 'thumbnail',
+        'devstar': 'devstar',
+    }
+
+    FIELDS = ('image', 'thumbnail', 'devstar')
+
+    MISSING_MAX_AGE = timedelta(days=1)
+
+    class Meta:
+        db_table = 'ImageAvailability'
+        ordering = ['experiment']
+
+    def __unicode__(self):
+        return '{} image availability'.format(self.experiment_id)
+
+    @classmethod
+    def get_field(cls, mode=None):
+        """Get the field storing availability for mode."""
+        return cls.MODE_FIELDS.get(mode, 'image')
+
+    @classmethod
+    def get_missing_cutoff(cls):
+        """Get the time before which missing entries have expired."""
+        return timezone.now() - cls.MISSING_MAX_AGE
+
+    def get_availability(self, field):
+        """
+        Get whether the image for field is available.
+
+        Returns None if not known, including if it was missing as of a
+        check that has expired.
+        """
+        is_available = getattr(self, field)
+
+        if (is_available is False and
+                self.timestamp < self.get_missing_cutoff()):
+            return None
+
+        return is_available
+
+
 class ManualScoreCode(models.Model):
     """A class of score that could be assigned to an image by a human."""
 
@@ -595,6 +765,17 @@ class ManualScoreCode(models.Model):
         return (not self.is_strong() and not self.is_medium() and
                 not self.is_weak() and not self.is_negative())
 
+    @classmethod
+    def get_cached_codes(cls, key):
+        """
+        Get the codes for scoring key, in scoring order, as a tuple.
+
+        Unlike get_codes, which returns a fresh QuerySet, this is cached
+        (see utils.reference_cache), so the codes must not be modified.
+        """
+        return get_reference(('score-codes', key),
+                             lambda: tuple(cls.get_codes(key)), [cls])
+
     @classmethod
     def get_codes(cls, key):
         pks = cls._SCORING_PKS[key]
@@ -710,6 +891,481 @@ class ManualScore(models.Model):
             self.get_category())
 
 
+class ManualScoreSummary(models.Model):
+    """
+    Summary of the manual scores for a library stock in a worm's screen.
+
+    The screen is defined by both screen_type ('ENH' or 'SUP') and
+    screen_stage (1 for primary, 2 for secondary). scorers is the
+    comma-separated pks of the users whose scores were included, or
+    blank if all scorers were included.
+
+    These rows are derived entirely from ManualScore, and exist so that
+    pages and scripts listing positives do not have to re-aggregate
+    every score. They are refreshed whenever a ManualScore is saved or
+    deleted (see the signal handlers below this class). Code that adds
+    scores with bulk_create must call refresh_for_scores itself; after
+    changing scores with QuerySet.update or raw SQL, run the
+    rebuild_score_summaries command.
+    """
+
+    worm_strain = models.ForeignKey(WormStrain, models.CASCADE)
+    library_stock = models.ForeignKey(LibraryStock, models.CASCADE)
+    screen_type = models.CharField(max_length=3)
+    screen_stage = models.PositiveSmallIntegerField()
+    scorers = models.CharField(max_length=100, blank=True)
+
+    # JSON list of [experiment_id, category] pairs, one per replicate,
+    # where category is that replicate's most relevant score category
+    replicate_scores = models.TextField(blank=True)
+    num_replicates = models.PositiveSmallIntegerField()
+    average_weight = models.FloatField()
+
+    passes_stringent = models.BooleanField()
+    passes_percent = models.BooleanField()
+    passes_count = models.BooleanField()
+    shows_any_suppression = models.BooleanField()
+
+    timestamp = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'ManualScoreSummary'
+        ordering = ['worm_strain', 'screen_type', 'screen_stage',
+                    'scorers', 'library_stock']
+        unique_together = ('worm_strain', 'library_stock', 'screen_type',
+                           'screen_stage', 'scorers')
+
+    def __unicode__(self):
+        return ('{} {} {} summary of {}'
+                .format(self.worm_strain_id, self.screen_type,
+                        self.screen_stage, self.library_stock_id))
+
+    def get_replicate_scores(self):
+        """Get list of (experiment_id, category) pairs, one per replicate."""
+        return [tuple(x) for x in json.loads(self.replicate_scores or '[]')]
+
+    @staticmethod
+    def get_scorers_key(scorers=None):
+        """Get the string stored in the scorers field for list scorers."""
+        if not scorers:
+            return ''
+        return ','.join(str(x) for x in sorted(int(x) for x in scorers))
+
+    @staticmethod
+    def get_scorers_from_key(key):
+        """Inverse of get_scorers_key."""
+        if not key:
+            return None
+        return [int(x) for x in key.split(',')]
+
+    @classmethod
+    def build(cls, worm, screen_type, screen_stage, scorers=None,
+              **filters):
+        """
+        Build (but do not save) summaries for a worm in a screen.
+
+        Optionally limit to scorers (a list of user pks). Any filters are
+        passed on to WormStrain.get_compact_scores.
+        """
+        if scorers:
+            filters['scorer_id__in'] = scorers
+
+        data = worm.get_compact_scores(screen_type, screen_stage,
+                                       most_relevant_only=True, **filters)
+
+        scorers_key = cls.get_scorers_key(scorers)
+        library_stock_ids, matrix = build_score_matrix(data)
+        results = evaluate_criteria(matrix)
+        summaries = []
+
+        for i, library_stock_id in enumerate(library_stock_ids):
+            replicate_scores = [(experiment_id, score.get_category())
+                                for experiment_id, score
+                                in data[library_stock_id].iteritems()]
+
+            summaries.append(cls(
+                worm_strain=worm, library_stock_id=library_stock_id,
+                screen_type=screen_type, screen_stage=screen_stage,
+                scorers=scorers_key,
+                replicate_scores=json.dumps(replicate_scores),
+                num_replicates=len(replicate_scores),
+                average_weight=float(results['average_weight'][i]),
+                passes_stringent=bool(results['passes_stringent'][i]),
+                passes_percent=bool(results['passes_percent'][i]),
+                passes_count=bool(results['passes_count'][i]),
+                shows_any_suppression=bool(
+                    results['shows_any_suppression'][i])))
+
+        return summaries
+
+    @classmethod
+    def rebuild(cls, worm, screen_type, screen_stage, scorers=None,
+                library_stock=None):
+        """
+        Replace the stored summaries for a worm in a screen.
+
+        Optionally limit to a single library_stock (instance or pk).
+        The old rows are replaced in a single transaction, so readers
+        never see a partially rebuilt screen.
+        """
+        existing = cls.objects.filter(
+            worm_strain=worm, screen_type=screen_type,
+            screen_stage=screen_stage,
+            scorers=cls.get_scorers_key(scorers))
+
+        filters = {}
+        if library_stock is not None:
+            existing = existing.filter(library_stock=library_stock)
+            filters['experiment__library_stock'] = library_stock
+
+        summaries = cls.build(worm, screen_type, screen_stage,
+                              scorers=scorers, **filters)
+
+        with transaction.atomic():
+            existing.delete()
+            cls.objects.bulk_create(summaries)
+
+        return summaries
+
+    @classmethod
+    def refresh_for_experiments(cls, experiments):
+        """
+        Refresh the stored summaries affected by scores of experiments.
+
+        Only scorer sets that have already been summarized for the
+        worm/screen are refreshed; others are built when first requested
+        through get_summaries.
+        """
+        keys = set()
+        for experiment in experiments:
+            worm = experiment.worm_strain
+            screen_type = worm.get_screen_type(experiment.temperature())
+            if screen_type:
+                keys.add((worm, experiment.library_stock_id, screen_type,
+                          experiment.screen_stage()))
+
+        if not keys:
+            return
+
+        # Scorer sets summarized, per worm/screen
+        scorers_keys = {}
+
+        for worm, library_stock, screen_type, screen_stage in keys:
+            screen = (worm, screen_type, screen_stage)
+            if screen not in scorers_keys:
+                scorers_keys[screen] = list(
+                    cls.objects.filter(worm_strain=worm,
+                                       screen_type=screen_type,
+                                       screen_stage=screen_stage)
+                    .order_by('scorers')
+                    .values_list('scorers', flat=True)
+                    .distinct())
+
+            for scorers_key in scorers_keys[screen]:
+                cls.rebuild(worm, screen_type, screen_stage,
+                            scorers=cls.get_scorers_from_key(scorers_key),
+                            library_stock=library_stock)
+
+    @classmethod
+    def refresh_for_scores(cls, scores):
+        """
+        Refresh the stored summaries affected by scores.
+
+        For scores written without signals (e.g. with bulk_create). The
+        scores' experiments are fetched in one query.
+        """
+        experiment_ids = set(score.experiment_id for score in scores)
+        if not experiment_ids:
+            return
+
+        cls.refresh_for_experiments(
+            Experiment.objects.filter(pk__in=experiment_ids)
+            .select_related('plate', 'worm_strain'))
+
+    @classmethod
+    def get_summaries(cls, worm, screen_type, screen_stage, scorers=None):
+        """
+        Get the summaries for a worm in a screen.
+
+        If this worm/screen/scorers combination has not been summarized
+        yet, it is built and saved first. If another request builds it at
+        the same time, whichever saves second gets an IntegrityError
+        from the unique constraint, and reads the other's rows instead.
+        """
+        summaries = cls.objects.filter(
+            worm_strain=worm, screen_type=screen_type,
+            screen_stage=screen_stage,
+            scorers=cls.get_scorers_key(scorers))
+
+        if not summaries.exists():
+            try:
+                cls.rebuild(worm, screen_type, screen_stage, scorers=scorers)
+            except IntegrityError:
+                pass
+
+        return summaries
+
+    @classmethod
+    def get_positives(cls, worm, screen_type, screen_stage, criteria,
+                      scorers=None):
+        """
+        Get stocks that meet criteria for this worm in a particular screen.
+
+        criteria is the name of one of the boolean criteria fields,
+        e.g. 'passes_stringent'.
+        """
+        summaries = (cls.get_summaries(worm, screen_type, screen_stage,
+                                       scorers=scorers)
+                     .filter(**{criteria: True})
+                     .select_related('library_stock'))
+
+        return set(summary.library_stock for summary in summaries)
+
+
+def _refresh_summaries_for_saved_score(sender, instance, raw=False,
+                                       **kwargs):
+    # Skip fixture loading, where related rows may not exist yet
+    if not raw:
+        ManualScoreSummary.refresh_for_scores([instance])
+
+
+def _remember_deleted_score_experiment(sender, instance, **kwargs):
+    # When the experiment itself is being deleted, it is gone by the
+    # time post_delete is sent, so fetch it while it still exists
+    instance._summary_experiment = (
+        Experiment.objects.select_related('plate', 'worm_strain')
+        .filter(pk=instance.experiment_id).first())
+
+
+def _refresh_summaries_for_deleted_score(sender, instance, **kwargs):
+    experiment = getattr(instance, '_summary_experiment', None)
+    if experiment:
+        ManualScoreSummary.refresh_for_experiments([experiment])
+
+
+post_save.connect(_refresh_summaries_for_saved_score, sender=ManualScore,
+                  dispatch_uid='refresh_summaries_for_saved_score')
+pre_delete.connect(_remember_deleted_score_experiment, sender=ManualScore,
+                   dispatch_uid='remember_deleted_score_experiment')
+post_delete.connect(_refresh_summaries_for_deleted_score, sender=ManualScore,
+                    dispatch_uid='refresh_summaries_for_deleted_score')
+
+
+class ScoringQueue(models.Model):
+    """
+    A shuffled list of experiments for a scorer to work through.
+
+    There is one queue per scorer and filter signature (a hash of the
+    scoring filters used), so that scoring in random order shuffles the
+    matching experiments once, rather than sorting the whole filtered
+    set randomly on every page. The seed of the shuffle is stored so
+    that the order is reproducible.
+
+    The experiments are stored as ScoringQueueItems, one per position.
+    Pages are read from a cursor (see get_next_ids), skipping
+    experiments the scorer has scored since the queue was built, so the
+    queue is not rewritten as the scorer works through it.
+
+    Writing the items is slow for a large screen, so it is done outside
+    the request (see experiments.helpers.scoring_queues): claim marks a
+    new or expired queue as not ready, and build writes its items.
+    Queues older than MAX_AGE are rebuilt when next used, and deleted
+    when any queue is built, so abandoned queues do not accumulate.
+    """
+
+    scorer = models.ForeignKey(User, models.CASCADE)
+    signature = models.CharField(max_length=40)
+    seed = models.IntegerField()
+
+    # Whether the items for this seed have all been written
+    is_ready = models.BooleanField(default=False)
+
+    # When the current build was claimed. Stored in UTC
+    created = models.DateTimeField(default=timezone.now)
+
+    MAX_AGE = timedelta(hours=12)
+
+    # Builds not finished after this long are assumed lost, e.g. to a
+    # web process restart, and claimed again
+    BUILD_TIMEOUT = timedelta(minutes=10)
+
+    class Meta:
+        db_table = 'ScoringQueue'
+        unique_together = ('scorer', 'signature')
+
+    def __unicode__(self):
+        return '{} scoring queue {}'.format(self.scorer, self.signature)
+
+    def get_experiment_ids(self):
+        return list(self.scoringqueueitem_set.order_by('position')
+                    .values_list('experiment_id', flat=True))
+
+    def is_expired(self):
+        return timezone.now() - self.created > self.MAX_AGE
+
+    def needs_build(self):
+        if self.is_ready:
+            return self.is_expired()
+        return timezone.now() - self.created > self.BUILD_TIMEOUT
+
+    @classmethod
+    def claim(cls, scorer, signature):
+        """
+        Get the queue for this scorer and signature.
+
+        Returns a 2-tuple of the queue and whether the caller must
+        build it (see build). The queue row is locked while claiming, so
+        of simultaneous requests for a new or expired queue, only one
+        gets to build it, and none collide on the unique scorer and
+        signature.
+        """
+        with transaction.atomic():
+            queue, created = (cls.objects.select_for_update()
+                              .get_or_create(scorer=scorer,
+                                             signature=signature,
+                                             defaults={'seed': _new_seed()}))
+
+            if created:
+                return (queue, True)
+
+            if queue.needs_build():
+                queue.seed = _new_seed()
+                queue.created = timezone.now()
+                queue.is_ready = False
+                queue.save()
+                return (queue, True)
+
+        return (queue, False)
+
+    def shuffle(self, experiment_ids):
+        """Get experiment_ids in this queue's shuffled order."""
+        ids = sorted(experiment_ids)
+        random.Random(self.seed).shuffle(ids)
+        return ids
+
+    def build(self, experiment_ids):
+        """
+        Replace the items of this claimed queue with experiment_ids.
+
+        Does nothing if the queue has been claimed again since. Also
+        deletes expired queues.
+        """
+        ids = self.shuffle(experiment_ids)
+
+        with transaction.atomic():
+            claimed = (ScoringQueue.objects.select_for_update()
+                       .filter(pk=self.pk, seed=self.seed))
+            if not claimed.exists():
+                return
+
+            self.scoringqueueitem_set.all().delete()
+            ScoringQueueItem.objects.bulk_create(
+                [ScoringQueueItem(queue=self, position=i, experiment_id=x)
+                 for i, x in enumerate(ids)],
+                batch_size=1000)
+            claimed.update(is_ready=True)
+
+        self.is_ready = True
+
+        ScoringQueue.objects.filter(
+            created__lt=timezone.now() - self.MAX_AGE).delete()
+
+    def get_cursor(self, position):
+        """
+        Get the cursor for position in this queue.
+
+        Cursors include the seed, so a cursor from before the queue was
+        rebuilt is not applied to the new order.
+        """
+        return '{}-{}'.format(self.seed, position)
+
+    def get_position(self, cursor):
+        """Inverse of get_cursor; 0 for a missing or outdated cursor."""
+        try:
+            seed, position = [int(x) for x in cursor.split('-')]
+        except (AttributeError, ValueError):
+            return 0
+
+        return position if seed == self.seed and position >= 0 else 0
+
+    def get_next_ids(self, num, cursor=None):
+        """
+        Get the next num experiment ids for the scorer to score.
+
+        Starts from cursor (as returned by a previous call), or from the
+        front of the queue. Experiments scored by the scorer since the
+        queue was built are skipped.
+
+        Returns a 3-tuple of the next ids, the number of experiments
+        remaining from the cursor on, and the cursor for the following
+        page. Experiments the scorer skips on a page are not shown
+        again until the queue is rebuilt.
+        """
+        position = self.get_position(cursor)
+
+        # Candidates were built excluding experiments scored before the
+        # queue was claimed, so only newer scores need to be checked
+        scored = (ManualScore.objects
+                  .filter(scorer_id=self.scorer_id,
+                          timestamp__gte=self.created)
+                  .values('experiment_id'))
+
+        items = (self.scoringqueueitem_set
+                 .filter(position__gte=position)
+                 .exclude(experiment__in=scored))
+
+        page = list(items.order_by('position')
+                    .values_list('position', 'experiment_id')[:num])
+
+        if page:
+            next_position = page[-1][0] + 1
+        else:
+            next_position = position
+
+        return ([x[1] for x in page], items.count(),
+                self.get_cursor(next_position))
+
+    def get_next_experiments(self, num, cursor=None):
+        """
+        Get the next num experiments for the scorer to score.
+
+        Returns a 3-tuple of the next experiments, in queue order, the
+        number of experiments remaining, and the cursor for the
+        following page (see get_next_ids).
+        """
+        ids, num_remaining, next_cursor = self.get_next_ids(num, cursor)
+        return (get_experiments_in_order(ids), num_remaining, next_cursor)
+
+
+def _new_seed():
+    return random.randint(0, 2 ** 31 - 1)
+
+
+def get_experiments_in_order(ids):
+    """Get the experiments with ids, in the order of ids, for scoring."""
+    experiments = (Experiment.objects.filter(pk__in=ids)
+                   .select_related('library_stock', 'plate', 'worm_strain')
+                   .prefetch_related('manualscore_set'))
+    return sorted(experiments, key=lambda x: ids.index(x.pk))
+
+
+class ScoringQueueItem(models.Model):
+    """An experiment at a position in a ScoringQueue."""
+
+    queue = models.ForeignKey(ScoringQueue, models.CASCADE)
+    position = models.PositiveIntegerField()
+    experiment = models.ForeignKey(Experiment, models.CASCADE)
+
+    class Meta:
+        db_table = 'ScoringQueueItem'
+        ordering = ['queue', 'position']
+        unique_together = ('queue', 'position')
+
+    def __unicode__(self):
+        return '{} at {} of {}'.format(self.experiment_id, self.position,
+                                       self.queue_id)
+
+
 class DevstarScore(models.Model):
     """Information about an image determined by the DevStaR."""
 
@@ -789,7 +1445,7 @@ class DevstarScore(models.Model):
 
     def matches_raw_fields(self, other):
         return (
-            self.experiment == other.experiment and
+            self.experiment_id == other.experiment_id and
             self.is_bacteria_present == other.is_bacteria_present and
             self.area_adult == other.area_adult and
             self.area_larva == other.area_larva and
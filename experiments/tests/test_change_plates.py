@@ -0,0 +1,78 @@
+from django.test import TestCase
+
+from experiments.models import Experiment, ExperimentPlate
+from library.models import LibraryPlate, LibraryStock
+from worms.models import WormStrain
+
+WELLS = ('A01', 'A02', 'B01')
+
+
+class ChangePlatesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.n2 = WormStrain.objects.create(id='N2')
+        cls.mutant = WormStrain.objects.create(
+            id='MJ69', gene='emb-8', allele='hc69',
+            restrictive_temperature=25.0)
+
+        cls.library_plates = []
+        for library_plate_id in ('I-1-A1', 'II-2-B1'):
+            library_plate = LibraryPlate.objects.create(
+                id=library_plate_id, number_of_wells=96, screen_stage=2)
+            cls.library_plates.append(library_plate)
+            for well in WELLS:
+                LibraryStock.objects.create(
+                    id='{}_{}'.format(library_plate_id, well),
+                    plate=library_plate, well=well)
+
+        # Plates 1 and 2 are changed, plate 3 is not
+        for plate_id in (1, 2, 3):
+            plate = ExperimentPlate.objects.create(
+                id=plate_id, screen_stage=2, temperature=22.5,
+                date='2015-09-25')
+            for well in WELLS:
+                Experiment.objects.create(
+                    id='{}_{}'.format(plate_id, well), plate=plate,
+                    well=well, worm_strain=cls.n2,
+                    library_stock_id='I-1-A1_{}'.format(well))
+
+    def get_wells(self, plate_id):
+        return (Experiment.objects.filter(plate=plate_id)
+                .values_list('well', 'worm_strain', 'library_stock',
+                             'is_junk'))
+
+    def test_change_plates(self):
+        plates = list(ExperimentPlate.objects.filter(pk__in=(1, 2)))
+
+        ExperimentPlate.change_plates(
+            plates, worm_strain=self.mutant,
+            library_plate=self.library_plates[1], is_junk=True,
+            temperature=25)
+
+        for plate_id in (1, 2):
+            self.assertEqual(sorted(self.get_wells(plate_id)), [
+                (well, 'MJ69', 'II-2-B1_{}'.format(well), True)
+                for well in WELLS])
+            self.assertEqual(
+                ExperimentPlate.objects.get(pk=plate_id).temperature, 25)
+
+        self.assertEqual(sorted(self.get_wells(3)), [
+            (well, 'N2', 'I-1-A1_{}'.format(well), False)
+            for well in WELLS])
+
+        # Instances passed in follow the plate fields
+        self.assertEqual([plate.temperature for plate in plates], [25, 25])
+
+    def test_library_plate_missing_wells(self):
+        plates = list(ExperimentPlate.objects.filter(pk__in=(1, 2)))
+        LibraryStock.objects.filter(pk='II-2-B1_B01').delete()
+
+        with self.assertRaises(ValueError):
+            ExperimentPlate.change_plates(
+                plates, worm_strain=self.mutant,
+                library_plate=self.library_plates[1])
+
+        # Nothing is changed
+        self.assertEqual(sorted(self.get_wells(1)), [
+            (well, 'N2', 'I-1-A1_{}'.format(well), False)
+            for well in WELLS])
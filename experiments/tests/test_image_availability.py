@@ -0,0 +1,80 @@
+import urllib2
+
+from django.test import TestCase
+from django.utils import timezone
+
+from experiments import models
+from experiments.models import Experiment, ExperimentPlate, ImageAvailability
+from library.models import LibraryPlate, LibraryStock
+from utils import http
+from worms.models import WormStrain
+
+
+class HttpHeadOkTestCase(TestCase):
+    def check(self, code):
+        def urlopen(request, timeout):
+            raise urllib2.HTTPError(request.get_full_url(), code, '', {},
+                                    None)
+
+        real_urlopen = urllib2.urlopen
+        urllib2.urlopen = urlopen
+        try:
+            return http.http_head_ok('http://example.com/1/1.bmp')
+        finally:
+            urllib2.urlopen = real_urlopen
+
+    def test_not_found_is_false(self):
+        self.assertIs(self.check(404), False)
+
+    def test_server_error_is_unknown(self):
+        self.assertIsNone(self.check(503))
+
+
+class ImageAvailabilityTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        worm = WormStrain.objects.create(id='N2')
+        library_plate = LibraryPlate.objects.create(
+            id='I-1-A1', number_of_wells=96, screen_stage=2)
+        stock = LibraryStock.objects.create(
+            id='I-1-A1_A01', plate=library_plate, well='A01')
+        plate = ExperimentPlate.objects.create(
+            id=1, screen_stage=2, temperature=22.5, date='2015-09-25')
+        Experiment.objects.create(id='1_A01', plate=plate, well='A01',
+                                  worm_strain=worm, library_stock=stock)
+
+    def setUp(self):
+        self.answers = []
+        self.real_http_head_ok = models.http_head_ok
+        models.http_head_ok = lambda url: self.answers.pop(0)
+
+    def tearDown(self):
+        models.http_head_ok = self.real_http_head_ok
+
+    def get_experiment(self):
+        return (Experiment.objects.select_related('imageavailability')
+                .get(pk='1_A01'))
+
+    def test_unknown_answer_not_stored(self):
+        self.answers = [None, True]
+
+        self.assertIsNone(self.get_experiment().is_image_available())
+        self.assertFalse(ImageAvailability.objects.exists())
+
+        self.assertTrue(self.get_experiment().is_image_available())
+        self.assertTrue(ImageAvailability.objects.get().image)
+
+    def test_missing_answer_expires(self):
+        self.answers = [False]
+        self.assertIs(self.get_experiment().is_image_available(), False)
+
+        # Trusted until it expires
+        self.assertIs(self.get_experiment().is_image_available(), False)
+
+        ImageAvailability.objects.update(
+            timestamp=timezone.now() - 2 * ImageAvailability.MISSING_MAX_AGE)
+        experiment = self.get_experiment()
+        self.assertIsNone(experiment.is_image_available(probe=False))
+
+        self.answers = [True]
+        self.assertTrue(experiment.is_image_available())
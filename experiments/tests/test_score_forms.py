@@ -0,0 +1,123 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from experiments.forms import (IMPOSSIBLE, LevelsScoreForm,
+                               SuppressorScoreForm, process_score_forms)
+from experiments.models import (Experiment, ExperimentPlate, ManualScore,
+                                ManualScoreCode, ManualScoreSummary)
+from library.models import LibraryPlate, LibraryStock
+from utils.reference_cache import invalidate_references
+from worms.models import WormStrain
+
+
+class ScoreFormTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='scorer')
+        cls.worm = WormStrain.objects.create(
+            id='EU552', gene='glp-1', allele='or178',
+            genotype='glp-1(or178) III', restrictive_temperature=22.5)
+        n2 = WormStrain.objects.create(id='N2')
+
+        pks = set()
+        for key in ('SUP', 'AUXILIARY', 'MUT_HITS', 'STE_REL_LEVEL',
+                    'EMB_REL_LEVEL', 'N2_RNAi_emb', 'N2_RNAi_ste',
+                    'MUT_RNAi_emb', 'MUT_RNAi_ste'):
+            pks.update(ManualScoreCode._SCORING_PKS[key])
+        ManualScoreCode.objects.bulk_create(
+            [ManualScoreCode(id=pk) for pk in pks])
+
+        library_plate = LibraryPlate.objects.create(
+            id='I-1-A1', number_of_wells=96, screen_stage=2)
+        stock = LibraryStock.objects.create(
+            id='I-1-A1_A01', plate=library_plate, well='A01')
+
+        # Plates 1 and 2 are replicates of the mutant, plate 3 is their
+        # N2 control, and plate 4 is the mutant on another date
+        for plate_id, worm, date in ((1, cls.worm, '2015-09-25'),
+                                     (2, cls.worm, '2015-09-25'),
+                                     (3, n2, '2015-09-25'),
+                                     (4, cls.worm, '2015-09-26')):
+            plate = ExperimentPlate.objects.create(
+                id=plate_id, screen_stage=2, temperature=22.5, date=date)
+            Experiment.objects.create(
+                id='{}_A01'.format(plate_id), plate=plate, well='A01',
+                worm_strain=worm, library_stock=stock)
+
+    def setUp(self):
+        invalidate_references()
+
+    def get_form(self, form_class, experiment_id, **data):
+        form = form_class(
+            {'{}-{}'.format(experiment_id, name): value
+             for name, value in data.iteritems()},
+            prefix=experiment_id, user=self.user)
+        self.assertTrue(form.is_valid(), form.errors)
+        return form
+
+    def get_scores(self):
+        return sorted(ManualScore.objects.values_list(
+            'experiment_id', 'score_code_id'))
+
+    def test_get_score_codes(self):
+        form = self.get_form(SuppressorScoreForm, '1_A01',
+                             sup_score=IMPOSSIBLE,
+                             auxiliary_scores=['7', '-2'])
+        self.assertEqual(form.get_score_codes()[0], IMPOSSIBLE)
+        self.assertEqual([code.pk for code in form.get_score_codes()[1:]],
+                         [7, -2])
+
+    def test_no_queries_once_codes_cached(self):
+        data = {'mut_hits': '54', 'ste_relative_score': '16',
+                'emb_relative_score': IMPOSSIBLE,
+                'n2_rnai_emb_score': '50', 'n2_rnai_ste_score': '47',
+                'mut_rnai_emb_score': '67', 'mut_rnai_ste_score': '63',
+                'auxiliary_scores': ['7', '-2']}
+
+        LevelsScoreForm().as_p()
+        self.get_form(LevelsScoreForm, '1_A01', **data)
+
+        with self.assertNumQueries(0):
+            LevelsScoreForm(prefix='2_A01').as_p()
+            form = self.get_form(LevelsScoreForm, '2_A01', **data)
+            form.as_p()
+
+        self.assertEqual(
+            [code.pk for code in form.cleaned_data['auxiliary_scores']],
+            [7, -2])
+
+    def test_scores_fan_out(self):
+        form = self.get_form(
+            LevelsScoreForm, '1_A01',
+            mut_hits='54', ste_relative_score='16',
+            emb_relative_score=IMPOSSIBLE, n2_rnai_emb_score='50',
+            n2_rnai_ste_score='47', mut_rnai_emb_score='67',
+            mut_rnai_ste_score='63', auxiliary_scores=['7'])
+
+        with CaptureQueriesContext(connection) as queries:
+            process_score_forms([form])
+
+        inserts = [query for query in queries.captured_queries
+                   if query['sql'].startswith('INSERT INTO "ManualScore"')]
+        self.assertEqual(len(inserts), 1)
+
+        # N2 codes to the N2 control, the rest to both replicates
+        self.assertEqual(self.get_scores(), sorted(
+            [('3_A01', 47), ('3_A01', 50)] +
+            [(experiment_id, pk)
+             for experiment_id in ('1_A01', '2_A01')
+             for pk in (7, 16, 54, 63, 67)]))
+
+    def test_summaries_refreshed(self):
+        forms = [self.get_form(SuppressorScoreForm, '1_A01', sup_score='3'),
+                 self.get_form(SuppressorScoreForm, '4_A01', sup_score='0')]
+
+        process_score_forms(forms)
+
+        self.assertEqual(self.get_scores(), [('1_A01', 3), ('4_A01', 0)])
+
+        summary = ManualScoreSummary.get_summaries(self.worm, 'SUP', 2).get()
+        self.assertEqual(summary.num_replicates, 2)
+        self.assertEqual(summary.average_weight, 1.5)
@@ -0,0 +1,94 @@
+from collections import OrderedDict
+
+from django.test import SimpleTestCase
+
+from experiments.helpers import criteria
+from experiments.helpers.score_matrix import (
+    build_score_matrix, evaluate_criteria, get_passing_stocks,
+    MISSING, OTHER, NEGATIVE, WEAK, MEDIUM, STRONG)
+from experiments.helpers.scores import get_average_score_weight
+
+
+class FakeScore(object):
+    """Stand-in for the most relevant ManualScore of a replicate."""
+
+    WEIGHTS = {OTHER: 0, NEGATIVE: 0, WEAK: 1, MEDIUM: 2, STRONG: 3}
+
+    def __init__(self, code):
+        self.code = code
+
+    def is_strong(self):
+        return self.code == STRONG
+
+    def is_medium(self):
+        return self.code == MEDIUM
+
+    def is_weak(self):
+        return self.code == WEAK
+
+    def is_negative(self):
+        return self.code == NEGATIVE
+
+    def is_other(self):
+        return self.code == OTHER
+
+    def get_weight(self):
+        return FakeScore.WEIGHTS[self.code]
+
+    def get_relevance_per_replicate(self):
+        return self.code
+
+
+ROWS = {
+    'all_strong': [STRONG, STRONG, STRONG],
+    'one_medium': [MEDIUM, NEGATIVE, NEGATIVE, NEGATIVE],
+    'weaks': [WEAK, WEAK, WEAK, WEAK, WEAK, NEGATIVE, NEGATIVE, NEGATIVE],
+    'mixed': [MEDIUM, WEAK, WEAK, WEAK, OTHER, NEGATIVE, NEGATIVE,
+              NEGATIVE, NEGATIVE, NEGATIVE],
+    'other_only': [OTHER, OTHER],
+    'single_weak': [WEAK],
+}
+
+
+class ScoreMatrixTestCase(SimpleTestCase):
+    def setUp(self):
+        self.data = OrderedDict()
+        for stock, codes in sorted(ROWS.items()):
+            self.data[stock] = OrderedDict(
+                (i, FakeScore(code)) for i, code in enumerate(codes))
+
+    def test_build_score_matrix(self):
+        stocks, matrix = build_score_matrix(self.data)
+        self.assertEquals(stocks, sorted(ROWS))
+        self.assertEquals(matrix.shape, (len(ROWS), 10))
+        self.assertEquals(list(matrix[stocks.index('single_weak')]),
+                          [WEAK] + [MISSING] * 9)
+
+    def test_matches_criteria_functions(self):
+        stocks, matrix = build_score_matrix(self.data)
+        results = evaluate_criteria(matrix)
+
+        functions = {
+            'passes_stringent': criteria.passes_sup_secondary_stringent,
+            'passes_percent': criteria.passes_sup_secondary_percent,
+            'passes_count': criteria.passes_sup_secondary_count,
+            'shows_any_suppression': criteria.shows_any_suppression,
+        }
+
+        for i, stock in enumerate(stocks):
+            scores = self.data[stock].values()
+            for key, function in functions.items():
+                self.assertEquals(results[key][i], function(scores),
+                                  '{} {}'.format(stock, key))
+
+            self.assertAlmostEquals(results['average_weight'][i],
+                                    get_average_score_weight(scores))
+
+    def test_enh_primary_singles(self):
+        positives = get_passing_stocks(self.data, 'passes_enh_primary')
+        self.assertNotIn('single_weak', positives)
+        self.assertIn('weaks', positives)
+
+        positives = get_passing_stocks(self.data, 'passes_enh_primary',
+                                       singles=['single_weak'])
+        self.assertIn('single_weak', positives)
@@ -0,0 +1,129 @@
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.test import TestCase
+
+from experiments.models import (Experiment, ExperimentPlate, ManualScore,
+                                ManualScoreCode, ManualScoreSummary)
+from library.models import LibraryPlate, LibraryStock
+from worms.models import WormStrain
+
+
+class ManualScoreSummaryRefreshTestCase(TestCase):
+    """Summaries must follow every way scores are written."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.worm = WormStrain.objects.create(
+            id='EU552', gene='glp-1', allele='or178',
+            genotype='glp-1(or178) III', restrictive_temperature=22.5)
+        cls.user = User.objects.create(username='scorer')
+        cls.other_worm = WormStrain.objects.create(
+            id='MJ69', gene='emb-8', allele='hc69',
+            genotype='emb-8(hc69) III', restrictive_temperature=25.0)
+        cls.strong = ManualScoreCode.objects.create(id=3)
+        cls.negative = ManualScoreCode.objects.create(id=0)
+
+        library_plate = LibraryPlate.objects.create(
+            id='I-1-A1', number_of_wells=96, screen_stage=2)
+        stock = LibraryStock.objects.create(
+            id='I-1-A1_A01', plate=library_plate, well='A01')
+
+        cls.experiments = []
+        for i in range(1, 3):
+            plate = ExperimentPlate.objects.create(
+                id=i, screen_stage=2, temperature=22.5, date='2015-09-25')
+            cls.experiments.append(Experiment.objects.create(
+                id='{}_A01'.format(i), plate=plate, well='A01',
+                worm_strain=cls.worm, library_stock=stock))
+
+    def setUp(self):
+        self.score(self.experiments[0], self.negative)
+
+    def score(self, experiment, score_code):
+        return ManualScore.objects.create(
+            experiment=experiment, score_code=score_code, scorer=self.user)
+
+    def get_summary(self):
+        return ManualScoreSummary.get_summaries(self.worm, 'SUP', 2).get()
+
+    def test_save_refreshes(self):
+        self.assertEqual(self.get_summary().num_replicates, 1)
+
+        self.score(self.experiments[1], self.strong)
+
+        summary = self.get_summary()
+        self.assertEqual(summary.num_replicates, 2)
+        self.assertEqual(summary.average_weight, 1.5)
+
+    def test_delete_refreshes(self):
+        score = self.score(self.experiments[1], self.strong)
+        self.assertEqual(self.get_summary().num_replicates, 2)
+
+        score.delete()
+
+        self.assertEqual(self.get_summary().num_replicates, 1)
+
+    def test_experiment_delete_refreshes(self):
+        self.score(self.experiments[1], self.strong)
+        self.assertEqual(self.get_summary().num_replicates, 2)
+
+        Experiment.objects.get(pk=self.experiments[1].pk).delete()
+
+        self.assertEqual(self.get_summary().num_replicates, 1)
+
+    def test_refresh_for_bulk_created_scores(self):
+        self.assertEqual(self.get_summary().num_replicates, 1)
+
+        scores = [ManualScore(experiment=self.experiments[1],
+                              score_code=self.strong, scorer=self.user)]
+        ManualScore.objects.bulk_create(scores)
+        ManualScoreSummary.refresh_for_scores(scores)
+
+        self.assertEqual(self.get_summary().num_replicates, 2)
+
+    def test_toggle_junk_refreshes(self):
+        self.score(self.experiments[1], self.strong)
+        self.assertEqual(self.get_summary().num_replicates, 2)
+
+        experiment = Experiment.objects.get(pk=self.experiments[1].pk)
+        experiment.toggle_junk()
+        self.assertEqual(self.get_summary().num_replicates, 1)
+
+        experiment.toggle_junk()
+        self.assertEqual(self.get_summary().num_replicates, 2)
+
+    def test_change_plates_refreshes_old_and_new_screens(self):
+        self.score(self.experiments[1], self.strong)
+        self.assertEqual(self.get_summary().num_replicates, 2)
+        other = ManualScoreSummary.get_summaries(self.other_worm, 'SUP', 2)
+        self.assertFalse(other.exists())
+
+        # Build the (empty) summary so there is one to refresh
+        ManualScoreSummary.get_summaries(self.other_worm, 'SUP', 2,
+                                         scorers=[self.user.pk])
+        plate = ExperimentPlate.objects.get(pk=self.experiments[1].plate_id)
+        ExperimentPlate.change_plates([plate],
+                                      worm_strain=self.other_worm,
+                                      temperature=25.0)
+
+        self.assertEqual(self.get_summary().num_replicates, 1)
+        self.assertEqual(
+            ManualScoreSummary.get_summaries(
+                self.other_worm, 'SUP', 2,
+                scorers=[self.user.pk]).get().num_replicates, 1)
+
+    def test_concurrent_first_build(self):
+        rebuild = ManualScoreSummary.__dict__['rebuild']
+
+        def rebuild_after_other_request(*args, **kwargs):
+            # Another request builds the summaries first
+            rebuild.__func__(ManualScoreSummary, *args, **kwargs)
+            raise IntegrityError
+
+        ManualScoreSummary.rebuild = staticmethod(rebuild_after_other_request)
+        try:
+            summary = self.get_summary()
+        finally:
+            ManualScoreSummary.rebuild = rebuild
+
+        self.assertEqual(summary.num_replicates, 1)
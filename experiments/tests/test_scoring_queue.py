@@ -0,0 +1,161 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from experiments.helpers import scoring_queues
+from experiments.models import (Experiment, ExperimentPlate, ManualScore,
+                                ManualScoreCode, ScoringQueue)
+from library.models import LibraryPlate, LibraryStock
+from worms.models import WormStrain
+
+
+class FakePool(object):
+    def __init__(self):
+        self.calls = []
+
+    def apply_async(self, function, args):
+        self.calls.append(args)
+
+
+class ScoringQueueTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='scorer')
+        cls.score_code = ManualScoreCode.objects.create(id=0)
+
+        worm = WormStrain.objects.create(id='N2')
+        library_plate = LibraryPlate.objects.create(
+            id='I-1-A1', number_of_wells=96, screen_stage=2)
+        stock = LibraryStock.objects.create(
+            id='I-1-A1_A01', plate=library_plate, well='A01')
+        plate = ExperimentPlate.objects.create(
+            id=1, screen_stage=2, temperature=22.5, date='2015-09-25')
+
+        cls.ids = []
+        for well in ('A01', 'A02', 'A03', 'A04', 'A05', 'A06', 'A07'):
+            cls.ids.append(Experiment.objects.create(
+                id='1_{}'.format(well), plate=plate, well=well,
+                worm_strain=worm, library_stock=stock).pk)
+
+    def setUp(self):
+        self.queue, must_build = ScoringQueue.claim(self.user, 'abc')
+        self.assertTrue(must_build)
+        self.queue.build(self.ids)
+        self.order = self.queue.get_experiment_ids()
+
+    def expire(self, queue, age):
+        ScoringQueue.objects.filter(pk=queue.pk).update(
+            created=timezone.now() - age)
+
+    def score(self, experiment_id):
+        ManualScore.objects.create(experiment_id=experiment_id,
+                                   score_code=self.score_code,
+                                   scorer=self.user)
+
+    def test_queue_is_shuffled_candidates(self):
+        self.assertEqual(sorted(self.order), sorted(self.ids))
+
+    def test_claim_reuses_built_queue(self):
+        queue, must_build = ScoringQueue.claim(self.user, 'abc')
+        self.assertEqual((queue.pk, must_build), (self.queue.pk, False))
+        self.assertTrue(queue.is_ready)
+        self.assertEqual(queue.shuffle(self.ids), self.order)
+
+    def test_claim_expired_queue(self):
+        self.expire(self.queue, ScoringQueue.MAX_AGE * 2)
+
+        queue, must_build = ScoringQueue.claim(self.user, 'abc')
+        self.assertTrue(must_build)
+        self.assertFalse(queue.is_ready)
+
+        queue.build(self.ids[:2])
+        self.assertEqual(sorted(queue.get_experiment_ids()), self.ids[:2])
+
+    def test_claim_building_queue(self):
+        queue = ScoringQueue.claim(self.user, 'def')[0]
+
+        # Someone else is building it
+        self.assertFalse(ScoringQueue.claim(self.user, 'def')[1])
+
+        # Until the build is assumed lost
+        self.expire(queue, ScoringQueue.BUILD_TIMEOUT * 2)
+        self.assertTrue(ScoringQueue.claim(self.user, 'def')[1])
+
+    def test_superseded_build_ignored(self):
+        queue = ScoringQueue.claim(self.user, 'def')[0]
+        self.expire(queue, ScoringQueue.BUILD_TIMEOUT * 2)
+        ScoringQueue.claim(self.user, 'def')
+
+        queue.build(self.ids)
+        self.assertEqual(queue.get_experiment_ids(), [])
+
+    def test_build_deletes_expired_queues(self):
+        self.expire(self.queue, ScoringQueue.MAX_AGE * 2)
+
+        queue = ScoringQueue.claim(self.user, 'def')[0]
+        queue.build(self.ids)
+
+        self.assertEqual(list(ScoringQueue.objects.all()), [queue])
+
+    def test_get_next_experiments_before_build(self):
+        pool = FakePool()
+        get_pool = scoring_queues._get_pool
+        scoring_queues._get_pool = lambda: pool
+        try:
+            experiments, num_remaining, cursor = (
+                scoring_queues.get_next_experiments(
+                    self.user, 'def', lambda: self.ids, 3))
+        finally:
+            scoring_queues._get_pool = get_pool
+
+        queue, ids = pool.calls[0]
+        self.assertEqual([x.pk for x in experiments], queue.shuffle(ids)[:3])
+        self.assertEqual((num_remaining, cursor), (7, None))
+
+        # Once built, pages come from the queue, in the same order
+        queue.build(ids)
+        experiments, num_remaining, cursor = (
+            scoring_queues.get_next_experiments(
+                self.user, 'def', lambda: [], 3))
+        self.assertEqual([x.pk for x in experiments], queue.shuffle(ids)[:3])
+        self.assertEqual(num_remaining, 7)
+
+    def test_pages_follow_cursor(self):
+        ids, num_remaining, cursor = self.queue.get_next_ids(3)
+        self.assertEqual(ids, self.order[:3])
+        self.assertEqual(num_remaining, 7)
+
+        # Reloading without the cursor shows the same page
+        self.assertEqual(self.queue.get_next_ids(3)[0], self.order[:3])
+
+        ids, num_remaining, cursor = self.queue.get_next_ids(3, cursor)
+        self.assertEqual(ids, self.order[3:6])
+        self.assertEqual(num_remaining, 4)
+
+        ids, num_remaining, cursor = self.queue.get_next_ids(3, cursor)
+        self.assertEqual(ids, self.order[6:])
+
+        ids, num_remaining, cursor = self.queue.get_next_ids(3, cursor)
+        self.assertEqual((ids, num_remaining), ([], 0))
+
+    def test_scored_experiments_skipped(self):
+        self.score(self.order[0])
+        self.score(self.order[4])
+
+        ids, num_remaining, cursor = self.queue.get_next_ids(3)
+        self.assertEqual(ids, self.order[1:4])
+        self.assertEqual(num_remaining, 5)
+
+        ids, num_remaining, cursor = self.queue.get_next_ids(3, cursor)
+        self.assertEqual(ids, self.order[5:])
+
+    def test_outdated_cursor_starts_at_front(self):
+        cursor = self.queue.get_next_ids(3)[2]
+        self.expire(self.queue, ScoringQueue.MAX_AGE * 2)
+        self.queue = ScoringQueue.claim(self.user, 'abc')[0]
+        self.queue.build(self.ids)
+
+        self.assertEqual(self.queue.get_next_ids(3, cursor)[0],
+                         self.queue.get_experiment_ids()[:3])
+        self.assertEqual(self.queue.get_next_ids(3, 'junk')[0],
+                         self.queue.get_experiment_ids()[:3])
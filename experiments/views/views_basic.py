@@ -2,21 +2,23 @@ import re
 
 from django.conf import settings
 from django.contrib.auth.decorators import permission_required
+from django.db import transaction
 from django.db.models import Case, When
 from django.http import HttpResponseRedirect
 from django.shortcuts import redirect, render, get_object_or_404
 
 from experiments.helpers.data_entry import parse_batch_data_entry_gdoc
+from experiments.helpers.score_summaries import attach_score_summaries
 from experiments.models import Experiment, ExperimentPlate, ManualScore
 from experiments.forms import (
     FilterExperimentWellsForm, FilterExperimentPlatesForm,
-    FilterExperimentWellsToScoreForm, get_score_form,
+    FilterExperimentWellsToScoreForm, get_score_form, process_score_forms,
     AddExperimentPlateForm, ChangeExperimentPlatesForm,
     process_ChangeExperimentPlatesForm_data,
     ProcessContactSheetForm,
 )
-from utils.http import http_response_ok, build_url
-from utils.pagination import get_paginated
+from utils.http import build_url
+from utils.pagination import get_keyset_paginated, get_paginated
 
 from chartit import DataPool, Chart
 
@@ -33,8 +35,8 @@ def experiment_well(request, pk):
         experiment.toggle_junk()
         return redirect('experiment_well_url', experiment.pk)
 
-    devstar_url = experiment.get_image_url(mode='devstar')
-    devstar_available = http_response_ok(devstar_url)
+    attach_score_summaries([experiment])
+    devstar_available = experiment.is_image_available(mode='devstar')
 
     context = {
         'experiment': experiment,
@@ -72,8 +74,9 @@ def find_experiment_plates(request, context=None):
 
         if form.is_valid():
             experiment_plates = form.process()
-            display_plates = get_paginated(request, experiment_plates,
-                                           EXPERIMENT_PLATES_PER_PAGE)
+            display_plates = get_keyset_paginated(
+                request, experiment_plates, EXPERIMENT_PLATES_PER_PAGE,
+                ('id',))
 
     else:
         form = FilterExperimentPlatesForm()
@@ -149,53 +152,54 @@ def replicates_contact_sheet(request, pks):
     if request.method == 'POST':
         form = ProcessContactSheetForm(request.POST)
 
-        interestingExp = ""
-        score_results = {}
-        score_results['well'] = []
-
         if form.is_valid():
-            submitted = 0
             data = form.cleaned_data
-            # well relates to the row in the contact sheet 
-            for well in data:
-                for plate in pks:
-                    interestingExp = Experiment.objects.get(
-                        plate_id=plate, well=well)
-
-                    if data[well] == True and interestingExp.is_junk == False:
-                            interestingExp.is_interesting = True
-                            interestingExp.save()
-                            submitted += 1
-                            score_results['well'].append(well)
-                    else:
-                        interestingExp.is_interesting = False
-                        interestingExp.save()
-            
-            score_results['worm_strain'] = interestingExp.worm_strain
-            score_results['library_stock'] = interestingExp.library_stock
+
+            # well relates to the row in the contact sheet
+            experiments = list(
+                Experiment.objects
+                .filter(plate_id__in=pks, well__in=data.keys())
+                .select_related('worm_strain', 'library_stock')
+                .order_by('well', 'plate'))
+
+            interesting = [experiment for experiment in experiments
+                           if data[experiment.well] and
+                           not experiment.is_junk]
+
+            with transaction.atomic():
+                (Experiment.objects
+                 .filter(pk__in=[x.pk for x in interesting])
+                 .update(is_interesting=True))
+
+                (Experiment.objects
+                 .filter(plate_id__in=pks, well__in=data.keys())
+                 .exclude(pk__in=[x.pk for x in interesting])
+                 .update(is_interesting=False))
+
+            score_results = {
+                'well': [experiment.well for experiment in interesting],
+            }
+
+            if experiments:
+                score_results['worm_strain'] = experiments[-1].worm_strain
+                score_results['library_stock'] = (
+                    experiments[-1].library_stock)
 
             context = {
-                # 'form': form,
                 'score_results': score_results,
                 'plates': pks,
-                'submitted': submitted
+                'submitted': len(interesting),
             }
-                    
-            return render(request,'process_contact_sheet.html', context)
+
+            return render(request, 'process_contact_sheet.html', context)
 
     else:
         form = ProcessContactSheetForm()
 
-    experiments = {}
+    experiments = {plate.id: {} for plate in plates}
 
-    for plate in plates:
-        id = int(plate.id)
-        experiments[id] = {}
-        for experiment in plate.get_wells():
-            # if experiment.is_junk:
-            #     experiments[id][experiment.well] = 'null'
-            # else:
-                experiments[id][experiment.well] = experiment
+    for experiment in Experiment.objects.filter(plate_id__in=pks):
+        experiments[experiment.plate_id][experiment.well] = experiment
 
     context = {
         'experiment_plates': plates,
@@ -220,8 +224,10 @@ def find_experiment_wells(request):
 
         if form.is_valid():
             experiments = form.process()
-            display_experiments = get_paginated(request, experiments,
-                                                EXPERIMENT_WELLS_PER_PAGE)
+            display_experiments = get_keyset_paginated(
+                request, experiments, EXPERIMENT_WELLS_PER_PAGE,
+                ('plate', 'well'))
+            attach_score_summaries(display_experiments)
     else:
         form = FilterExperimentWellsForm()
 
@@ -314,9 +320,8 @@ def change_experiment_plates(request, pks):
         form = ChangeExperimentPlatesForm(request.POST)
 
         if form.is_valid():
-            for plate in experiment_plates:
-                process_ChangeExperimentPlatesForm_data(plate,
-                                                        form.cleaned_data)
+            process_ChangeExperimentPlatesForm_data(experiment_plates,
+                                                    form.cleaned_data)
 
             return redirect('change_experiment_plates_url', pks)
 
@@ -357,7 +362,8 @@ def score_experiment_wells(request):
         pks = [k.split('-')[0] for k in request.POST if pattern.match(k)]
 
         # Check if all POSTs are valid
-        for experiment in Experiment.objects.filter(pk__in=pks):
+        for experiment in (Experiment.objects.filter(pk__in=pks)
+                           .select_related('plate', 'worm_strain')):
             # gets the form from either enhancer or Suppressor
             f = get_score_form(request.GET.get('score_form_key'))
             experiment.score_form = f(request.POST, user=request.user,
@@ -373,11 +379,17 @@ def score_experiment_wells(request):
         # this saves scores and brings back to the same page and
         # resets the POST data so that there's not a double submit
         if not redo_post:
-            for experiment in post_experiments:
-                # This actually submits the scores to the database
-                experiment.score_form.process()
+            # This actually submits the scores to the database
+            process_score_forms([experiment.score_form
+                                 for experiment in post_experiments])
+
+            # Continue a randomized queue after the submitted page, so
+            # any experiments left unscored on it are skipped
+            get = request.GET.copy()
+            if request.POST.get('queue_cursor'):
+                get['queue_cursor'] = request.POST['queue_cursor']
 
-            url = build_url('score_experiment_wells_url', get=request.GET)
+            url = build_url('score_experiment_wells_url', get=get)
             return HttpResponseRedirect(url)
 
     # Bind filter form with GET params
@@ -395,7 +407,8 @@ def score_experiment_wells(request):
         })
 
     # At this point, filter form is valid and cleaned
-    filter_data = filter_form.process()
+    filter_data = filter_form.process(
+        queue_cursor=request.GET.get('queue_cursor'))
     experiments = filter_data['experiments']
     unscored_by_user = filter_data['unscored_by_user']
 
@@ -421,12 +434,21 @@ def score_experiment_wells(request):
             experiment.score_form = score_form(prefix=experiment.pk)
 
 
+    # Randomized scoring only loads the experiments on this page, so
+    # the number to score comes from the scoring queue
+    num_to_score = filter_data['num_to_score']
+    if num_to_score is None:
+        num_to_score = experiments.count()
+
     context = {
         'experiments': experiments,
+        'num_to_score': num_to_score,
+        'next_queue_cursor': filter_data['next_queue_cursor'],
         'display_experiments': display_experiments,
         'unscored_by_user': filter_data['unscored_by_user'],
         # 'do_not_display': ['images_per_page', 'score_form_key', 'is_junk']
-        'do_not_display': ['images_per_page', 'score_form_key']
+        'do_not_display': ['images_per_page', 'score_form_key',
+                           'queue_cursor']
     }
 
     return render(request, 'score_experiment_wells.html', context)
@@ -1,7 +1,8 @@
 import os
 
 from django.conf import settings
-from django.shortcuts import render, get_object_or_404
+from django.http import Http404
+from django.shortcuts import render
 
 from experiments.models import Experiment
 from utils.pagination import get_paginated
@@ -21,22 +22,40 @@ def image_categories(request):
 
 
 def image_category(request, category):
-    tuples = []
-
     f = open(settings.BASE_DIR_IMAGE_CATEGORIES + '/' + category, 'r')
 
     rows = f.readlines()
 
+    f.close()
+
+    plates_and_tiles = []
+
     for row in rows:
         experiment_plate_id, tile = row.split('_')
         tile = tile.split('.')[0]
-        well = tile_to_well(tile)
-        experiment = get_object_or_404(Experiment,
-                                       plate=experiment_plate_id,
-                                       well=well)
-        tuples.append((experiment, tile))
+        plates_and_tiles.append((int(experiment_plate_id), tile))
 
-    f.close()
+    # Get all experiments in one query, with their image availability
+    # (shown with each image)
+    experiments = {}
+
+    for experiment in (Experiment.objects
+                       .filter(plate_id__in=set(
+                           plate for plate, tile in plates_and_tiles))
+                       .select_related('imageavailability')):
+        experiments[(experiment.plate_id, experiment.well)] = experiment
+
+    tuples = []
+
+    for experiment_plate_id, tile in plates_and_tiles:
+        try:
+            experiment = experiments[(experiment_plate_id,
+                                      tile_to_well(tile))]
+        except KeyError:
+            raise Http404('No experiment for {}_{}'.format(
+                experiment_plate_id, tile))
+
+        tuples.append((experiment, tile))
 
     display_tuples = get_paginated(request, tuples, IMAGES_PER_PAGE)
 
@@ -6,8 +6,8 @@ from django.shortcuts import redirect, render, get_object_or_404
 from clones.models import Clone
 from experiments.forms import (
     DoubleKnockdownForm, MutantKnockdownForm, RNAiKnockdownForm)
+from experiments.helpers.knockdown import get_double_knockdown_data
 from experiments.models import Experiment
-from library.models import LibraryStock
 from worms.models import WormStrain
 from utils.http import build_url
 
@@ -141,89 +141,9 @@ def double_knockdown(request, mutant, clones, temperature):
         }}
 
     """
-
-    data = OrderedDict()
-
-    n2 = WormStrain.get_n2()
-    l4440 = Clone.get_l4440()
     mutant = get_object_or_404(WormStrain, pk=mutant)
     clones = Clone.objects.filter(pk__in=clones.split(','))
-
-    for clone in clones:
-        data_per_clone = OrderedDict()
-
-        library_stocks = (LibraryStock.objects.filter(intended_clone=clone)
-                          .order_by('-plate__screen_stage', 'id'))
-
-        for library_stock in library_stocks:
-            data_per_well = OrderedDict()
-
-            dates = Experiment.get_distinct_dates({
-                'is_junk': False,
-                'worm_strain': mutant,
-                'library_stock': library_stock,
-                'plate__temperature': temperature,
-            })
-
-            for date in dates:
-                # Add double knockdowns
-                filters = {
-                    'is_junk': False,
-                    'plate__date': date,
-                    'worm_strain': mutant.pk,
-                    'library_stock': library_stock,
-                    'plate__temperature': temperature,
-                }
-                mutant_rnai = _create_inner_dictionary(
-                    filters, join_manual=True)
-
-                # Add mutant + L4440 controls
-                filters = {
-                    'is_junk': False,
-                    'plate__date': date,
-                    'worm_strain': mutant.pk,
-                    'library_stock__intended_clone': l4440,
-                    'plate__temperature': temperature,
-                }
-                mutant_l4440 = _create_inner_dictionary(filters)
-
-                # Add N2 + RNAi controls
-                filters = {
-                    'is_junk': False,
-                    'plate__date': date,
-                    'worm_strain': n2.pk,
-                    'library_stock': library_stock,
-                }
-
-                t = Experiment.get_closest_temperature(temperature, filters)
-                filters['plate__temperature'] = t
-
-                n2_rnai = _create_inner_dictionary(filters)
-
-                # Add N2 + L4440 controls
-                filters = {
-                    'is_junk': False,
-                    'plate__date': date,
-                    'worm_strain': n2.pk,
-                    'library_stock__intended_clone': l4440,
-                }
-
-                t = Experiment.get_closest_temperature(temperature, filters)
-                filters['plate__temperature'] = t
-
-                n2_l4440 = _create_inner_dictionary(filters)
-
-                data_per_well[date] = {
-                    'mutant_rnai': mutant_rnai,
-                    'mutant_l4440': mutant_l4440,
-                    'n2_rnai': n2_rnai,
-                    'n2_l4440': n2_l4440,
-                }
-
-            if data_per_well:
-                data_per_clone[library_stock] = data_per_well
-
-        data[clone] = data_per_clone
+    data = get_double_knockdown_data(mutant, clones, temperature)
 
     context = {
         'mutant': mutant,
@@ -235,20 +155,6 @@ def double_knockdown(request, mutant, clones, temperature):
     return render(request, 'double_knockdown.html', context)
 
 
-def _create_inner_dictionary(filters, join_devstar=True, join_manual=False):
-    experiments = Experiment.objects.filter(**filters).select_related('plate')
-    if join_devstar:
-        experiments = experiments.prefetch_related('devstarscore_set')
-
-    if join_manual:
-        experiments = experiments.prefetch_related('manualscore_set')
-
-    d = {}
-    d['experiments'] = experiments
-    d['link_to_all'] = build_url('find_experiment_wells_url', get=filters)
-    return d
-
-
 def find_double_knockdown(request):
     """Render the page to search for a double knockdown."""
     if request.method == 'POST':
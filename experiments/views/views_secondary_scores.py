@@ -5,10 +5,14 @@ from django.contrib.auth import get_user_model
 from django.http import Http404
 from django.shortcuts import render, redirect, get_object_or_404
 
+from clones.helpers.gene_cache import warm_gene_cache
+from clones.models import Clone
 from experiments.forms import SecondaryScoresForm, ScreenSummaryForm
 
-from experiments.helpers.scores import get_average_score_weight, calculate_average_scores
+from experiments.helpers.scores import get_summary_stats
+from experiments.models import ManualScoreSummary
 
+from website.templatetags.extra_tags import get_comma_separated_targets
 from worms.models import WormStrain
 
 from chartit import DataPool, Chart
@@ -61,44 +65,44 @@ def secondary_scores(request, worm, temperature, worm2=None, username=None):
     except Exception:
         raise Http404
 
+    if not screen_type:
+        raise Http404
+
     if username:
         user = get_object_or_404(get_user_model(), username=username)
-        data = worm.get_organized_scores(screen_type, screen_stage=2,
-                                         most_relevant_only=True,
-                                         scorer=user)
-        if worm2:
-            data2 = worm2.get_organized_scores(screen_type, screen_stage=2,
-                                         most_relevant_only=True,
-                                         scorer=user)
-
+        scorers = [user.pk]
     else:
-        data = worm.get_organized_scores(screen_type, screen_stage=2,
-                                         most_relevant_only=True,
-                                         scorer_id__in=IDS)
-        if worm2:
-            data2 = worm2.get_organized_scores(screen_type, screen_stage=2,
-                                         most_relevant_only=True,
-                                         scorer_id__in=IDS)
-
-    data_stats = calculate_average_scores(data)
-    if worm2:
-        data2_stats = calculate_average_scores(data2)
+        scorers = IDS
+
+    summaries = (ManualScoreSummary.get_summaries(worm, screen_type, 2,
+                                                  scorers=scorers)
+                 .select_related('library_stock',
+                                 'library_stock__intended_clone')
+                 .prefetch_related(Clone.prefetch_targets(
+                     'library_stock__intended_clone__clonetarget_set'))
+                 .order_by('-passes_stringent', '-passes_percent',
+                           '-passes_count', '-average_weight'))
 
-    data = OrderedDict(sorted(
-        data.iteritems(),
-        key=lambda x: (x[0].passes_stringent,
-                       x[0].passes_percent,
-                       x[0].passes_count,
-                       x[0].avg),
-        reverse=True))
+    data = OrderedDict((summary.library_stock, summary)
+                       for summary in summaries)
+
+    data_stats = get_summary_stats(data.values())
+
+    # Load the descriptions of all genes on the page in bulk, by the
+    # same strings the template looks them up by
+    warm_gene_cache(loci=set(
+        get_comma_separated_targets(stock.intended_clone, False)
+        for stock in data if stock.intended_clone))
 
     data2_scores = OrderedDict()
     if worm2:
-        for stock, expts in data.iteritems():
-            if stock in data2:
-                data2_scores[stock] = data2[stock]
-            else:
-                data2_scores[stock] = ""
+        summaries2 = ManualScoreSummary.get_summaries(
+            worm2, screen_type, 2, scorers=scorers)
+        summaries2 = {summary.library_stock_id: summary
+                      for summary in summaries2}
+
+        for stock in data:
+            data2_scores[stock] = summaries2.get(stock.pk, '')
 
     context = {
         'worm': worm,
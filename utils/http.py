@@ -1,5 +1,6 @@
 """Utility module with helpers for HTTP response querying."""
 
+import socket
 import urllib
 import urllib2
 from django.core.urlresolvers import reverse
@@ -16,6 +17,31 @@ def http_response_ok(url):
     return r.code == 200
 
 
+def http_head_ok(url, timeout=2):
+    """
+    Check if a url exists, using a HEAD request with a short timeout.
+
+    Returns True for an "ok" HTTP status, False if the url was not found,
+    and None if there was no definite answer (e.g. a timeout or a server
+    error).
+    """
+    request = urllib2.Request(url)
+    request.get_method = lambda: 'HEAD'
+
+    try:
+        r = urllib2.urlopen(request, timeout=timeout)
+
+    except urllib2.HTTPError as e:
+        if e.code in (404, 410):
+            return False
+        return None
+
+    except (urllib2.URLError, socket.error):
+        return None
+
+    return r.code == 200
+
+
 def build_url(*args, **kwargs):
     get = kwargs.pop('get', {})
     url = reverse(*args, **kwargs)
@@ -1,6 +1,17 @@
 """Utility module for help paginating results."""
 
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db import connections
+from django.db.models import Q
+from django.db.models.sql.datastructures import EmptyResultSet
+
+# Seconds to cache the number of rows in a paginated query
+COUNT_CACHE_SECONDS = 600
 
 
 def get_paginated(request, items, items_per_page):
@@ -18,3 +29,207 @@ def get_paginated(request, items, items_per_page):
         return paginator.page(1)
     except EmptyPage:
         return paginator.page(paginator.num_pages)
+
+
+def get_keyset_paginated(request, queryset, items_per_page, keys):
+    """
+    Paginate queryset by keyset, and return the page specified in
+    request.GET.
+
+    keys are the model fields to order by, which together must be
+    unique, e.g. ('plate', 'well') for Experiment. Instead of an OFFSET,
+    each page seeks past the last row of the previous page, so every page
+    costs the same regardless of how deep it is. The returned page has
+    the same interface as a Django Page, so it works with the pagination
+    templates.
+    """
+    paginator = KeysetPaginator(queryset, items_per_page, keys)
+    return paginator.page(request.GET.get('page'))
+
+
+def get_estimated_count(queryset, timeout=COUNT_CACHE_SECONDS):
+    """
+    Get the number of rows in queryset, possibly approximate.
+
+    For an unfiltered MySQL table, this uses the table statistics.
+    Otherwise, the count is cached for timeout seconds.
+    """
+    connection = connections[queryset.db]
+
+    if connection.vendor == 'mysql' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT TABLE_ROWS FROM information_schema.TABLES '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+
+        if row and row[0] is not None:
+            return row[0]
+
+    try:
+        sql = u'{} {}'.format(queryset.db, queryset.query)
+    except EmptyResultSet:
+        return 0
+
+    key = 'count-{}'.format(hashlib.sha1(sql.encode('utf-8')).hexdigest())
+    count = cache.get(key)
+
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+
+    return count
+
+
+class KeysetPaginator(object):
+    """
+    Paginator that seeks by the values of keys, rather than by offset.
+
+    Pages are identified by opaque cursors (see KeysetPage), rather than
+    by number. A plain page number is also accepted, and served with an
+    offset, so that existing links keep working.
+    """
+
+    def __init__(self, queryset, per_page, keys):
+        self.queryset = queryset.order_by(*keys)
+        self.per_page = per_page
+        self.keys = keys
+        self.attnames = [queryset.model._meta.get_field(key).attname
+                         for key in keys]
+        self._count = None
+
+    @property
+    def count(self):
+        if self._count is None:
+            self._count = get_estimated_count(self.queryset)
+        return self._count
+
+    @property
+    def num_pages(self):
+        return max(1, -(-self.count // self.per_page))
+
+    def page(self, cursor=None):
+        """Get the page for cursor, or the first page if invalid."""
+        try:
+            number, direction, values = _decode_cursor(cursor)
+        except ValueError:
+            try:
+                number = max(1, int(cursor))
+            except (TypeError, ValueError):
+                number = 1
+
+            offset = (number - 1) * self.per_page
+            rows = list(self.queryset[offset:offset + self.per_page + 1])
+
+            if not rows and number > 1:
+                return self.page(1)
+
+            return KeysetPage(self, rows[:self.per_page], number,
+                              len(rows) > self.per_page)
+
+        if direction == 'after':
+            rows = list(self.queryset.filter(
+                self._get_seek_condition(values, 'gt'))[:self.per_page + 1])
+
+            if not rows:
+                return self.page(1)
+
+            return KeysetPage(self, rows[:self.per_page], number,
+                              len(rows) > self.per_page)
+
+        else:
+            reverse = ['-' + key for key in self.keys]
+            rows = list(self.queryset.filter(
+                self._get_seek_condition(values, 'lt'))
+                .order_by(*reverse)[:self.per_page])
+
+            if not rows:
+                return self.page(1)
+
+            rows.reverse()
+            return KeysetPage(self, rows, number, True)
+
+    def _get_seek_condition(self, values, lookup):
+        """
+        Get the condition for rows after (lookup 'gt') or before ('lt')
+        the row with these key values.
+        """
+        condition = Q()
+
+        for i, attname in enumerate(self.attnames):
+            filters = dict(zip(self.attnames[:i], values[:i]))
+            filters['{}__{}'.format(attname, lookup)] = values[i]
+            condition |= Q(**filters)
+
+        return condition
+
+    def _get_values(self, row):
+        return [unicode(getattr(row, attname)) for attname in self.attnames]
+
+
+class KeysetPage(object):
+    """
+    A page from a KeysetPaginator.
+
+    Supports the parts of the Django Page interface used by the
+    templates. previous_page_number and next_page_number return cursors,
+    to be used as the page GET parameter.
+    """
+
+    def __init__(self, paginator, object_list, number, has_next):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.number = number
+        self._has_next = has_next
+
+    def __repr__(self):
+        return '<KeysetPage {}>'.format(self.number)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_previous(self):
+        return self.number > 1 and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def next_page_number(self):
+        values = self.paginator._get_values(self.object_list[-1])
+        return _encode_cursor(self.number + 1, 'after', values)
+
+    def previous_page_number(self):
+        values = self.paginator._get_values(self.object_list[0])
+        return _encode_cursor(self.number - 1, 'before', values)
+
+
+def _encode_cursor(number, direction, values):
+    return base64.urlsafe_b64encode(json.dumps([number, direction, values]))
+
+
+def _decode_cursor(cursor):
+    """
+    Get (number, direction, values) from a cursor.
+
+    Raises ValueError if cursor is not a valid cursor.
+    """
+    try:
+        number, direction, values = json.loads(
+            base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError, UnicodeEncodeError):
+        raise ValueError('Invalid cursor: {}'.format(cursor))
+
+    if direction not in ('after', 'before') or not isinstance(values, list):
+        raise ValueError('Invalid cursor: {}'.format(cursor))
+
+    return (max(1, int(number)), direction, values)
@@ -0,0 +1,126 @@
+"""
+Utility module to cache rarely-changing reference data.
+
+Reference data, such as the L4440 control clone, the N2 strain, and
+the manual score codes, is read in hot loops but almost never changes.
+get_reference caches a value for the life of the process, until one of
+the models it was built from is saved or deleted.
+
+Saves and deletes are caught with the post_save and post_delete
+signals, so they invalidate the cache immediately in the process that
+made them (e.g. a management command). Other processes are told via a
+generation number in the Django cache, which they check at most every
+CHECK_SECONDS. Note that QuerySet.update() and bulk_create() do not send
+these signals; call invalidate_references after using them on a
+reference table.
+
+The generation number only reaches other processes if the Django cache
+is shared between them (see CACHES in settings). Whether or not it is,
+values are reloaded once older than REFERENCE_CACHE_SECONDS, so changes
+made elsewhere are seen after at most that long.
+
+Values are shared between callers, so must not be modified.
+"""
+
+import threading
+import time
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+
+# Seconds between checks for invalidation by other processes
+CHECK_SECONDS = 5
+
+# Seconds before a cached value is reloaded from the database
+REFERENCE_CACHE_SECONDS = 300
+
+GENERATION_KEY = 'reference-cache-generation'
+
+# _values[key] = (value, time cached); _keys_by_model[model] = set of keys
+_values = {}
+_keys_by_model = {}
+_generation = None
+_last_check = 0
+_lock = threading.RLock()
+
+
+def get_reference(key, loader, models):
+    """
+    Get the cached value for key, calling loader() to get it if needed.
+
+    models are the model classes the value is built from. Saving or
+    deleting an instance of any of them invalidates the value.
+
+    If loader raises an exception (e.g. DoesNotExist), nothing is
+    cached.
+    """
+    _check_generation()
+
+    with _lock:
+        entry = _values.get(key)
+        if entry and time.time() - entry[1] <= REFERENCE_CACHE_SECONDS:
+            return entry[0]
+
+        value = loader()
+        _values[key] = (value, time.time())
+
+        for model in models:
+            if model not in _keys_by_model:
+                _keys_by_model[model] = set()
+                _connect(model)
+            _keys_by_model[model].add(key)
+
+        return value
+
+
+def invalidate_references(model=None):
+    """
+    Invalidate the cached values built from model, or all if None.
+
+    Other processes invalidate all their values.
+    """
+    global _generation
+
+    with _lock:
+        if model is None:
+            _values.clear()
+        else:
+            for key in _keys_by_model.get(model, ()):
+                _values.pop(key, None)
+
+        try:
+            _generation = cache.incr(GENERATION_KEY)
+        except ValueError:
+            _generation = 1
+            cache.set(GENERATION_KEY, _generation, None)
+
+
+def _connect(model):
+    dispatch_uid = 'reference-cache-{}'.format(model._meta.label)
+
+    post_save.connect(_invalidate_for_signal, sender=model,
+                      dispatch_uid=dispatch_uid)
+    post_delete.connect(_invalidate_for_signal, sender=model,
+                        dispatch_uid=dispatch_uid)
+
+
+def _invalidate_for_signal(sender, **kwargs):
+    invalidate_references(sender)
+
+
+def _check_generation():
+    """Clear the cache if another process has invalidated it."""
+    global _generation, _last_check
+
+    now = time.time()
+    if now - _last_check < CHECK_SECONDS:
+        return
+
+    generation = cache.get(GENERATION_KEY)
+
+    with _lock:
+        if generation != _generation:
+            _values.clear()
+            _generation = generation
+
+        _last_check = now
@@ -1,5 +1,7 @@
 """Utility module with SQL database querying helpers."""
 
+from django.db.models import Case, Value, When
+
 
 def get_field_dictionary(cursor, table, fieldnames):
     """
@@ -23,3 +25,31 @@ def get_field_dictionary(cursor, table, fieldnames):
         for k, v in zip(fieldnames[1:], row[1:]):
             d[pk][k] = v
     return d
+
+
+def bulk_update(model, changes, batch_size=1000):
+    """
+    Apply changes to many rows of model's table.
+
+    changes is a dictionary of {pk: {attname: value}}. Issues one
+    UPDATE per changed field per batch_size rows, rather than one per
+    row.
+    """
+    by_attname = {}
+    for pk, updates in changes.iteritems():
+        for attname, value in updates.iteritems():
+            by_attname.setdefault(attname, []).append((pk, value))
+
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+
+    for attname, pk_values in by_attname.iteritems():
+        field = fields[attname]
+
+        for i in range(0, len(pk_values), batch_size):
+            batch = pk_values[i:i + batch_size]
+            pks = [pk for pk, value in batch]
+            case = Case(*[When(pk=pk, then=Value(value, output_field=field))
+                          for pk, value in batch],
+                        output_field=field)
+
+            model.objects.filter(pk__in=pks).update(**{field.name: case})
@@ -0,0 +1,92 @@
+from django.test import TestCase
+
+from experiments.models import Experiment, ExperimentPlate
+from library.models import LibraryPlate, LibraryStock
+from utils.pagination import KeysetPaginator, _encode_cursor
+from worms.models import WormStrain
+
+
+class KeysetPaginatorTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        worm = WormStrain.objects.create(id='N2')
+        library_plate = LibraryPlate.objects.create(
+            id='I-1-A1', number_of_wells=96, screen_stage=2)
+        stock = LibraryStock.objects.create(
+            id='I-1-A1_A01', plate=library_plate, well='A01')
+
+        # Plate 10 sorts after plate 2 numerically, but not as text
+        for plate_id in (1, 2, 10):
+            plate = ExperimentPlate.objects.create(
+                id=plate_id, screen_stage=2, temperature=22.5,
+                date='2015-09-25')
+            for well in ('B01', 'A01', 'A02'):
+                Experiment.objects.create(
+                    id='{}_{}'.format(plate_id, well), plate=plate,
+                    well=well, worm_strain=worm, library_stock=stock)
+
+        cls.order = ['1_A01', '1_A02', '1_B01', '2_A01', '2_A02', '2_B01',
+                     '10_A01', '10_A02', '10_B01']
+
+    def setUp(self):
+        self.paginator = KeysetPaginator(Experiment.objects.all(), 2,
+                                         ('plate', 'well'))
+
+    def get_ids(self, page):
+        return [experiment.id for experiment in page]
+
+    def get_pages_forward(self):
+        pages = [self.paginator.page()]
+        while pages[-1].has_next():
+            pages.append(self.paginator.page(pages[-1].next_page_number()))
+        return pages
+
+    def assert_first_page(self, page):
+        self.assertEqual(page.number, 1)
+        self.assertEqual(self.get_ids(page), self.order[:2])
+        self.assertFalse(page.has_previous())
+
+    def test_forward(self):
+        pages = self.get_pages_forward()
+
+        self.assertEqual([page.number for page in pages], [1, 2, 3, 4, 5])
+        self.assertEqual([self.get_ids(page) for page in pages],
+                         [self.order[i:i + 2] for i in range(0, 9, 2)])
+        self.assertEqual(self.paginator.num_pages, 5)
+
+    def test_backward(self):
+        pages = [self.get_pages_forward()[-1]]
+        while pages[-1].has_previous():
+            pages.append(self.paginator.page(
+                pages[-1].previous_page_number()))
+
+        self.assertEqual([page.number for page in pages], [5, 4, 3, 2, 1])
+        self.assertEqual([self.get_ids(page) for page in reversed(pages)],
+                         [self.order[i:i + 2] for i in range(0, 9, 2)])
+
+    def test_page_number(self):
+        page = self.paginator.page('3')
+        self.assertEqual(page.number, 3)
+        self.assertEqual(self.get_ids(page), self.order[4:6])
+
+        # Cursors continue from a numbered page
+        page = self.paginator.page(page.next_page_number())
+        self.assertEqual(page.number, 4)
+        self.assertEqual(self.get_ids(page), self.order[6:8])
+
+    def test_page_number_out_of_range(self):
+        self.assert_first_page(self.paginator.page('99'))
+        self.assert_first_page(self.paginator.page('-1'))
+
+    def test_invalid_cursor(self):
+        self.assert_first_page(self.paginator.page(None))
+        self.assert_first_page(self.paginator.page('not-a-cursor'))
+        self.assert_first_page(self.paginator.page(
+            _encode_cursor(2, 'sideways', ['1', 'A02'])))
+
+    def test_stale_cursor(self):
+        # Seeking past the last row, or before the first
+        self.assert_first_page(self.paginator.page(
+            _encode_cursor(6, 'after', ['10', 'B01'])))
+        self.assert_first_page(self.paginator.page(
+            _encode_cursor(2, 'before', ['1', 'A01'])))
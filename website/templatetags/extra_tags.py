@@ -1,8 +1,9 @@
 from django import template
-from django.utils.timezone import localtime
 
 from utils.well_tile_conversion import well_to_tile
-from clones.models import Gene
+from clones.helpers.gene_cache import get_gene_by_locus
+from experiments.helpers.score_summaries import (summarize_devstar_scores,
+                                                 summarize_manual_scores)
 
 register = template.Library()
 
@@ -139,6 +140,17 @@ def get_image_url(experiment, mode=None):
     return experiment.get_image_url(mode=mode)
 
 
+@register.filter
+def is_image_missing(experiment, mode=None):
+    """
+    Check if an experiment's image is known to be missing.
+
+    Only consults the image availability index; unknown images are
+    not considered missing.
+    """
+    return experiment.is_image_available(mode=mode, probe=False) is False
+
+
 @register.filter
 def get_tile(well):
     """Get the tile, e.g. Tile000094, corresponding to well."""
@@ -148,55 +160,27 @@ def get_tile(well):
 @register.filter
 def get_manual_score_summary(experiment):
     """
-    Get a string summarizing the scores for this experiment.
+    Get a string summarizing the manual scores for this experiment.
 
-    Groups such that scores by different scorers, and scores made at
-    different timepoints, can be distinguished.
+    Uses the summary attached by attach_score_summaries, if any.
     """
-    scores = experiment.get_manual_scores()
-    d = {}
-    for score in scores:
-        scorer = score.scorer
-        timestamp = localtime(score.timestamp)
-        if scorer not in d:
-            d[scorer] = {}
-        if timestamp not in d[scorer]:
-            d[scorer][timestamp] = []
-        d[scorer][timestamp].append(score.score_code.short_description)
-
-    people = []
-    for s in d:
-        output = '{}:'.format(s.get_short_name())
-        for t in d[s]:
-            t_string = t.strftime('%Y-%m-%d %H:%M')
-            joined = ', '.join(str(item) for item in d[s][t])
-            output += ' {} ({})'.format(joined, t_string)
-        people.append(output)
-
-    return '; '.join(str(item) for item in people)
+    try:
+        return experiment.manual_score_summary
+    except AttributeError:
+        return summarize_manual_scores(experiment.get_manual_scores())
 
 
 @register.filter
 def get_devstar_score_summary(experiment):
-    """Get a string summarizing the DevStaR score for this experiment."""
-    scores = experiment.get_devstar_scores()
-
-    output = []
-
-    for score in scores:
-        o = '{} adults, {} larvae, {} embryos'.format(
-            score.count_adult, score.count_larva, score.count_embryo)
-
-        if isinstance(score.survival, float):
-            o += ', {:.2f} survival'.format(score.survival)
-        else:
-            o += ', {} survival'.format(score.survival)
-
-        if score.is_bacteria_present:
-            o += ', bacteria detected'
-        output.append(o)
+    """
+    Get a string summarizing the DevStaR score for this experiment.
 
-    return '; '.join(str(item) for item in output)
+    Uses the summary attached by attach_score_summaries, if any.
+    """
+    try:
+        return experiment.devstar_score_summary
+    except AttributeError:
+        return summarize_devstar_scores(experiment.get_devstar_scores())
 
 @register.filter
 def get_dict_item(dictionary, key):
@@ -204,19 +188,23 @@ def get_dict_item(dictionary, key):
 
 @register.filter
 def get_gene_desc(gene_id):
-    try:
-        desc = Gene.objects.get(locus=gene_id).functional_description
-    except Gene.DoesNotExist:
-        desc = 'NA'
-    return desc
+    """
+    Get the functional description of the gene with this locus.
+
+    Uses the gene cache, which views can warm with warm_gene_cache.
+    """
+    gene = get_gene_by_locus(gene_id)
+    return gene.functional_description if gene else 'NA'
 
 @register.filter
 def get_gene_class_desc(gene_id):
-    try:
-        desc = Gene.objects.get(locus=gene_id).gene_class_description
-    except Gene.DoesNotExist:
-        desc = 'NA'
-    return desc
+    """
+    Get the gene class description of the gene with this locus.
+
+    Uses the gene cache, which views can warm with warm_gene_cache.
+    """
+    gene = get_gene_by_locus(gene_id)
+    return gene.gene_class_description if gene else 'NA'
 
 # @register.filter
 # def keyvalue(dict, key):
@@ -3,6 +3,7 @@ from decimal import Decimal
 from django.db import models
 
 from library.models import LibraryStock
+from utils.reference_cache import get_reference
 
 
 class WormStrain(models.Model):
@@ -92,19 +93,12 @@ class WormStrain(models.Model):
         else:
             return None
 
-    def get_organized_scores(self, screen_type, screen_stage,
-                             most_relevant_only=False, **filters):
+    def get_scores(self, screen_type, screen_stage, **filters):
         """
-        Get all scores for this worm in a particular screen.
+        Get a queryset of all scores for this worm in a particular screen.
 
         The screen is defined by both screen_type ('ENH' or 'SUP')
         and screen_stage (1 for primary, 2 for secondary).
-
-        The data returned is organized as:
-            data[library_stock][experiment] = [scores]
-
-        Or, if most_relevant_only is set to True:
-            data[library_stock][experiment] = most_relevant_score
         """
         # Import here to avoid creating a circular dependency
         from experiments.models import ManualScore
@@ -122,6 +116,24 @@ class WormStrain(models.Model):
             scores = scores.filter(
                 experiment__plate__temperature=self.restrictive_temperature)
 
+        return scores
+
+    def get_organized_scores(self, screen_type, screen_stage,
+                             most_relevant_only=False, **filters):
+        """
+        Get all scores for this worm in a particular screen.
+
+        The screen is defined by both screen_type ('ENH' or 'SUP')
+        and screen_stage (1 for primary, 2 for secondary).
+
+        The data returned is organized as:
+            data[library_stock][experiment] = [scores]
+
+        Or, if most_relevant_only is set to True:
+            data[library_stock][experiment] = most_relevant_score
+        """
+        scores = self.get_scores(screen_type, screen_stage, **filters)
+
         # _set returns a queryset for a foreignkey
         # i.e. clone_target_id points to clone
         # so _set can grab the clone targets from clon
@@ -142,13 +154,55 @@ class WormStrain(models.Model):
         from experiments.helpers.scores import organize_manual_scores
         return organize_manual_scores(scores, most_relevant_only)
 
+    def get_compact_scores(self, screen_type, screen_stage,
+                           most_relevant_only=False, **filters):
+        """
+        Get all scores for this worm in a particular screen, as ids.
+
+        Like get_organized_scores, but without fetching any related
+        objects. The data returned is organized as:
+            data[library_stock_id][experiment_id] = [compact_scores]
+
+        Or, if most_relevant_only is set to True:
+            data[library_stock_id][experiment_id] = most_relevant_score
+
+        See experiments.helpers.compact_scores.
+        """
+        scores = (self.get_scores(screen_type, screen_stage, **filters)
+                  .order_by('experiment'))
+
+        from experiments.helpers.compact_scores import (
+            get_compact_scores, organize_compact_scores)
+        return organize_compact_scores(get_compact_scores(scores),
+                                       most_relevant_only)
+
     def get_positives(self, screen_type, screen_stage, criteria, **kwargs):
         """
         Get stocks that meet criteria for this worm in a particular screen.
 
         The screen is defined by both screen_type ('ENH' or 'SUP')
         and screen_stage (1 for primary, 2 for secondary).
+
+        criteria is a function from experiments.helpers.criteria. Those
+        with a vectorized equivalent are evaluated for all stocks at once,
+        from compact scores.
         """
+        # Import here to avoid creating a circular dependency
+        from experiments.helpers.score_matrix import (
+            VECTORIZED_CRITERIA, get_passing_stocks)
+
+        if criteria in VECTORIZED_CRITERIA:
+            s = self.get_compact_scores(screen_type, screen_stage,
+                                        most_relevant_only=True)
+
+            if kwargs.get('singles') is not None:
+                kwargs['singles'] = [stock.pk for stock in kwargs['singles']]
+
+            pks = get_passing_stocks(s, VECTORIZED_CRITERIA[criteria],
+                                     **kwargs)
+            return set(LibraryStock.objects.filter(pk__in=pks)
+                       .select_related('plate', 'intended_clone'))
+
         s = self.get_organized_scores(screen_type, screen_stage,
                                       most_relevant_only=True)
 
@@ -206,8 +260,12 @@ class WormStrain(models.Model):
 
     @classmethod
     def get_n2(cls):
-        """Get the N2 control worm strain."""
-        return cls.objects.get(pk='N2')
+        """
+        Get the N2 control worm strain.
+
+        Cached (see utils.reference_cache), so do not modify it.
+        """
+        return get_reference('n2', lambda: cls.objects.get(pk='N2'), [cls])
 
     @classmethod
     def get_worms_for_screen_type(cls, screen_type):
@@ -265,6 +323,21 @@ class WormStrain(models.Model):
 
     @classmethod
     def get_worm_to_temperature_dictionary(cls, screen_type):
+        """
+        Get a dictionary from each worm strain to its screen_type
+        temperature.
+
+        Cached (see utils.reference_cache); the dictionary returned is
+        a copy, but the worm strains should not be modified.
+        """
+        to_temperature = get_reference(
+            ('worm-to-temperature', screen_type),
+            lambda: cls._build_worm_to_temperature_dictionary(screen_type),
+            [cls])
+        return dict(to_temperature)
+
+    @classmethod
+    def _build_worm_to_temperature_dictionary(cls, screen_type):
         worms = cls.objects.all()
         to_temperature = {}
 
@@ -1,5 +1,6 @@
 from worms.models import WormStrain
 from worms.tests.base import WormTestCase
+from utils import reference_cache
 from utils.http import http_response_ok
 
 
@@ -77,6 +78,41 @@ class WormModelsTestCase(WormTestCase):
         self.assertIsNone(n2.permissive_temperature)
         self.assertIsNone(n2.restrictive_temperature)
 
+    def test_get_n2_cached(self):
+        WormStrain.get_n2()
+        with self.assertNumQueries(0):
+            WormStrain.get_n2()
+
+        WormStrain.objects.filter(pk='N2').delete()
+        with self.assertRaises(WormStrain.DoesNotExist):
+            WormStrain.get_n2()
+
+    def test_get_n2_cache_expires(self):
+        WormStrain.get_n2()
+
+        # QuerySet.update sends no signals, like a change made by
+        # another process
+        WormStrain.objects.filter(pk='N2').update(genotype='changed')
+        self.assertNotEquals(WormStrain.get_n2().genotype, 'changed')
+
+        cache_seconds = reference_cache.REFERENCE_CACHE_SECONDS
+        reference_cache.REFERENCE_CACHE_SECONDS = -1
+        try:
+            self.assertEquals(WormStrain.get_n2().genotype, 'changed')
+        finally:
+            reference_cache.REFERENCE_CACHE_SECONDS = cache_seconds
+
+    def test_get_worm_to_temperature_dictionary(self):
+        n2, dnc1, glp1, emb8 = self.get_worms()
+        to_temperature = WormStrain.get_worm_to_temperature_dictionary('ENH')
+        self.assertEquals(to_temperature[emb8], 17.5)
+        self.assertIsNone(to_temperature[glp1])
+
+        emb8.permissive_temperature = 15
+        emb8.save()
+        to_temperature = WormStrain.get_worm_to_temperature_dictionary('ENH')
+        self.assertEquals(to_temperature[emb8], 15)
+
     def test_get_worm_and_temperature_from_search_term(self):
         n2, dnc1, glp1, emb8 = self.get_worms()
 